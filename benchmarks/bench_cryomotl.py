@@ -0,0 +1,771 @@
+"""Benchmarks for the :mod:`cryocat.cryomotl` module.
+
+Run all benchmarks with ``python benchmarks/bench_cryomotl.py`` or only selected ones by passing their names, e.g.
+``python benchmarks/bench_cryomotl.py update_coordinates --n_rows 100000``.
+"""
+
+import argparse
+import decimal
+import glob
+import multiprocessing
+import os
+import re
+import resource
+import tempfile
+import time
+import warnings
+
+import emfile
+import numpy as np
+import pandas as pd
+from scipy.spatial.transform import Rotation as rot
+
+from cryocat import cryomap
+from cryocat import cryomask
+from cryocat import cryomotl
+from cryocat import geom
+from cryocat import imod
+from cryocat import nnana
+from cryocat import starfileio
+from cryocat.cryomotl import EmMotl, H5Motl, Motl, RelionMotl
+
+
+def create_random_motl(n_rows, n_tomos=10, tomo_size=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    motl_df = pd.DataFrame(np.zeros((n_rows, len(Motl.motl_columns))), columns=Motl.motl_columns)
+    motl_df["score"] = rng.random(n_rows)
+    motl_df["subtomo_id"] = np.arange(1, n_rows + 1)
+    motl_df["tomo_id"] = np.sort(rng.integers(1, n_tomos + 1, n_rows))
+    motl_df["object_id"] = rng.integers(1, 20, n_rows)
+    motl_df[["x", "y", "z"]] = rng.random((n_rows, 3)) * tomo_size
+    motl_df[["shift_x", "shift_y", "shift_z"]] = rng.normal(0, 3, (n_rows, 3))
+    motl_df[["phi", "psi", "theta"]] = rng.random((n_rows, 3)) * 360 - 180
+    motl_df["class"] = 1
+
+    # same as motls loaded from em files
+    return Motl(motl_df.astype(float))
+
+
+def timeit(function, *args, repeat=1, **kwargs):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings), result
+
+
+def report(name, timings):
+    print(f"\n{name}")
+    base = timings[0][1]
+    for label, t in timings:
+        print(f"  {label:<30} {t:10.4f} s  (speed-up {base / t:8.1f}x)")
+
+
+def legacy_update_coordinates(motl):
+    def round_and_recenter(row):
+        new_row = row.copy()
+        shifted_x = row["x"] + row["shift_x"]
+        shifted_y = row["y"] + row["shift_y"]
+        shifted_z = row["z"] + row["shift_z"]
+        new_row["x"] = float(decimal.Decimal(shifted_x).to_integral_value(rounding=decimal.ROUND_HALF_UP))
+        new_row["y"] = float(decimal.Decimal(shifted_y).to_integral_value(rounding=decimal.ROUND_HALF_UP))
+        new_row["z"] = float(decimal.Decimal(shifted_z).to_integral_value(rounding=decimal.ROUND_HALF_UP))
+        new_row["shift_x"] = shifted_x - new_row["x"]
+        new_row["shift_y"] = shifted_y - new_row["y"]
+        new_row["shift_z"] = shifted_z - new_row["z"]
+        return new_row
+
+    motl.df = motl.df.apply(round_and_recenter, axis=1)
+
+
+def bench_update_coordinates(n_rows):
+    motl = create_random_motl(n_rows)
+    legacy_motl = Motl(motl.df.copy())
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        t_legacy, _ = timeit(legacy_update_coordinates, legacy_motl)
+        t_new, _ = timeit(motl.update_coordinates)
+
+    assert motl.df.equals(legacy_motl.df), "Vectorized update_coordinates differs from the legacy implementation."
+    report(f"update_coordinates ({n_rows} rows)", [("row-wise decimal", t_legacy), ("vectorized", t_new)])
+
+
+def bench_clean_by_distance(n_rows):
+    # brute force is quadratic per tomogram, keep the size reasonable
+    n_rows = min(n_rows, 100000)
+    motl = create_random_motl(n_rows, n_tomos=2, tomo_size=500)
+    kdtree_motl = Motl(motl.df.copy())
+
+    t_brute, _ = timeit(motl.clean_by_distance, 10, "tomo_id", method="brute_force")
+    t_kdtree, _ = timeit(kdtree_motl.clean_by_distance, 10, "tomo_id", method="kdtree")
+
+    assert motl.df.equals(kdtree_motl.df), "KDTree cleaning differs from the brute-force one."
+    report(f"clean_by_distance ({n_rows} rows)", [("brute_force", t_brute), ("kdtree", t_kdtree)])
+
+
+def get_peak_rss():
+    # in kB, ru_maxrss is inherited from the parent process on Linux, VmHWM is not
+    if os.path.isfile("/proc/self/status"):
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_nnana_pipeline(n_rows, load_mode):
+    if load_mode == "copy_on_write":
+        pd.set_option("mode.copy_on_write", True)
+
+    motl = create_random_motl(n_rows)
+    rss_start = get_peak_rss()
+
+    # each step loads the motl as the public functions of nnana, structure or cryomask do
+    loaded_motls = []
+    for _ in range(4):
+        step_motl = Motl.load(motl, share_data=(load_mode == "share_data"))
+        sub_motl = step_motl.get_motl_subset(1)
+        nnana.get_feature_nn_indices(sub_motl, sub_motl, nn_number=2)
+        loaded_motls.append(step_motl)
+
+    return rss_start, get_peak_rss()
+
+
+def bench_load_memory(n_rows):
+    timings = []
+    memory = []
+    for load_mode in ("deep", "share_data", "copy_on_write"):
+        # peak RSS is per process - each mode runs in a fresh one
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            start = time.perf_counter()
+            rss_start, rss_peak = pool.apply(run_nnana_pipeline, (n_rows, load_mode))
+            timings.append((load_mode, time.perf_counter() - start))
+        memory.append((load_mode, rss_peak - rss_start))
+
+    report(f"nnana pipeline with Motl.load ({n_rows} rows)", timings)
+    print("  peak RSS increase during the pipeline:")
+    for load_mode, rss in memory:
+        print(f"  {load_mode:<30} {rss / 1024:10.1f} MB")
+
+
+def bench_motl_io(n_rows):
+    motl = create_random_motl(n_rows)
+    # STAR files are written and parsed row-wise, keep the size reasonable
+    star_rows = min(n_rows, 200000)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        em_path = os.path.join(tmp_dir, "motl.em")
+        h5_path = os.path.join(tmp_dir, "motl.h5")
+        star_path = os.path.join(tmp_dir, "motl.star")
+
+        t_em_write, _ = timeit(motl.write_out, em_path)
+        t_h5_write, _ = timeit(motl.write_out, h5_path, motl_type="h5")
+        t_em_read, _ = timeit(Motl.load, em_path)
+        t_h5_read, h5_motl = timeit(Motl.load, h5_path, motl_type="h5")
+        t_h5_columns, _ = timeit(H5Motl.read_in, h5_path, columns=["tomo_id", "score"])
+        t_h5_rows, _ = timeit(H5Motl.read_in, h5_path, row_range=(0, n_rows // 100))
+
+        star_motl = Motl(motl.df.iloc[:star_rows])
+        t_star_write, _ = timeit(star_motl.write_out, star_path, motl_type="relion")
+        t_star_read, _ = timeit(starfileio.Starfile.read, star_path)
+
+    assert h5_motl.df.equals(motl.df), "Motl read from h5 differs from the original one."
+
+    report(
+        f"motl writing ({n_rows} rows, relion {star_rows} rows)",
+        [("em", t_em_write), ("h5", t_h5_write), ("relion", t_star_write)],
+    )
+    report(
+        f"motl reading ({n_rows} rows, relion {star_rows} rows)",
+        [
+            ("em", t_em_read),
+            ("h5", t_h5_read),
+            ("h5 two columns", t_h5_columns),
+            ("h5 1% of rows", t_h5_rows),
+            ("relion (star parsing only)", t_star_read),
+        ],
+    )
+
+
+def run_em_read(em_path, read_mode):
+    rss_start = get_peak_rss()
+
+    if read_mode == "emfile":
+        _, parsed_emfile = emfile.read(em_path)
+        motl_df = pd.DataFrame(data=parsed_emfile[0], dtype=float, columns=Motl.motl_columns)
+    else:
+        motl_df, _ = EmMotl.read_in(em_path, keep_float32=(read_mode == "float32"))
+
+    # touch all the data
+    motl_df.sum()
+
+    return rss_start, get_peak_rss()
+
+
+def bench_em_read_memory(n_rows):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        em_path = os.path.join(tmp_dir, "motl.em")
+        create_random_motl(n_rows).write_out(em_path)
+        file_size = os.path.getsize(em_path)
+
+        timings = []
+        memory = []
+        for read_mode in ("emfile", "blocks", "float32"):
+            # peak RSS is per process - each mode runs in a fresh one
+            with multiprocessing.get_context("spawn").Pool(1) as pool:
+                start = time.perf_counter()
+                rss_start, rss_peak = pool.apply(run_em_read, (em_path, read_mode))
+                timings.append((read_mode, time.perf_counter() - start))
+            memory.append((read_mode, rss_peak - rss_start))
+
+    report(f"EmMotl.read_in ({n_rows} rows, {file_size / 1024**2:.1f} MB file)", timings)
+    print("  peak RSS increase during reading:")
+    for read_mode, rss in memory:
+        print(f"  {read_mode:<30} {rss / 1024:10.1f} MB")
+
+
+def bench_compact(n_rows):
+    motl = create_random_motl(n_rows)
+    motl.df["class"] = motl.df["class"].astype(int)
+    compact_motl = Motl(motl.df.copy())
+
+    t_compact, _ = timeit(compact_motl.compact)
+
+    regular_memory = motl.df.memory_usage(deep=True).sum()
+    compact_memory = compact_motl.df.memory_usage(deep=True).sum()
+
+    t_regular, regular_subset = timeit(motl.get_motl_subset, [1, 2, 3])
+    t_compact_subset, compact_subset = timeit(compact_motl.get_motl_subset, [1, 2, 3])
+
+    # ids are exact, the rest is in single precision
+    for c in Motl.compact_int_columns:
+        assert np.array_equal(regular_subset.df[c], compact_subset.df[c])
+    assert np.allclose(regular_subset.get_coordinates(), compact_subset.get_coordinates(), rtol=1e-6, atol=1e-4)
+
+    report(
+        f"compact representation ({n_rows} rows)",
+        [("get_motl_subset", t_regular), ("compact get_motl_subset", t_compact_subset)],
+    )
+    print(f"  conversion to compact representation {t_compact:.4f} s")
+    print(f"  memory: {regular_memory / 1024**2:.1f} MB -> {compact_memory / 1024**2:.1f} MB")
+
+
+def legacy_split_in_asymmetric_subunits(motl, symmetry, xyz_shift):
+    # copy of the original implementation, symmetry given as "Cx" or "Dx"
+    nfold = int(symmetry[1:])
+    s_type = 1 if symmetry.lower().startswith("c") else 2
+
+    inplane_step = 360 / nfold
+
+    if s_type == 1:
+        n_subunits = nfold
+        phi_angles = np.arange(0, 360, int(inplane_step))
+        new_angles = np.zeros((n_subunits, 3))
+        new_angles[:, 0] = phi_angles
+    elif s_type == 2:
+        n_subunits = nfold * 2
+        in_plane_offset = int(inplane_step / 2)
+        new_angles = np.zeros((n_subunits, 3))
+        new_angles[0::2, 0] = np.arange(0, 360, int(inplane_step))
+        new_angles[1::2, 0] = np.arange(0 + in_plane_offset, 360 + in_plane_offset, int(inplane_step))
+        new_angles[1::2, 1] = 180
+
+        phi_angles = new_angles[:, 0].copy()
+
+    phi_angles = phi_angles.reshape(
+        n_subunits,
+    )
+
+    # make up vectors
+    starting_vector = np.array(xyz_shift)
+    rho = np.sqrt(starting_vector[0] ** 2 + starting_vector[1] ** 2)
+    the = np.arctan2(starting_vector[1], starting_vector[0])
+
+    rot_rho = np.full((n_subunits,), rho)
+    rep_the = np.full((n_subunits,), the) + np.deg2rad(phi_angles)
+    rep_z = np.full((n_subunits,), starting_vector[2])
+
+    if s_type == 2:
+        rep_z[1::2] *= -1
+
+    center_shift = np.zeros([rot_rho.shape[0], 3])
+    center_shift[:, 0] = rot_rho * np.cos(rep_the)
+    center_shift[:, 1] = rot_rho * np.sin(rep_the)
+    center_shift[:, 2] = rep_z
+
+    new_motl_df = pd.concat([motl.df] * n_subunits)
+
+    new_motl_df["geom5"] = new_motl_df["subtomo_id"]
+    new_motl_df = new_motl_df.sort_values(by="subtomo_id")
+    new_motl_df["geom2"] = np.tile(np.arange(1, n_subunits + 1).reshape(n_subunits, 1), (len(motl.df), 1))
+
+    euler_angles = new_motl_df[["phi", "theta", "psi"]]
+    rotations = rot.from_euler(seq="zxz", angles=euler_angles, degrees=True)
+    center_shift = np.tile(center_shift, (len(motl.df), 1))
+    new_angles = np.tile(new_angles, (len(motl.df), 1))
+    new_motl_df.loc[:, ["shift_x", "shift_y", "shift_z"]] = new_motl_df.loc[
+        :, ["shift_x", "shift_y", "shift_z"]
+    ] + rotations.apply(center_shift)
+
+    new_rotations = rotations * rot.from_euler(seq="zxz", angles=new_angles, degrees=True)
+    new_motl_df.loc[:, ["phi", "theta", "psi"]] = new_rotations.as_euler(seq="zxz", degrees=True)
+
+    new_motl_df["subtomo_id"] = np.arange(1, len(new_motl_df) + 1)
+    new_motl = Motl(new_motl_df)
+    new_motl.update_coordinates()
+    new_motl.df.reset_index(inplace=True, drop=True)
+    return new_motl
+
+
+def run_split_in_subunits(n_rows, split_mode, output_path):
+    motl = create_random_motl(n_rows)
+    rss_start = get_peak_rss()
+    start = time.perf_counter()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        if split_mode == "concat":
+            legacy_split_in_asymmetric_subunits(motl, "D8", [10, 5, 3])
+        elif split_mode == "preallocated":
+            motl.split_in_asymmetric_subunits("D8", [10, 5, 3])
+        else:
+            motl.split_in_asymmetric_subunits("D8", [10, 5, 3], output_path=output_path)
+
+    return time.perf_counter() - start, rss_start, get_peak_rss()
+
+
+def bench_split_in_subunits(n_rows):
+    # the concat version needs tens of GB for large inputs
+    n_rows = min(n_rows, 200000)
+    motl = create_random_motl(min(n_rows, 1000))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        legacy_motl = legacy_split_in_asymmetric_subunits(motl, "D8", [10, 5, 3])
+        new_motl = motl.split_in_asymmetric_subunits("D8", [10, 5, 3], chunk_rows=100)
+    assert new_motl.df.equals(legacy_motl.df), "Expansion by blocks differs from the legacy implementation."
+
+    timings = []
+    memory = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for split_mode in ("concat", "preallocated", "written by blocks"):
+            # peak RSS is per process - each mode runs in a fresh one
+            with multiprocessing.get_context("spawn").Pool(1) as pool:
+                t_split, rss_start, rss_peak = pool.apply(
+                    run_split_in_subunits, (n_rows, split_mode, os.path.join(tmp_dir, "subunits.em"))
+                )
+                timings.append((split_mode, t_split))
+            memory.append((split_mode, rss_peak - rss_start))
+
+    report(f"split_in_asymmetric_subunits D8 ({n_rows} rows, {n_rows * 16} subunits)", timings)
+    print("  peak RSS increase during the expansion:")
+    for split_mode, rss in memory:
+        print(f"  {split_mode:<30} {rss / 1024:10.1f} MB")
+
+
+def legacy_relative_angles(angles, c_coord):
+    w1 = geom.euler_angles_to_normals(angles[0, :]).reshape((3,))
+    w2 = c_coord[0, :] / np.linalg.norm(c_coord[0, :])
+    w3 = np.cross(w1, w2)
+    w_base_mat = np.asarray([w1, w2, w3 / np.linalg.norm(w3)]).T
+
+    v1 = geom.euler_angles_to_normals(angles)
+    rot_angles = np.zeros(angles.shape)
+    for i in range(1, angles.shape[0]):
+        v2 = c_coord[i, :] / np.linalg.norm(c_coord[i, :])
+        v3 = np.cross(v1[i, :], v2)
+        v_base_mat = np.asarray([v1[i, :], v2, v3 / np.linalg.norm(v3)])
+        rot_angles[i, :] = rot.from_matrix(np.matmul(w_base_mat, v_base_mat)).as_euler("zxz", degrees=True)
+
+    return rot_angles
+
+
+def bench_relative_position(n_rows):
+    # the row-wise loop needs about 0.25 ms per row
+    n_rows = min(n_rows, 200000)
+    motl = create_random_motl(2 * n_rows)
+    idx = np.arange(n_rows)
+    nn_idx = np.arange(n_rows, 2 * n_rows)
+
+    coord = motl.get_coordinates()
+    angles = motl.get_angles()[idx, :]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        t_legacy, legacy_angles = timeit(legacy_relative_angles, angles, coord[nn_idx, :] - coord[idx, :])
+        t_new, (new_motl, _) = timeit(motl.get_relative_position, idx, nn_idx)
+
+    assert np.allclose(new_motl.get_angles(), legacy_angles), "Batched frames differ from the row-wise ones."
+    report(f"get_relative_position ({n_rows} pairs)", [("row-wise frames", t_legacy), ("batched", t_new)])
+
+
+def legacy_tomo_rotations(motl, repeat):
+    for _ in range(repeat):
+        for t in motl.get_unique_values("tomo_id"):
+            rot.from_euler("zxz", motl.get_angles(t), degrees=True)
+
+
+def cached_tomo_rotations(motl, repeat):
+    for _ in range(repeat):
+        for t in motl.get_unique_values("tomo_id"):
+            motl.get_rotations(t)
+
+
+def bench_rotations(n_rows):
+    # analyses typically ask for the rotations of each tomogram several times
+    motl = create_random_motl(n_rows, n_tomos=100)
+
+    t_legacy, _ = timeit(legacy_tomo_rotations, motl, 5)
+    t_new, _ = timeit(cached_tomo_rotations, motl, 5)
+
+    report(f"rotations of 100 tomograms, 5 times ({n_rows} rows)", [("from_euler", t_legacy), ("cached", t_new)])
+
+
+def legacy_remove_out_of_bounds(motl, dims):
+    # one tomogram at a time, as the callers did before
+    coord = motl.get_coordinates()
+    kept_idx = []
+    for t, tomo_dim in zip(dims["tomo_id"], dims[["x", "y", "z"]].to_numpy()):
+        tomo_idx = np.flatnonzero(motl.df["tomo_id"].to_numpy() == t)
+        within_bounds = np.all(coord[tomo_idx, :] >= 0, axis=1) & np.all(coord[tomo_idx, :] < tomo_dim, axis=1)
+        kept_idx.append(tomo_idx[within_bounds])
+    motl.df = motl.df.iloc[np.sort(np.concatenate(kept_idx))].reset_index(drop=True)
+
+
+def bench_tomo_dimensions(n_rows):
+    n_tomos = 800
+    motl = create_random_motl(n_rows, n_tomos=n_tomos)
+    rng = np.random.default_rng(0)
+    dims = pd.DataFrame(
+        {
+            "tomo_id": np.arange(1, n_tomos + 1),
+            "x": rng.integers(800, 1000, n_tomos),
+            "y": rng.integers(800, 1000, n_tomos),
+            "z": rng.integers(800, 1000, n_tomos),
+        }
+    )
+    legacy_motl = Motl(motl.df.copy())
+    angles = rng.random((n_tomos, 3)) * 20
+
+    t_legacy, _ = timeit(legacy_remove_out_of_bounds, legacy_motl, dims)
+    t_new, _ = timeit(motl.remove_out_of_bounds_particles, dims)
+    t_rotation, _ = timeit(motl.apply_tomo_rotation, angles, tomo_dim=dims)
+
+    assert motl.df.equals(legacy_motl.df), "Joined bounds check differs from the per-tomogram one."
+    report(
+        f"remove_out_of_bounds_particles ({n_rows} rows, {n_tomos} tomograms)",
+        [("per tomogram", t_legacy), ("joined by tomo_id", t_new)],
+    )
+    print(f"  apply_tomo_rotation of all tomograms {t_rotation:.4f} s")
+
+
+def legacy_compare(motl, other_motl):
+    intersection = motl.df.merge(other_motl.df["subtomo_id"], how="inner")
+    difference = motl.df[~motl.df["subtomo_id"].isin(other_motl.df["subtomo_id"])]
+    merged = motl.df.merge(other_motl.df, on="subtomo_id", how="inner", suffixes=("", "_other"))
+    n_changed = {c: int((merged[c] != merged[c + "_other"]).sum()) for c in ["class", "score"]}
+
+    return intersection, difference, n_changed
+
+
+def indexed_compare(motl, other_motl):
+    comparison = motl.compare(other_motl)
+    n_changed = comparison.get_change_report(["class", "score"])["n_changed"].to_dict()
+
+    return comparison.intersection.df, comparison.difference.df, n_changed
+
+
+def bench_compare(n_rows):
+    motl = create_random_motl(n_rows)
+    rng = np.random.default_rng(1)
+    # previous iteration: 70 % of the particles survived, 10 % of them changed the class
+    other_df = motl.df.sample(frac=0.7, random_state=0)
+    other_df["class"] = np.where(rng.random(other_df.shape[0]) < 0.1, 2.0, 1.0)
+    other_motl = Motl(other_df.reset_index(drop=True))
+
+    t_legacy, legacy_result = timeit(legacy_compare, motl, other_motl)
+    t_new, new_result = timeit(indexed_compare, motl, other_motl)
+
+    assert legacy_result[0].equals(new_result[0]), "Intersections differ."
+    assert legacy_result[1].reset_index(drop=True).equals(new_result[1]), "Differences differ."
+    assert legacy_result[2] == new_result[2], "Change counts differ."
+    report(
+        f"compare two motls ({n_rows} rows, intersection, difference and changes)",
+        [("merge and isin", t_legacy), ("factorized matching", t_new)],
+    )
+
+
+def legacy_merge_and_renumber(motl_list):
+    merged_df = Motl.create_empty_motl_df()
+    feature_add = 0
+
+    for m in motl_list:
+        motl = Motl.load(m)
+        feature_min = min(motl.df.loc[:, "object_id"])
+
+        if feature_min <= feature_add:
+            motl.df["object_id"] = motl.df.loc[:, "object_id"] + (feature_add - feature_min + 1)
+
+        merged_df = pd.concat([merged_df, motl.df])
+        feature_add = max(motl.df.loc[:, "object_id"])
+
+    merged_motl = Motl(merged_df)
+    merged_motl.renumber_particles()
+    merged_motl.df.reset_index(inplace=True, drop=True)
+
+    return merged_motl
+
+
+def bench_merge_and_renumber(n_rows):
+    n_motls = 1000
+    motl = create_random_motl(n_rows, n_tomos=n_motls)
+    motls = motl.split_by_feature("tomo_id")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, m in enumerate(motls):
+            m.write_out(os.path.join(tmp_dir, f"tomo_{i:04d}_tm.em"))
+        paths = sorted(glob.glob(os.path.join(tmp_dir, "*_tm.em")))
+
+        t_legacy, legacy_motl = timeit(legacy_merge_and_renumber, paths)
+        t_new, new_motl = timeit(Motl.merge_and_renumber, paths)
+        t_threads, threads_motl = timeit(Motl.merge_and_renumber, os.path.join(tmp_dir, "*_tm.em"), n_workers=8)
+    t_legacy_motls, legacy_motls_motl = timeit(legacy_merge_and_renumber, motls)
+    t_motls, motls_motl = timeit(Motl.merge_and_renumber, motls)
+
+    for m, legacy_m in [(new_motl, legacy_motl), (threads_motl, legacy_motl), (motls_motl, legacy_motls_motl)]:
+        assert m.df.equals(legacy_m.df), "Bulk merge differs from the per-motl one."
+    report(
+        f"merge_and_renumber of {len(paths)} em files ({n_rows} rows)",
+        [("per motl concat", t_legacy), ("preallocated", t_new), ("preallocated, 8 threads", t_threads)],
+    )
+    report(
+        f"merge_and_renumber of {len(motls)} Motl instances ({n_rows} rows)",
+        [("per motl concat", t_legacy_motls), ("preallocated", t_motls)],
+    )
+
+
+def legacy_parse_relion_ids(tomo_names, particle_names):
+    # Relion 4.0 rlnTomoName and rlnTomoParticleName
+    tomo_idx = [float(re.search(r"\d+", i.rsplit("/", 1)[-1]).group()) for i in tomo_names.tolist()]
+    subtomo_idx = [float(i.rsplit("/", 1)[-1]) for i in particle_names.tolist()]
+
+    return np.array(tomo_idx), np.array(subtomo_idx)
+
+
+def parse_relion_ids(tomo_names, particle_names):
+    tomo_idx = RelionMotl.parse_numbers(tomo_names, RelionMotl.first_number_pattern)
+    subtomo_idx = RelionMotl.parse_numbers(particle_names, cache=False)
+
+    return tomo_idx, subtomo_idx
+
+
+def bench_relion_ids(n_rows):
+    motl = create_random_motl(n_rows, n_tomos=200)
+    tomo_names = pd.Series([f"TS_{int(t):03d}" for t in motl.df["tomo_id"]])
+    particle_names = tomo_names + "/" + motl.df["subtomo_id"].astype(int).astype(str)
+
+    t_legacy, legacy_ids = timeit(legacy_parse_relion_ids, tomo_names, particle_names)
+    t_new, new_ids = timeit(parse_relion_ids, tomo_names, particle_names)
+
+    assert all(np.array_equal(a, b) for a, b in zip(legacy_ids, new_ids)), "Parsed ids differ."
+    report(
+        f"parse Relion 4.0 tomo and subtomo ids ({n_rows} rows, 200 tomograms)",
+        [("per row", t_legacy), ("per unique name", t_new)],
+    )
+
+
+def run_star_filter(star_path, read_mode):
+    rss_start = get_peak_rss()
+    start = time.perf_counter()
+
+    # keeps the particles with high score, as in cleaning of a template matching list
+    if read_mode == "load":
+        motl = Motl.load(star_path, motl_type="stopgap")
+        n_kept = int((motl.df["score"] > 0.9).sum())
+    else:
+        n_kept = 0
+        for motl_chunk in Motl.iter_load(star_path, motl_type="stopgap", chunk_rows=100000):
+            n_kept += int((motl_chunk.df["score"] > 0.9).sum())
+
+    return n_kept, time.perf_counter() - start, get_peak_rss() - rss_start
+
+
+def bench_iter_load(n_rows):
+    motl = create_random_motl(n_rows)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        star_path = os.path.join(tmp_dir, "particles.star")
+        motl.write_out(star_path, motl_type="stopgap")
+        del motl
+
+        results = {}
+        for read_mode in ("load", "iter_load"):
+            # peak RSS is per process - each mode runs in a fresh one
+            with multiprocessing.get_context("spawn").Pool(1) as pool:
+                results[read_mode] = pool.apply(run_star_filter, (star_path, read_mode))
+
+    assert results["load"][0] == results["iter_load"][0], "Filtered particles differ."
+    report(
+        f"filter stopgap starfile ({n_rows} rows)",
+        [(read_mode, result[1]) for read_mode, result in results.items()],
+    )
+    print("  peak RSS increase:")
+    for read_mode, result in results.items():
+        print(f"  {read_mode:<30} {result[2] / 1024:10.1f} MB")
+
+
+def bench_convert_motls(n_rows):
+    n_motls = 200
+    motl = create_random_motl(n_rows, n_tomos=n_motls)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_paths = []
+        for i, tomo_motl in enumerate(motl.split_by_feature("tomo_id")):
+            input_paths.append(os.path.join(tmp_dir, f"tomo_{i:04d}_tm.em"))
+            tomo_motl.write_out(input_paths[-1])
+
+        def convert_one_by_one():
+            for input_path in input_paths:
+                output_path = input_path.replace("_tm.em", "_loop.star")
+                cryomotl.emmotl2stopgap(input_path, output_motl_path=output_path)
+
+        output_pattern = os.path.join(tmp_dir, "{stem}_{n_workers}.star")
+        timings = [("one by one", timeit(convert_one_by_one)[0])]
+        n_workers_list = (1, os.cpu_count() or 1)
+        for n_workers in sorted(set(n_workers_list)):
+            t, results = timeit(
+                cryomotl.convert_motls,
+                input_paths,
+                "stopgap",
+                output_pattern.replace("{n_workers}", str(n_workers)),
+                n_workers=n_workers,
+            )
+            assert (results["status"] == "converted").all(), "Some of the files were not converted."
+            timings.append((f"convert_motls, {n_workers} processes", t))
+
+        t_skip, results = timeit(
+            cryomotl.convert_motls, input_paths, "stopgap", output_pattern.replace("{n_workers}", "1")
+        )
+        assert (results["status"] == "skipped").all(), "Up-to-date files were converted again."
+
+    report(f"convert {n_motls} em files to stopgap ({n_rows} rows)", timings)
+    print(f"  second run with up-to-date outputs {t_skip:.4f} s")
+
+
+def legacy_write_model_binary(df, filename):
+    with open(filename, "wb") as file:
+        file.write(b"IMODV1.2")
+        file.write(imod.ModelHeader(objsize=df["object_id"].nunique()).to_bytes())
+        for obj_id in df["object_id"].unique():
+            object_df = df[df["object_id"] == obj_id]
+            file.write(imod.ObjectHeader(contsize=object_df["contour_id"].nunique()).to_bytes())
+            for contour_id, contour_data in object_df.groupby("contour_id"):
+                file.write(imod.ContourHeader(psize=len(contour_data)).to_bytes())
+                file.write(contour_data[["x", "y", "z"]].values.astype(">f4").tobytes())
+        file.write(b"IEOF")
+
+
+def bench_model_file(n_rows):
+    motl = create_random_motl(n_rows)
+    # traced filaments: ~10 points per contour, spread over the objects
+    model_df = pd.DataFrame(motl.get_coordinates(), columns=["x", "y", "z"])
+    model_df["object_id"] = motl.df["object_id"].to_numpy()
+    model_df["contour_id"] = np.arange(n_rows) // 10
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_path = os.path.join(tmp_dir, "legacy.mod")
+        new_path = os.path.join(tmp_dir, "new.mod")
+        t_legacy, _ = timeit(legacy_write_model_binary, model_df, legacy_path)
+        t_new, _ = timeit(imod.write_model_binary, model_df, new_path, repeat=3)
+
+        with open(legacy_path, "rb") as legacy_file, open(new_path, "rb") as new_file:
+            assert legacy_file.read() == new_file.read(), "Model files differ."
+
+    report(
+        f"write IMOD model ({n_rows} points, {model_df['contour_id'].nunique()} contours)",
+        [("per object and contour", t_legacy), ("single buffer", t_new)],
+    )
+
+
+def legacy_recenter_to_subparticle(motl, mask_path):
+    def shift_coords(row):
+        euler_angles = np.array([[row["phi"], row["theta"], row["psi"]]])
+        rshifts = rot.from_euler(seq="zxz", angles=euler_angles, degrees=True).apply(shifts)
+        row["shift_x"] = row["shift_x"] + rshifts[0][0]
+        row["shift_y"] = row["shift_y"] + rshifts[0][1]
+        row["shift_z"] = row["shift_z"] + rshifts[0][2]
+        return row
+
+    mask = cryomap.read(mask_path)
+    shifts = cryomask.get_mass_center(mask) - np.array(mask.shape) / 2
+    new_motl = Motl(motl.df.apply(shift_coords, axis=1).reset_index(drop=True))
+    new_motl.update_coordinates()
+    return new_motl
+
+
+def bench_recenter_to_subparticle(n_rows):
+    motl = create_random_motl(n_rows)
+    mask_centers = [[32, 32, 50], [32, 32, 14]]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # NPC entry and exit masks, written out as in the previous version of cluster_subunits_to_rings
+        def recenter_one_by_one():
+            recentered_motls = []
+            for i, center in enumerate(mask_centers):
+                mask_path = os.path.join(tmp_dir, f"mask_{i}.em")
+                cryomask.spherical_mask(64, 3, center=center, output_name=mask_path)
+                recentered_motls.append(legacy_recenter_to_subparticle(Motl(motl.df.copy()), mask_path))
+            return recentered_motls
+
+        def recenter_batch():
+            masks = [cryomask.spherical_mask(64, 3, center=center) for center in mask_centers]
+            return Motl.recenter_to_subparticle(Motl(motl.df.copy()), masks)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            t_legacy, legacy_motls = timeit(recenter_one_by_one)
+            t_new, new_motls = timeit(recenter_batch, repeat=3)
+
+    for legacy_motl, new_motl in zip(legacy_motls, new_motls):
+        assert np.allclose(legacy_motl.df.to_numpy(), new_motl.df.to_numpy()), "Recentered motls differ."
+    report(
+        f"recenter to {len(mask_centers)} subparticles ({n_rows} rows)",
+        [("per mask and row", t_legacy), ("batched", t_new)],
+    )
+
+
+benchmarks = {
+    "update_coordinates": bench_update_coordinates,
+    "clean_by_distance": bench_clean_by_distance,
+    "load_memory": bench_load_memory,
+    "motl_io": bench_motl_io,
+    "em_read_memory": bench_em_read_memory,
+    "compact": bench_compact,
+    "split_in_subunits": bench_split_in_subunits,
+    "relative_position": bench_relative_position,
+    "rotations": bench_rotations,
+    "tomo_dimensions": bench_tomo_dimensions,
+    "compare": bench_compare,
+    "merge_and_renumber": bench_merge_and_renumber,
+    "relion_ids": bench_relion_ids,
+    "iter_load": bench_iter_load,
+    "convert_motls": bench_convert_motls,
+    "model_file": bench_model_file,
+    "recenter_to_subparticle": bench_recenter_to_subparticle,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for cryocat.cryomotl")
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run: {', '.join(benchmarks)}. Defaults to all.")
+    parser.add_argument("--n_rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    for name in args.names or benchmarks.keys():
+        benchmarks[name](args.n_rows)
+
+
+if __name__ == "__main__":
+    main()
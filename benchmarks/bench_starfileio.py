@@ -0,0 +1,216 @@
+"""Benchmarks for the :mod:`cryocat.starfileio` module.
+
+Run all benchmarks with ``python benchmarks/bench_starfileio.py`` or only selected ones by passing their names, e.g.
+``python benchmarks/bench_starfileio.py read --n_rows 100000``.
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from bench_cryomotl import get_peak_rss, report, timeit
+from cryocat.starfileio import Starfile
+
+
+def create_relion_frames(n_rows, n_tomos=50, seed=0):
+    rng = np.random.default_rng(seed)
+    optics_df = pd.DataFrame(
+        {
+            "rlnOpticsGroup": [1],
+            "rlnOpticsGroupName": ["opticsGroup1"],
+            "rlnVoltage": [300.0],
+            "rlnImagePixelSize": [1.35],
+        }
+    )
+    tomo_ids = np.sort(rng.integers(1, n_tomos + 1, n_rows))
+    particles_df = pd.DataFrame(
+        {
+            "rlnTomoName": [f"TS_{t:03d}" for t in tomo_ids],
+            "rlnTomoParticleName": [f"TS_{t:03d}/{i}" for i, t in enumerate(tomo_ids, 1)],
+            "rlnCoordinateX": rng.integers(0, 4000, n_rows).astype(float),
+            "rlnCoordinateY": rng.integers(0, 4000, n_rows).astype(float),
+            "rlnCoordinateZ": rng.integers(0, 1000, n_rows).astype(float),
+            "rlnOriginXAngst": rng.normal(0, 3, n_rows).round(6),
+            "rlnOriginYAngst": rng.normal(0, 3, n_rows).round(6),
+            "rlnOriginZAngst": rng.normal(0, 3, n_rows).round(6),
+            "rlnAngleRot": (rng.random(n_rows) * 360 - 180).round(6),
+            "rlnAngleTilt": (rng.random(n_rows) * 180).round(6),
+            "rlnAnglePsi": (rng.random(n_rows) * 360 - 180).round(6),
+            "rlnClassNumber": rng.integers(1, 4, n_rows),
+            "rlnOpticsGroup": np.ones(n_rows, dtype=int),
+            "rlnRandomSubset": rng.integers(1, 3, n_rows),
+        }
+    )
+
+    return [optics_df, particles_df], ["data_optics", "data_particles"]
+
+
+def bench_read(n_rows):
+    frames, specifiers = create_relion_frames(n_rows)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        star_path = os.path.join(tmp_dir, "particles.star")
+        Starfile.write(frames, star_path, specifiers=specifiers, comments=[["version 30001"], ["version 30001"]])
+
+        t_tokenizer, tokenizer_result = timeit(Starfile.read, star_path, engine="tokenizer")
+        t_fast, fast_result = timeit(Starfile.read, star_path, engine="fast", repeat=3)
+
+    assert tokenizer_result[1:] == fast_result[1:], "Specifiers or comments differ."
+    for tokenizer_frame, fast_frame in zip(tokenizer_result[0], fast_result[0]):
+        pd.testing.assert_frame_equal(tokenizer_frame, fast_frame)
+    report(
+        f"read Relion 4.0 starfile ({n_rows} rows)",
+        [("tokenizer", t_tokenizer), ("fast", t_fast)],
+    )
+
+
+def bench_read_block(n_rows):
+    frames, specifiers = create_relion_frames(n_rows)
+    columns = ["rlnCoordinateX", "rlnCoordinateY", "rlnCoordinateZ"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        star_path = os.path.join(tmp_dir, "particles.star")
+        Starfile.write(frames, star_path, specifiers=specifiers)
+
+        t_read, (all_frames, _, _) = timeit(Starfile.read, star_path)
+        t_index, _ = timeit(Starfile.get_index, star_path, repeat=3)
+        Starfile.get_index(star_path, cache=True)
+        t_cached, _ = timeit(Starfile.get_index, star_path, cache=True, repeat=3)
+        t_optics, (optics_df, _) = timeit(Starfile.read_block, star_path, "data_optics", cache_index=True, repeat=3)
+        t_particles, (particles_df, _) = timeit(Starfile.read_block, star_path, "data_particles", cache_index=True)
+        t_columns, (coord_df, _) = timeit(
+            Starfile.read_block, star_path, "data_particles", columns=columns, cache_index=True
+        )
+
+    pd.testing.assert_frame_equal(optics_df, all_frames[0])
+    pd.testing.assert_frame_equal(particles_df, all_frames[1])
+    pd.testing.assert_frame_equal(coord_df, all_frames[1][columns])
+    report(
+        f"read parts of Relion 4.0 starfile ({n_rows} rows)",
+        [
+            ("whole file", t_read),
+            ("data_particles", t_particles),
+            ("data_particles, 3 columns", t_columns),
+            ("data_optics", t_optics),
+        ],
+    )
+    print(f"  building the index {t_index:.4f} s, cached index {t_cached:.4f} s")
+
+
+def legacy_write(frames, path, specifiers, float_precision=6):
+    with open(path, "w") as file:
+        for frame, specifier in zip(frames, specifiers):
+            frame = frame.round(float_precision).applymap(lambda value: "{:<10}".format(str(value)))
+            file.write(f"\n{specifier}\n\n")
+            file.write("loop_\n")
+            for index, column in enumerate(frame.columns, 1):
+                file.write(f"_{column} #{index}\n")
+            for row in frame.itertuples(index=False):
+                file.write("\t".join(map(str, row)) + "\n")
+            file.write("\n")
+
+
+def bench_write(n_rows):
+    frames, specifiers = create_relion_frames(n_rows)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_path = os.path.join(tmp_dir, "legacy.star")
+        new_path = os.path.join(tmp_dir, "new.star")
+        t_legacy, _ = timeit(legacy_write, frames, legacy_path, specifiers)
+        t_new, _ = timeit(Starfile.write, frames, new_path, specifiers=specifiers)
+
+        with open(legacy_path, "r") as legacy_file, open(new_path, "r") as new_file:
+            assert legacy_file.read() == new_file.read(), "Written starfiles differ."
+
+    report(f"write Relion 4.0 starfile ({n_rows} rows)", [("cell by cell", t_legacy), ("column by column", t_new)])
+
+
+def run_tomo_filter(star_path, read_mode):
+    rss_start = get_peak_rss()
+    start = time.perf_counter()
+
+    # keeps the particles of a single tomogram, as when splitting a Relion starfile per tomogram
+    if read_mode == "read":
+        frames, specifiers, _ = Starfile.read(star_path)
+        particles_df = frames[specifiers.index("data_particles")]
+        n_kept = int((particles_df["rlnTomoName"] == "TS_001").sum())
+    else:
+        n_kept = 0
+        for chunk in Starfile.iter_read(star_path, "data_particles", chunk_rows=100000):
+            n_kept += int((chunk["rlnTomoName"] == "TS_001").sum())
+
+    return n_kept, time.perf_counter() - start, get_peak_rss() - rss_start
+
+
+def bench_iter_read(n_rows):
+    frames, specifiers = create_relion_frames(n_rows)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        star_path = os.path.join(tmp_dir, "particles.star")
+        Starfile.write(frames, star_path, specifiers=specifiers)
+        del frames
+
+        results = {}
+        for read_mode in ("read", "iter_read"):
+            # peak RSS is per process - each mode runs in a fresh one
+            with multiprocessing.get_context("spawn").Pool(1) as pool:
+                results[read_mode] = pool.apply(run_tomo_filter, (star_path, read_mode))
+
+    assert results["read"][0] == results["iter_read"][0], "Filtered particles differ."
+    report(
+        f"filter Relion 4.0 starfile by tomogram ({n_rows} rows)",
+        [(read_mode, result[1]) for read_mode, result in results.items()],
+    )
+    print("  peak RSS increase:")
+    for read_mode, result in results.items():
+        print(f"  {read_mode:<30} {result[2] / 1024:10.1f} MB")
+
+
+def bench_read_schema(n_rows):
+    frames, specifiers = create_relion_frames(n_rows)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        star_path = os.path.join(tmp_dir, "particles.star")
+        Starfile.write(frames, star_path, specifiers=specifiers)
+
+        t_inferred, (inferred_df, _) = timeit(Starfile.read_block, star_path, "data_particles", repeat=3)
+        t_schema, (schema_df, _) = timeit(Starfile.read_block, star_path, "data_particles", schema="relion4", repeat=3)
+
+    dtypes = Starfile.get_schema("relion4")
+    expected_df = inferred_df.astype({c: dtypes[c] for c in inferred_df.columns if c in dtypes})
+    pd.testing.assert_frame_equal(schema_df, expected_df)
+    report(
+        f"read data_particles of Relion 4.0 starfile ({n_rows} rows)",
+        [("inferred dtypes", t_inferred), ("relion4 schema", t_schema)],
+    )
+    print("  memory of the data frame:")
+    for label, frame in (("inferred dtypes", inferred_df), ("relion4 schema", schema_df)):
+        print(f"  {label:<30} {frame.memory_usage(deep=True).sum() / 1024**2:10.1f} MB")
+
+
+benchmarks = {
+    "read": bench_read,
+    "read_block": bench_read_block,
+    "write": bench_write,
+    "iter_read": bench_iter_read,
+    "read_schema": bench_read_schema,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for cryocat.starfileio")
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run: {', '.join(benchmarks)}. Defaults to all.")
+    parser.add_argument("--n_rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    for name in args.names or benchmarks.keys():
+        benchmarks[name](args.n_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 import argparse
+import glob
 import numpy as np
 import re
+import time
 from cryocat import wedgeutils
 from cryocat import tmana
+from cryocat import cryomotl
 from numpydoc.docscrape import NumpyDocString
 
 
@@ -229,3 +232,53 @@ def tm_ana():
         "Function to extract particles from template matching. For help on specific option run wedge_list option --help"
     )
     parse_arguments(f_dict, description=description)
+
+
+def motl_convert():
+    parser = argparse.ArgumentParser(
+        description="Function to convert many motl files between emmotl, relion and stopgap formats. The files with "
+        "an output newer than the input are skipped unless --overwrite is set."
+    )
+    parser.add_argument(
+        "input_motls", nargs="+", help="Paths to the motl files or glob patterns (quoted), e.g. 'tm/*_tm.em'."
+    )
+    parser.add_argument("--output_type", required=True, choices=["relion", "emmotl", "stopgap"])
+    parser.add_argument(
+        "--output_pattern",
+        required=True,
+        help="Pattern of the output paths with placeholders {stem}, {name} and {dir}, e.g. 'relion/{stem}.star'.",
+    )
+    parser.add_argument("--input_type", default="emmotl", choices=["emmotl", "relion", "stopgap"])
+    parser.add_argument("--n_workers", type=int, default=1, help="Number of processes converting the files.")
+    parser.add_argument("--overwrite", action="store_true", help="Convert also the files with up-to-date outputs.")
+    parser.add_argument("--relion_version", type=float)
+    parser.add_argument("--pixel_size", type=float)
+    parser.add_argument("--binning", type=float)
+    parser.add_argument("--tomo_format")
+    parser.add_argument("--subtomo_format")
+    parser.add_argument("--update_coordinates", action="store_true")
+    args = vars(parser.parse_args())
+
+    input_motls = []
+    for input_motl in args.pop("input_motls"):
+        input_motls.extend(sorted(glob.glob(input_motl)) if glob.has_magic(input_motl) else [input_motl])
+
+    # only the specified converter parameters are passed on, the rest keeps the converter defaults
+    batch_params = {k: args.pop(k) for k in ["output_type", "output_pattern", "input_type", "n_workers", "overwrite"]}
+    converter_params = {k: v for k, v in args.items() if v is not None and v is not False}
+
+    start = time.perf_counter()
+    results = cryomotl.convert_motls(input_motls, **batch_params, **converter_params)
+    wall_time = max(time.perf_counter() - start, 1e-6)
+
+    for row in results[results["status"] == "failed"].itertuples():
+        print(f"Failed to convert {row.input_path}: {row.error}")
+
+    counts = results["status"].value_counts()
+    n_converted = counts.get("converted", 0)
+    n_particles = results["n_particles"].sum()
+    print(
+        f"Converted {n_converted} files ({n_particles} particles), skipped {counts.get('skipped', 0)}, "
+        f"failed {counts.get('failed', 0)} in {wall_time:.1f} s: {n_converted / wall_time:.1f} files/s, "
+        f"{n_particles / wall_time:.0f} particles/s."
+    )
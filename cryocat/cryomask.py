@@ -1180,7 +1180,7 @@ def tomogram_shell_mask(
         This function does not return any value but writes output files for each tomogram with the generated masks.
     """
 
-    input_motl = cryomotl.Motl.load(input_motl)
+    input_motl = cryomotl.Motl.load(input_motl, share_data=True)
     tomos = input_motl.get_unique_values("tomo_id")
     tomo_dim = ioutils.dimensions_load(tomo_dim, tomos)
     shell_size = str(int(shell_size))
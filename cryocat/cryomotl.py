@@ -1,12 +1,17 @@
-import decimal
 import emfile
+import glob
+import h5py
+import inspect
 import numpy as np
 import os
 import pandas as pd
 import subprocess
 import re
+import time
 import warnings
 import copy
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from cryocat.exceptions import UserInputError
 from cryocat import cryomap
@@ -21,11 +26,403 @@ from cryocat import imod
 from math import ceil
 from matplotlib import pyplot as plt
 
-from scipy.spatial import KDTree
 from sklearn.neighbors import KDTree as snKDTree
 from scipy.spatial.transform import Rotation as rot
 
 
+def run_in_parallel(function, inputs, n_workers=1):
+    """Applies the function to each of the inputs, either serially or concurrently using a pool of threads.
+
+    Parameters
+    ----------
+    function : callable
+        Function taking one input as its only argument.
+    inputs : iterable
+        Inputs to be processed (e.g. tomogram indices).
+    n_workers : int, default=1
+        Number of threads to use. If it is 1 (or smaller) the inputs are processed serially. Defaults to 1.
+
+    Returns
+    -------
+    list
+        Results of the function in the same order as the inputs, regardless of the number of workers.
+
+    Notes
+    -----
+    Threads are used instead of processes to avoid copying (pickling) the motl data for each worker. The speed-up
+    comes mainly from numpy, scipy and file reading routines which release the GIL.
+
+    """
+
+    inputs = list(inputs)
+
+    if n_workers is None or n_workers <= 1 or len(inputs) <= 1:
+        return [function(i) for i in inputs]
+
+    with ThreadPoolExecutor(max_workers=min(n_workers, len(inputs))) as executor:
+        return list(executor.map(function, inputs))
+
+
+def is_copy_on_write_enabled():
+    """Checks whether pandas copy-on-write mode is active.
+
+    Returns
+    -------
+    bool
+        True if pandas copy-on-write is enabled (default since pandas 3.0, optional before), False otherwise.
+
+    """
+
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+
+    return pd.get_option("mode.copy_on_write") is True
+
+
+class SpatialIndex:
+    """Spatial index of particle positions (coordinates including shifts) with one KDTree per group of particles.
+    The trees are created only once they are needed. The instances are meant to be obtained through
+    :meth:`cryocat.cryomotl.Motl.spatial_index` which caches them.
+
+    Parameters
+    ----------
+    coord : numpy.ndarray
+        Positions of all particles of the motl, shape (N, 3).
+    group_index : dict, optional
+        Dictionary mapping group values to the row positions of their particles (see
+        :meth:`cryocat.cryomotl.Motl.get_group_index`). If None, all particles form one group. Defaults to None.
+
+    Notes
+    -----
+    The queries follow the interface of `sklearn.neighbors.KDTree` and all the indices returned are positions within
+    the queried group, i.e. they correspond to the rows of `motl.get_motl_subset(group)` (or `motl.df` if the index
+    has no groups). Use :meth:`cryocat.cryomotl.SpatialIndex.get_positions` to convert them to the positions in the
+    whole motl.
+
+    """
+
+    def __init__(self, coord, group_index=None):
+        self.coord = coord
+        self.group_index = group_index
+        self.trees = {}
+
+    def get_positions(self, group=None):
+        """Returns the row positions (in the whole motl) of the particles in the group.
+
+        Parameters
+        ----------
+        group : int or float, optional
+            The value of the group. Has to be None if the index has no groups. Defaults to None.
+
+        Returns
+        -------
+        numpy.ndarray
+            Ascending row positions of the particles in the group.
+
+        Raises
+        ------
+        UserInputError
+            If the group is not specified for index with groups or if there are no particles in the group.
+
+        """
+
+        if self.group_index is None:
+            return np.arange(self.coord.shape[0])
+
+        if group is None:
+            raise UserInputError("The spatial index is grouped - the group to query has to be specified.")
+
+        if group not in self.group_index:
+            raise UserInputError(f"There are no particles with value {group} in the spatial index.")
+
+        return self.group_index[group]
+
+    def get_tree(self, group=None):
+        """Returns KDTree of the particles in the group. The tree is created only at the first request.
+
+        Parameters
+        ----------
+        group : int or float, optional
+            The value of the group. Has to be None if the index has no groups. Defaults to None.
+
+        Returns
+        -------
+        sklearn.neighbors.KDTree
+            Tree with the positions of the particles in the group.
+
+        """
+
+        tree = self.trees.get(group)
+
+        if tree is None:
+            tree = snKDTree(self.coord[self.get_positions(group), :])
+            self.trees[group] = tree
+
+        return tree
+
+    def query(self, query_points, k=1, group=None, return_distance=True):
+        """Finds k nearest neighbors of all query points at once.
+
+        Parameters
+        ----------
+        query_points : numpy.ndarray
+            Query points of shape (M, 3).
+        k : int, default=1
+            Number of nearest neighbors to return. Must not be greater than the number of particles in the group.
+            Defaults to 1.
+        group : int or float, optional
+            The value of the group to search in. Has to be None if the index has no groups. Defaults to None.
+        return_distance : bool, default=True
+            Whether to return the distances. Defaults to True.
+
+        Returns
+        -------
+        tuple or numpy.ndarray
+            Distances of shape (M, k) and indices of shape (M, k) of the neighbors (sorted by the distance). If
+            return_distance is False only the indices are returned.
+
+        """
+
+        query_points = np.asarray(query_points).reshape(-1, 3)
+
+        return self.get_tree(group).query(query_points, k=k, return_distance=return_distance)
+
+    def query_radius(
+        self, query_points, r, group=None, return_distance=False, count_only=False, sort_results=False
+    ):
+        """Finds all neighbors within the radius of all query points at once.
+
+        Parameters
+        ----------
+        query_points : numpy.ndarray
+            Query points of shape (M, 3).
+        r : float or numpy.ndarray
+            The radius (or radii for each query point). Particles with distance smaller or equal to it are returned.
+        group : int or float, optional
+            The value of the group to search in. Has to be None if the index has no groups. Defaults to None.
+        return_distance : bool, default=False
+            Whether to return the distances as well. Defaults to False.
+        count_only : bool, default=False
+            Whether to return only the number of neighbors of each point. Defaults to False.
+        sort_results : bool, default=False
+            Whether to sort the neighbors by their distance. Can be used only with return_distance set to True.
+            Defaults to False.
+
+        Returns
+        -------
+        numpy.ndarray or tuple
+            Array of shape (M,) with the numbers of neighbors if count_only is True, otherwise object array of shape
+            (M,) with the indices of the neighbors for each query point (and the corresponding distances if
+            return_distance is True).
+
+        """
+
+        query_points = np.asarray(query_points).reshape(-1, 3)
+
+        return self.get_tree(group).query_radius(
+            query_points, r, return_distance=return_distance, count_only=count_only, sort_results=sort_results
+        )
+
+
+class MotlComparison:
+    """Comparison of two motls with particles matched by a (composite) key. The particles are matched only once when
+    the comparison is created, the intersection, differences and changes are derived from the matching. The instances
+    are meant to be obtained through :meth:`cryocat.cryomotl.Motl.compare`.
+
+    Parameters
+    ----------
+    motl : :class:`Motl`
+        The first motl.
+    other_motl : :class:`Motl`
+        The second motl.
+    key : str or list, default="subtomo_id"
+        Column name or list of column names identifying the particles in both motls, e.g. ["tomo_id", "subtomo_id"].
+        Defaults to "subtomo_id".
+
+    Attributes
+    ----------
+    matched_idx : numpy.ndarray
+        For each particle of the first motl, the row position of the particle with the same key in the second motl
+        (the first one if the key is not unique there) or -1 if there is no such particle.
+    other_matched : numpy.ndarray
+        For each particle of the second motl, whether a particle with the same key exists in the first motl.
+
+    Raises
+    ------
+    UserInputError
+        If some of the key columns are missing in one of the motls.
+
+    Notes
+    -----
+    The key values are hashed (factorized) together for both motls and composite keys are combined into a single
+    integer code, therefore the matching is linear in the number of particles.
+
+    """
+
+    def __init__(self, motl, other_motl, key="subtomo_id"):
+        self.motl = motl
+        self.other_motl = other_motl
+        self.key = [key] if isinstance(key, str) else list(key)
+
+        for k in self.key:
+            if k not in motl.df.columns or k not in other_motl.df.columns:
+                raise UserInputError(f"The column {k} is missing in one of the motls.")
+
+        n_rows = motl.df.shape[0]
+        codes = np.zeros((n_rows + other_motl.df.shape[0],), dtype=np.int64)
+        for k in self.key:
+            k_codes, k_uniques = pd.factorize(
+                np.concatenate([motl.df[k].to_numpy(), other_motl.df[k].to_numpy()]), use_na_sentinel=False
+            )
+            codes = codes * len(k_uniques) + k_codes
+            if len(self.key) > 1:
+                # keeps the combined codes small
+                codes, _ = pd.factorize(codes)
+
+        n_codes = codes.max() + 1 if codes.shape[0] > 0 else 0
+        motl_codes = codes[:n_rows]
+        other_codes = codes[n_rows:]
+
+        # the first occurrence wins - assigned in the reversed order
+        first_other_idx = np.full((n_codes,), -1, dtype=np.int64)
+        first_other_idx[other_codes[::-1]] = np.arange(other_codes.shape[0] - 1, -1, -1)
+        self.matched_idx = first_other_idx[motl_codes]
+
+        in_motl = np.zeros((n_codes,), dtype=bool)
+        in_motl[motl_codes] = True
+        self.other_matched = in_motl[other_codes]
+
+    @property
+    def intersection(self):
+        """:class:`Motl`: Particles of the first motl that are also in the second motl (in the order of the first
+        motl)."""
+        return Motl(self.motl.df.iloc[np.flatnonzero(self.matched_idx >= 0)].reset_index(drop=True))
+
+    @property
+    def difference(self):
+        """:class:`Motl`: Particles of the first motl that are not in the second motl."""
+        return Motl(self.motl.df.iloc[np.flatnonzero(self.matched_idx < 0)].reset_index(drop=True))
+
+    @property
+    def other_difference(self):
+        """:class:`Motl`: Particles of the second motl that are not in the first motl."""
+        other_idx = np.flatnonzero(~self.other_matched)
+        return Motl(self.other_motl.df.iloc[other_idx].reset_index(drop=True))
+
+    def get_changed_mask(self, columns=None, atol=0.0):
+        """Compares the values of the matched particles.
+
+        Parameters
+        ----------
+        columns : list, optional
+            Columns to compare. If None, all columns present in both motls except the key columns are compared.
+            Defaults to None.
+        atol : float, default=0.0
+            Absolute tolerance for numeric columns - the values are considered as changed if they differ by more than
+            atol. NaN values are considered equal to each other. Defaults to 0.0.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Boolean DataFrame with one row per matched particle (in the order of
+            :attr:`cryocat.cryomotl.MotlComparison.intersection`) and one column per compared column. True means the
+            value has changed.
+
+        """
+
+        columns = self.get_compared_columns(columns)
+        left_idx = np.flatnonzero(self.matched_idx >= 0)
+        right_idx = self.matched_idx[left_idx]
+
+        changed = {}
+        for c in columns:
+            left_values = self.motl.df[c].to_numpy()[left_idx]
+            right_values = self.other_motl.df[c].to_numpy()[right_idx]
+            if pd.api.types.is_numeric_dtype(left_values.dtype) and pd.api.types.is_numeric_dtype(right_values.dtype):
+                changed[c] = ~np.isclose(left_values, right_values, rtol=0.0, atol=atol, equal_nan=True)
+            else:
+                changed[c] = left_values != right_values
+
+        return pd.DataFrame(changed, columns=columns)
+
+    def get_change_report(self, columns=None, atol=0.0):
+        """Per-column summary of the changes between the matched particles.
+
+        Parameters
+        ----------
+        columns : list, optional
+            Columns to compare. If None, all columns present in both motls except the key columns are compared.
+            Defaults to None.
+        atol : float, default=0.0
+            Absolute tolerance for numeric columns (see :meth:`cryocat.cryomotl.MotlComparison.get_changed_mask`).
+            Defaults to 0.0.
+
+        Returns
+        -------
+        pandas.DataFrame
+            DataFrame indexed by the column names with the number of changed particles ("n_changed"), their fraction
+            among the matched particles ("changed_fraction") and the maximal absolute difference for numeric columns
+            ("max_abs_diff", NaN for other columns).
+
+        """
+
+        columns = self.get_compared_columns(columns)
+        changed_mask = self.get_changed_mask(columns, atol=atol)
+        left_idx = np.flatnonzero(self.matched_idx >= 0)
+        right_idx = self.matched_idx[left_idx]
+
+        max_abs_diff = []
+        for c in columns:
+            left_values = self.motl.df[c].to_numpy()[left_idx]
+            right_values = self.other_motl.df[c].to_numpy()[right_idx]
+            if left_idx.shape[0] > 0 and pd.api.types.is_numeric_dtype(left_values.dtype):
+                max_abs_diff.append(np.nanmax(np.abs(left_values.astype(float) - right_values.astype(float))))
+            else:
+                max_abs_diff.append(np.nan)
+
+        n_changed = changed_mask.sum(axis=0).to_numpy()
+
+        return pd.DataFrame(
+            {
+                "n_changed": n_changed,
+                "changed_fraction": n_changed / max(left_idx.shape[0], 1),
+                "max_abs_diff": max_abs_diff,
+            },
+            index=pd.Index(columns, name="column"),
+        )
+
+    def get_compared_columns(self, columns=None):
+        """Returns the columns to compare - the given ones or all columns present in both motls except the key
+        columns.
+
+        Parameters
+        ----------
+        columns : list, optional
+            Columns to compare. Defaults to None.
+
+        Returns
+        -------
+        list
+            The column names.
+
+        Raises
+        ------
+        UserInputError
+            If some of the given columns are missing in one of the motls.
+
+        """
+
+        if columns is None:
+            return [c for c in self.motl.df.columns if c in self.other_motl.df.columns and c not in self.key]
+
+        columns = [columns] if isinstance(columns, str) else list(columns)
+        missing_columns = [c for c in columns if c not in self.motl.df.columns or c not in self.other_motl.df.columns]
+        if missing_columns:
+            raise UserInputError(f"The columns {missing_columns} are missing in one of the motls.")
+
+        return columns
+
+
 class Motl:
     # Motl module example usage
     #
@@ -58,6 +455,13 @@ class Motl:
         "class",
     ]
 
+    # columns stored as int32 in the compact representation (all other floating point columns are stored as float32)
+    compact_int_columns = ["subtomo_id", "tomo_id", "object_id", "class"]
+
+    # if True, all data frames assigned to `df` are converted to the compact representation (see
+    # :meth:`cryocat.cryomotl.Motl.get_compact_df`), can be set for the whole class or for an instance
+    compact_mode = False
+
     def __init__(self, motl_df=None):
         if motl_df is not None:
             if self.check_df_correct_format(motl_df):
@@ -67,6 +471,146 @@ class Motl:
         else:
             self.df = Motl.create_empty_motl_df()
 
+    @property
+    def df(self):
+        """pandas.DataFrame: The particle list with columns defined in :attr:`cryocat.cryomotl.Motl.motl_columns`.
+        Assigning a new DataFrame invalidates all cached data (see :meth:`cryocat.cryomotl.Motl.invalidate_cache`).
+        """
+        return self._df
+
+    @df.setter
+    def df(self, motl_df):
+        if self.compact_mode:
+            motl_df = Motl.get_compact_df(motl_df)
+
+        self._df = motl_df
+        # new dictionary instead of clearing - shallow copies of the motl can share the old one
+        self._cache = {}
+
+    def __getstate__(self):
+        # the cache contains weak references which cannot be pickled (or deep-copied)
+        state = self.__dict__.copy()
+        state.pop("_cache", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._cache = {}
+
+    def invalidate_cache(self, columns=None):
+        """Removes cached data derived from `df` (e.g. group indices).
+
+        Parameters
+        ----------
+        columns : str or list, optional
+            Columns that were changed - only the cached data depending on them are removed. If None, all cached data
+            are removed. Defaults to None.
+
+        Returns
+        -------
+        None
+
+        Notes
+        -----
+        The cache is invalidated automatically when `df` is reassigned or when the columns the cached data depend on
+        are replaced (e.g. `motl.df["tomo_id"] = new_values`). If the values are changed in place (e.g. through
+        `motl.df.loc[mask, "tomo_id"] = new_values`) this function has to be called. All methods of this class that
+        change the values in place call it.
+
+        """
+
+        if columns is None:
+            self._cache = {}
+            return
+
+        if isinstance(columns, str):
+            columns = [columns]
+
+        columns = set(columns)
+        self._cache = {
+            key: entry for key, entry in self.__dict__.get("_cache", {}).items() if columns.isdisjoint(entry[0])
+        }
+
+    def _get_columns_signature(self, columns):
+        """Returns a signature of the given columns of `df` that changes whenever any of the columns is replaced
+        by a new array. It is used to check whether the cached data are still valid and its cost does not depend on
+        the number of particles.
+
+        Parameters
+        ----------
+        columns : list
+            Names of the columns.
+
+        Returns
+        -------
+        tuple
+            The signature of the columns.
+
+        """
+
+        signature = [self.df.shape[0]]
+
+        for c in columns:
+            column = self.df[c]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                values = column.cat.codes.to_numpy()
+            else:
+                values = column.to_numpy()
+
+            # the array owning the memory is kept as weak reference: if it was freed, the memory (and thus the data
+            # pointer) can be reused by a different array
+            owner = values
+            while isinstance(owner.base, np.ndarray):
+                owner = owner.base
+
+            signature.append((weakref.ref(owner), values.__array_interface__["data"][0], column.dtype))
+
+        return tuple(signature)
+
+    @staticmethod
+    def _is_signature_equal(old_signature, new_signature):
+        if old_signature[0] != new_signature[0] or len(old_signature) != len(new_signature):
+            return False
+
+        # the owners are compared by identity - comparing the weak references would compare the arrays
+        for (old_ref, old_pointer, old_dtype), (new_ref, new_pointer, new_dtype) in zip(
+            old_signature[1:], new_signature[1:]
+        ):
+            if old_ref() is not new_ref() or old_pointer != new_pointer or old_dtype != new_dtype:
+                return False
+
+        return True
+
+    def _get_cached(self, key, columns, create_function):
+        """Returns cached data derived from the given columns. If they are not cached yet or the columns have changed
+        since they were cached, they are created using create_function and stored in the cache.
+
+        Parameters
+        ----------
+        key : hashable
+            The key of the cached data.
+        columns : list
+            Names of the columns the cached data depend on.
+        create_function : callable
+            Function without arguments that creates the data.
+
+        Returns
+        -------
+        object
+            The cached data.
+
+        """
+
+        cache = self.__dict__.setdefault("_cache", {})
+        signature = self._get_columns_signature(columns)
+
+        entry = cache.get(key)
+        if entry is None or not Motl._is_signature_equal(entry[1], signature):
+            entry = (tuple(columns), signature, create_function())
+            cache[key] = entry
+
+        return entry[2]
+
     def __str__(self):
 
         if self.df is not None:
@@ -107,9 +651,7 @@ class Motl:
 
         trimvol_coord = np.asarray(trim_coord_start) - 1
         tdim = np.asarray(trim_coord_end) - trimvol_coord
-        self.df.loc[:, ["x", "y", "z"]] = self.df.loc[:, ["x", "y", "z"]] - np.tile(
-            trimvol_coord, (self.df.shape[0], 1)
-        )
+        self.df[["x", "y", "z"]] = self.df.loc[:, ["x", "y", "z"]] - np.tile(trimvol_coord, (self.df.shape[0], 1))
         self.df = self.df.loc[~((self.df["x"] < 1.0) | (self.df["y"] < 1.0) | (self.df["z"] < 1.0)), :]
         self.df = self.df.loc[
             ~((self.df["x"] > tdim[0]) | (self.df["y"] > tdim[1]) | (self.df["z"] > tdim[2])),
@@ -160,12 +702,9 @@ class Motl:
 
         """
 
-        angles = self.df.loc[:, ["phi", "theta", "psi"]].to_numpy()
-
-        angles_rot = rot.from_euler("zxz", angles, degrees=True)
-        final_rotation = angles_rot * rotation
+        final_rotation = self.get_rotations() * rotation
         angles = final_rotation.as_euler("zxz", degrees=True)
-        self.df.loc[:, ["phi", "theta", "psi"]] = angles
+        self.df[["phi", "theta", "psi"]] = angles
 
     def assign_column(self, input_df, column_pairs):
         """The assign_column function takes a dataframe and a dictionary of column pairs.
@@ -193,7 +732,16 @@ class Motl:
             if paired_key in input_df.columns:
                 self.df[em_key] = pd.to_numeric(input_df[paired_key])
 
-    def clean_by_distance(self, distnace_in_voxels, feature_id, metric_id="score", score_cut=0, dist_mask=None):
+    def clean_by_distance(
+        self,
+        distnace_in_voxels,
+        feature_id,
+        metric_id="score",
+        score_cut=0,
+        dist_mask=None,
+        method="brute_force",
+        n_workers=1,
+    ):
         """Cleans `df` by removing particles closer than a given distnace threshold (in voxels).
 
         Parameters
@@ -212,17 +760,34 @@ class Motl:
             Binary mask/map (or path to it) for directional cleaning. If provided the distance_in_voxels is used to
             find all points within this radius and then those points in the region where the mask is 1
             will be cleaned. Defaults to None.
+        method : str, {"brute_force", "kdtree"}
+            Method used to find the particles to be removed. The "brute_force" computes distances from each kept
+            particle to all particles within the same feature, the "kdtree" uses KDTree to query only the
+            particles within the distance cutoff (see :meth:`cryocat.geom.greedy_distance_suppression`). Both methods
+            give the same results, the "kdtree" one is significantly faster for large number of particles. It is
+            used only if dist_mask is None. Defaults to "brute_force".
+        n_workers : int, default=1
+            Number of threads used to clean the features (e.g. tomograms) concurrently. The result does not depend on
+            the number of workers. Defaults to 1 (no parallelization).
 
         Returns
         -------
         None
 
+        Raises
+        ------
+        UserInputError
+            In case the method is not supported.
+
         Notes
         -----
         This method modifies the `df` attribute of the object.
 
         """
 
+        if method not in ("brute_force", "kdtree"):
+            raise UserInputError(f"Unknown cleaning method: {method}")
+
         # Distance cutoff (pixels)
         d_cut = distnace_in_voxels
 
@@ -233,21 +798,35 @@ class Motl:
 
         # Parse tomograms
         features = np.unique(self.get_feature(feature_id))
+        group_index = self.get_group_index(feature_id)
+        spatial_index = self.spatial_index(feature_id) if method == "kdtree" else None
 
-        # Initialize clean motl
-        cleaned_df = pd.DataFrame()
+        # Parse positions, scores and subtomo ids of all particles
+        all_pos = self.get_coordinates()
+        all_scores = self.df[metric_id].to_numpy()
+        all_subtomos = self.df["subtomo_id"].to_numpy()
 
-        # Loop through and clean
-        for f in features:
+        def clean_feature(f):
             # Parse tomogram
-            feature_m = self.get_motl_subset(f, feature_id=feature_id, reset_index=True)
-            n_temp_motl = feature_m.df.shape[0]
+            feature_idx = group_index.get(f, np.empty((0,), dtype=int))
+            n_temp_motl = feature_idx.shape[0]
 
             # Parse positions
-            pos = feature_m.get_coordinates()
+            pos = all_pos[feature_idx, :]
 
             # Parse scores
-            temp_scores = feature_m.df[metric_id].values
+            temp_scores = all_scores[feature_idx]
+
+            if dist_mask is None and method == "kdtree":
+                if n_temp_motl == 0:
+                    return feature_idx
+
+                # all neighbors of the feature are found at once
+                neighbors = spatial_index.query_radius(pos, d_cut, group=f)
+                temp_keep = geom.greedy_distance_suppression(
+                    pos, temp_scores, d_cut, score_cut=score_cut, neighbors=neighbors
+                )
+                return feature_idx[temp_keep]
 
             # Sort scores
             sort_idx = np.argsort(temp_scores)[::-1]
@@ -270,8 +849,8 @@ class Motl:
                         # Keep current entry
                         d_cut_idx[j] = False
                     else:
-                        d_cut_idx = np.arange(feature_m.df.shape[0])
-                        subtomo_id = feature_m.df.loc[j, "subtomo_id"]
+                        d_cut_idx = np.arange(n_temp_motl)
+                        subtomo_id = all_subtomos[feature_idx[j]]
                         filtered_idx = nn_stats_filtered.loc[
                             nn_stats_filtered["qp_subtomo_id"] == subtomo_id, "nn_motl_idx"
                         ].values
@@ -280,10 +859,12 @@ class Motl:
                     # Remove other entries
                     temp_keep[d_cut_idx] = False
 
-            # Add entries to main list
-            cleaned_df = pd.concat((cleaned_df, feature_m.df.iloc[temp_keep, :]), ignore_index=True)
+            return feature_idx[temp_keep]
+
+        # Clean each feature separately, the results are in the order of features
+        kept_idx = [np.empty((0,), dtype=int)] + run_in_parallel(clean_feature, features, n_workers=n_workers)
 
-        self.df = cleaned_df
+        self.df = self.df.iloc[np.concatenate(kept_idx)].reset_index(drop=True)
 
     def clean_by_distance_to_points(
         self, points, radius_in_voxels, feature_id="tomo_id", inplace=True, output_file=None
@@ -319,34 +900,30 @@ class Motl:
 
         # Parse tomograms
         features = self.get_unique_values(feature_id)
+        group_index = self.get_group_index(feature_id)
+        spatial_index = self.spatial_index(feature_id)
 
-        # Initialize clean motl
-        cleaned_df = pd.DataFrame()
+        # Indices of the particles to keep
+        kept_idx = [np.empty((0,), dtype=int)]
 
         # Loop through and clean
         for f in features:
             # Parse tomogram
-            feature_m = self.get_motl_subset(f, feature_id=feature_id, reset_index=True)
+            feature_idx = group_index.get(f, np.empty((0,), dtype=int))
 
             # Parse positions
-            coord1 = feature_m.get_coordinates()
             coord2 = points.loc[points[feature_id] == f, ["x", "y", "z"]].values
 
-            # Create a KDTree from coord1
-            tree = KDTree(coord1)
+            if feature_idx.shape[0] == 0 or coord2.shape[0] == 0:
+                kept_idx.append(feature_idx)
+                continue
 
             # Query points from coord2 within the radius
-            indices_to_remove = set()  # Use a set to store unique indices
-            for point in coord2:
-                indices = tree.query_ball_point(point, r=radius_in_voxels)  # Returns indices as array
-                indices_to_remove.update(indices)  # Add indices to the set
-
-            # Convert to a sorted list for consistent ordering
-            indices_to_remove = sorted(indices_to_remove)
-            cfm = feature_m.df.drop(index=indices_to_remove)
-            cleaned_df = pd.concat([cleaned_df, cfm], ignore_index=True)
+            nn_idx = spatial_index.query_radius(coord2, radius_in_voxels, group=f)
+            indices_to_remove = np.unique(np.concatenate(nn_idx.tolist()).astype(int))
+            kept_idx.append(np.delete(feature_idx, indices_to_remove))
 
-        cleaned_df.reset_index(drop=True, inplace=True)
+        cleaned_df = self.df.iloc[np.concatenate(kept_idx)].reset_index(drop=True)
         cleaned_motl = Motl(cleaned_df)
 
         if output_file:
@@ -359,7 +936,7 @@ class Motl:
         else:
             return cleaned_motl
 
-    def clean_by_tomo_mask(self, tomo_list, tomo_masks, inplace=True, output_file=None):
+    def clean_by_tomo_mask(self, tomo_list, tomo_masks, inplace=True, output_file=None, n_workers=1):
         """Removes particles from the motive list based on provided tomomgram masks.
 
         Parameters
@@ -375,6 +952,10 @@ class Motl:
             the original motive list remains unchanged. Defaults to True.
         output_file : str, optional
             Path to save the cleaned motive list. If not provided, the motive list is not saved. Defaults to None.
+        n_workers : int, default=1
+            Number of threads used to load the masks and evaluate the tomograms concurrently. Note that each worker
+            keeps one tomogram mask in the memory. The result does not depend on the number of workers. Defaults to 1
+            (no parallelization).
 
         Returns
         -------
@@ -406,32 +987,36 @@ class Motl:
             tomo_mask = cryomap.binarize(tomo_masks)
             requries_loading = False
 
-        cleaned_motl = Motl.load(self)
+        group_index = self.get_group_index("tomo_id")
+        all_coords = self.get_coordinates().astype(int)
+        all_subtomos = self.df["subtomo_id"].to_numpy()
 
-        for i, t in enumerate(tomos):
-            tm = self.get_motl_subset(t, reset_index=True)
-            coords = tm.get_coordinates().astype(int)
-            if requries_loading:
-                tomo_mask = cryomap.binarize(tomo_masks[i])
+        def get_subtomos_to_remove(i):
+            tomo_idx = group_index.get(tomos[i], np.empty((0,), dtype=int))
+            coords = all_coords[tomo_idx, :]
+            mask = cryomap.binarize(tomo_masks[i]) if requries_loading else tomo_mask
 
             # Ensure coordinates are within the bounds of the mask array
-            within_bounds = (
-                (coords[:, 0] < tomo_mask.shape[0])
-                & (coords[:, 1] < tomo_mask.shape[1])
-                & (coords[:, 2] < tomo_mask.shape[2])
+            within_bounds = np.flatnonzero(
+                (coords[:, 0] < mask.shape[0]) & (coords[:, 1] < mask.shape[1]) & (coords[:, 2] < mask.shape[2])
             )
-            coords = coords[within_bounds]
+            coords = coords[within_bounds, :]
 
             # Filter out coordinates where the mask value is 0
-            mask_values = tomo_mask[coords[:, 0], coords[:, 1], coords[:, 2]]
+            mask_values = mask[coords[:, 0], coords[:, 1], coords[:, 2]]
 
-            # Get the indices of the filtered coordinates
-            idx_to_remove = np.where(mask_values == 0)[0]
-            subtomo_idx = tm.df.loc[idx_to_remove, "subtomo_id"].values
+            # Get the subtomo ids of the filtered coordinates
+            return all_subtomos[tomo_idx[within_bounds[mask_values == 0]]]
 
-            cleaned_motl.remove_feature("subtomo_id", subtomo_idx)
+        subtomos_to_remove = run_in_parallel(get_subtomos_to_remove, range(len(tomos)), n_workers=n_workers)
 
-            print(f"Removed {str(idx_to_remove.shape[0])} particles from tomogram #{str(t)}")
+        for t, subtomo_idx in zip(tomos, subtomos_to_remove):
+            print(f"Removed {str(subtomo_idx.shape[0])} particles from tomogram #{str(t)}")
+
+        cleaned_motl = Motl.load(self, share_data=True)
+        if len(subtomos_to_remove) > 0:
+            subtomos_to_remove = np.concatenate(subtomos_to_remove)
+            cleaned_motl.df = cleaned_motl.df.loc[~cleaned_motl.df["subtomo_id"].isin(subtomos_to_remove)]
 
         cleaned_motl.df.reset_index(inplace=True, drop=True)
 
@@ -501,6 +1086,116 @@ class Motl:
 
         self.df = cleaned_motl.reset_index(drop=True)
 
+    def compact(self):
+        """Converts `df` to the compact representation (see :meth:`cryocat.cryomotl.Motl.get_compact_df`).
+
+        Returns
+        -------
+        None
+
+        Notes
+        -----
+        This method modifies the `df` attribute of the object. To use the compact representation for all motls
+        (including the ones created by reading files, merging, splitting or conversions), set
+        `Motl.compact_mode = True`.
+
+        """
+
+        self.df = Motl.get_compact_df(self.df)
+
+    def is_compact(self):
+        """Checks whether `df` uses the compact representation (see :meth:`cryocat.cryomotl.Motl.get_compact_df`).
+
+        Returns
+        -------
+        bool
+            True if all the id columns are stored as int32 and all other motl columns as float32, False otherwise.
+
+        """
+
+        return Motl.is_compact_df(self.df)
+
+    @staticmethod
+    def is_compact_df(motl_df):
+        """Checks whether the particle list uses the compact representation (see
+        :meth:`cryocat.cryomotl.Motl.get_compact_df`).
+
+        Parameters
+        ----------
+        motl_df : pandas.DataFrame
+            The particle list.
+
+        Returns
+        -------
+        bool
+            True if all the id columns are stored as int32 and all other motl columns as float32, False otherwise.
+
+        """
+
+        dtypes = motl_df.dtypes
+        for c in Motl.motl_columns:
+            expected_dtype = np.int32 if c in Motl.compact_int_columns else np.float32
+            if c in dtypes.index and dtypes[c] != expected_dtype:
+                return False
+
+        return True
+
+    @staticmethod
+    def get_compact_df(motl_df, categorical_ratio=0.5):
+        """Returns the particle list in the compact representation: the id columns (see
+        :attr:`cryocat.cryomotl.Motl.compact_int_columns`) are stored as int32, floating point columns (coordinates,
+        shifts, angles, score, geom) as float32 and string columns with repeated values as categorical.
+
+        Parameters
+        ----------
+        motl_df : pandas.DataFrame
+            The particle list.
+        categorical_ratio : float, default=0.5
+            String columns with the ratio of unique values to all values smaller or equal to this value are converted
+            to categorical. Defaults to 0.5.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The particle list in the compact representation. If it was already compact, the input is returned.
+
+        Notes
+        -----
+        The id columns with values that are not integers (or do not fit to int32) are kept as they are. The
+        representation requires 80 instead of 160 bytes per particle. The float32 precision corresponds to
+        approximately 7 significant digits, i.e. 0.001 voxel for coordinates up to 10000 voxels.
+
+        """
+
+        compact_columns = {}
+
+        for c in motl_df.columns:
+            column = motl_df[c]
+
+            if c in Motl.compact_int_columns:
+                if column.dtype == np.int32 or not pd.api.types.is_numeric_dtype(column.dtype):
+                    continue
+                values = column.to_numpy()
+                int32_info = np.iinfo(np.int32)
+                if values.size == 0 or (
+                    np.all(np.isfinite(values))
+                    and np.all(np.mod(values, 1) == 0)
+                    and values.min() >= int32_info.min
+                    and values.max() <= int32_info.max
+                ):
+                    compact_columns[c] = values.astype(np.int32)
+            elif pd.api.types.is_float_dtype(column.dtype):
+                if column.dtype != np.float32:
+                    compact_columns[c] = column.to_numpy(dtype=np.float32)
+            elif column.dtype == object or pd.api.types.is_string_dtype(column.dtype):
+                if column.nunique() <= categorical_ratio * column.shape[0]:
+                    compact_columns[c] = column.astype("category")
+
+        if not compact_columns:
+            return motl_df
+
+        return motl_df.assign(**compact_columns)
+
     def convert_to_motl(self, input_df):
         """Abstract method implemented only within child classes.
 
@@ -523,13 +1218,53 @@ class Motl:
 
         raise ValueError("Provided motl does not have correct format.")
 
+    def copy(self, deep=True):
+        """Returns a copy of the motl (including the subclass specific attributes).
+
+        Parameters
+        ----------
+        deep : bool, default=True
+            If True, all the data are copied. If False, the data frames (`df` as well as e.g. `relion_df` or
+            `optics_data`) of the new motl share the data with this motl while all other attributes are copied.
+            Defaults to True.
+
+        Returns
+        -------
+        child of :class:`Motl`
+            Copy of the motl of the same class.
+
+        Notes
+        -----
+        The shallow copy (deep=False) requires only a fraction of memory. The methods of :class:`Motl` replace the
+        columns instead of changing their values in place, i.e. the changes done through them are not propagated to
+        the other motl. If the data are changed in place (e.g. `motl.df.loc[0, "x"] = 1`), the change is propagated
+        to the other motl unless pandas copy-on-write mode is enabled (see
+        :func:`cryocat.cryomotl.is_copy_on_write_enabled`), in which case the data are copied at the moment of the
+        first change.
+
+        """
+
+        if deep:
+            return copy.deepcopy(self)
+
+        # data frames are shared, everything else is copied
+        memo = {id(v): v.copy(deep=False) for v in self.__dict__.values() if isinstance(v, pd.DataFrame)}
+        motl_copy = copy.deepcopy(self, memo)
+
+        # the data are the same, so are the cached data
+        motl_copy._cache = dict(self.__dict__.get("_cache", {}))
+
+        return motl_copy
+
     @staticmethod
-    def create_empty_motl_df():
+    def create_empty_motl_df(compact=None):
         """Creates an empty DataFrame with the columns defined in :attr:`cryocat.cryomotl.Motl.motl_columns`.
 
         Parameters
         ----------
-        None
+        compact : bool, optional
+            Whether to use the compact representation (see :meth:`cryocat.cryomotl.Motl.get_compact_df`). If None,
+            :attr:`cryocat.cryomotl.Motl.compact_mode` is used. Defaults to None.
 
         Returns
         -------
@@ -545,6 +1280,9 @@ class Motl:
 
         empty_motl_df = empty_motl_df.fillna(0.0)
 
+        if Motl.compact_mode if compact is None else compact:
+            empty_motl_df = Motl.get_compact_df(empty_motl_df)
+
         return empty_motl_df
 
     @staticmethod
@@ -610,13 +1348,15 @@ class Motl:
 
         Notes
         -----
-        This method modifies the `df` attribute of the object.
+        This method modifies the `df` attribute of the object. If `df` uses the compact representation, it is kept.
 
         Returns
         -------
         None
 
         """
+        is_compact = self.is_compact()
+
         for key, value in input_dict.items():
             if key in self.df.columns:
                 self.df[key] = value
@@ -629,6 +1369,10 @@ class Motl:
 
         self.df = self.df.fillna(0.0)
 
+        # new values should not change the representation
+        if is_compact and self.df.shape[0] > 0:
+            self.compact()
+
     def get_random_subset(self, number_of_particles):
         """Generate a random subset of particles from the motl.
 
@@ -676,7 +1420,9 @@ class Motl:
         ----------
         tomo_dimensions : str or pandas.DataFrame or array-like, optional
             Dimensions of tomograms in the motl. If not provided, only the orientation is changed. For specification on
-            tomo_dimensions format see :meth:`cryocat.ioutils.dimensions_load`. Defaults to None.
+            tomo_dimensions format see :meth:`cryocat.ioutils.dimensions_load`. If the dimensions contain tomo_id,
+            they are joined to the particles by it and particles from tomograms without dimensions keep their
+            position. Defaults to None.
 
         Notes
         -----
@@ -695,19 +1441,19 @@ class Motl:
         >>> flip_handedness(tomo_dimensions="dimensions.txt")
 
         """
-        self.df.loc[:, "theta"] = -self.df.loc[:, "theta"]
+        self.df["theta"] = -self.df["theta"]
 
         # Position flip
         if tomo_dimensions is not None:
             dims = ioutils.dimensions_load(tomo_dimensions)
-            if dims.shape == (1, 3):
-                z_dim = float(dims["z"]) + 1
-                self.df.loc[:, "z"] = z_dim - self.df.loc[:, "z"]
+            if "tomo_id" not in dims.columns:
+                z_dim = float(dims["z"].iloc[0]) + 1
+                self.df["z"] = z_dim - self.df["z"]
             else:
-                tomos = dims["tomo_id"].unique()
-                for t in tomos:
-                    z_dim = float(dims[dims["tomo_id"] == t, "z"]) + 1
-                    self.df.loc[self.df["tomo_id"] == t, "z"] = z_dim - self.df.loc[self.df["tomo_id"] == t, "z"]
+                # particles from tomograms without dimensions are not flipped
+                z_dims = self.get_values_by_feature(dims, ["z"], fill_value=np.nan)[:, 0].astype(float)
+                z = self.df["z"].to_numpy(dtype=float)
+                self.df["z"] = np.where(np.isnan(z_dims), z, z_dims + 1 - z)
 
     def get_angles(self, tomo_number=None):
         """This function takes in a tomo_number and returns the angles of all particles in that
@@ -778,28 +1524,58 @@ class Motl:
         max_tomo_id = self.df[feature_id].max()
         return len(str(max_tomo_id))
 
-    def get_rotations(self, tomo_number=None):
+    def get_rotations(self, tomo_number=None, feature_id="tomo_id"):
         """The get_rotations function returns rotations for all particles.
 
         Parameters
         ----------
         tomo_number : int, optional
-            The tomogram number. If not provided, all rotations will be returned. Defaults to None.
+            The tomogram number (or the value of the feature specified by feature_id). If not provided, all rotations
+            will be returned. Defaults to None.
+        feature_id : str, default="tomo_id"
+            The column name of the feature the tomo_number refers to. Defaults to "tomo_id".
 
         Returns
         -------
-        list
-            List of rotations (with type `scipy.spatial.transform._rotation.Rotation`) for all particles.
+        scipy.spatial.transform.Rotation
+            Rotations of all particles (or of the particles with the given tomo_number) in the order of the particle
+            list.
+
+        Notes
+        -----
+        The rotations of all particles and of each group are cached - the Euler angles are converted only once and
+        converted again once the angle columns (or the feature column) are replaced. If they are changed in place,
+        :meth:`cryocat.cryomotl.Motl.invalidate_cache` has to be called. The returned object is shared between the
+        calls and should not be modified. The rotations of a group are taken from the rotations of all particles at
+        the positions given by :meth:`cryocat.cryomotl.Motl.get_group_index`.
+
+        Examples
+        --------
+        >>> rotations = motl.get_rotations()
+        >>> tomo_rotations = motl.get_rotations(5)
+        >>> rotated_points = rotations[:10].apply(points)
 
         """
-        angles = self.get_angles(tomo_number)
-        rotations = rot.from_euler("zxz", angles, degrees=True)
 
-        return rotations
+        angle_columns = ["phi", "theta", "psi"]
+
+        if tomo_number is None:
+            return self._get_cached(
+                ("rotations", None), angle_columns, lambda: rot.from_euler("zxz", self.get_angles(), degrees=True)
+            )
+
+        def create_group_rotations():
+            positions = self.get_group_index(feature_id).get(tomo_number, np.empty((0,), dtype=int))
+            if positions.shape[0] == 0:
+                return rot.from_euler("zxz", np.empty((0, 3)), degrees=True)
+            return self.get_rotations()[positions]
+
+        return self._get_cached(
+            ("rotations", feature_id, tomo_number), angle_columns + [feature_id], create_group_rotations
+        )
 
     def make_angles_canonical(self):
-        angles = self.get_angles()
-        rotations = rot.from_euler("zxz", angles, degrees=True)
+        rotations = self.get_rotations()
         converted_angles = rotations.as_euler("zxz", degrees=True)
         self.df[["phi", "theta", "psi"]] = converted_angles
 
@@ -830,19 +1606,16 @@ class Motl:
 
         """
 
-        coord1 = self.get_coordinates()[idx, :]
+        coord = self.get_coordinates()
+        coord1 = coord[idx, :]
         new_coord = coord1.copy()
 
         n_vertices = nn_idx.shape[1]
 
-        coord2 = np.zeros((nn_idx.shape[0], 3, n_vertices))
-
         for i in range(n_vertices):
-            coord2[:, :, i] = self.get_coordinates()[nn_idx[:, i], :]
-            new_coord += coord2[:, :, i]
+            new_coord += coord[nn_idx[:, i], :]
 
         new_coord = new_coord / (n_vertices + 1)
-        print(new_coord[0, :])
         c_coord = new_coord - coord1
 
         angles = self.df[["phi", "theta", "psi"]].values
@@ -858,30 +1631,16 @@ class Motl:
         phi_rotation = np.rad2deg(np.arctan(c_coord[:, 1] / c_coord[:, 0]))
         """
         # starting frame created from the first orientation
-        w1 = geom.euler_angles_to_normals(angles[0, :])
-        w2 = c_coord[0, :] / np.linalg.norm(c_coord[0, :])
-        w3 = np.cross(w1, w2)
-        w3 = (w3 / np.linalg.norm(w3)).reshape(
-            3,
-        )
-        w_base_mat = np.asarray([w1.reshape((3,)), w2, w3]).T
-        print(w1, w2, w3)
-        print(w_base_mat)
+        w1 = geom.euler_angles_to_normals(angles[0, :]).reshape((1, 3))
+        w_base_mat = geom.frames_from_vectors(w1, c_coord[:1, :])[0].T
 
+        # frames of all other particles are rotated by the starting frame at once
         v1 = geom.euler_angles_to_normals(angles)
+        v_base_mats = geom.frames_from_vectors(v1[1:, :], c_coord[1:, :])
 
         rot_angles = np.zeros(angles.shape)
-
-        for i in range(1, angles.shape[0]):
-            v2 = c_coord[i, :] / np.linalg.norm(c_coord[i, :])
-            v3 = np.cross(v1[i, :], v2)
-            v3 = (v3 / np.linalg.norm(v3)).reshape(
-                3,
-            )
-            v_base_mat = np.asarray([v1[i, :].reshape((3,)), v2, v3])
-            final_mat = np.matmul(w_base_mat, v_base_mat)
-            final_rot = rot.from_matrix(final_mat)
-            rot_angles[i, :] = final_rot.as_euler("zxz", degrees=True)
+        if angles.shape[0] > 1:
+            rot_angles[1:, :] = rot.from_matrix(np.matmul(w_base_mat, v_base_mats)).as_euler("zxz", degrees=True)
 
         new_motl_df = Motl.create_empty_motl_df()
 
@@ -939,6 +1698,98 @@ class Motl:
     # else:
     #     raise UserInputError(f"The class Motl does not contain column with name {feature_id}")
 
+    def get_values_by_feature(self, input_df, columns, feature_id="tomo_id", fill_value=None):
+        """Joins the input_df to the particles by the feature and returns the values of the given columns for each
+        particle, e.g. the dimensions of the tomogram the particle belongs to.
+
+        Parameters
+        ----------
+        input_df : pandas.DataFrame
+            Values per feature (e.g. per tomogram) with a column named by feature_id. If a feature value occurs
+            multiple times, the first row is used.
+        columns : list
+            Names of the columns in input_df to return.
+        feature_id : str, default="tomo_id"
+            Name of the column to join the input_df and the particles by. Defaults to "tomo_id".
+        fill_value : float, optional
+            Value for particles with the feature value missing in input_df. If None, an error is raised for them.
+            Defaults to None.
+
+        Returns
+        -------
+        numpy.ndarray
+            Array of shape (number of particles, number of columns) in the order of the particle list.
+
+        Raises
+        ------
+        UserInputError
+            If the feature_id is missing in input_df or in the motl, or if fill_value is None and the values for
+            some of the particles are missing.
+
+        Examples
+        --------
+        >>> dims = ioutils.dimensions_load("dimensions.txt")
+        >>> tomo_dims = motl.get_values_by_feature(dims, ["x", "y", "z"])
+
+        """
+
+        if feature_id not in input_df.columns:
+            raise UserInputError(f"The provided DataFrame does not contain column {feature_id}.")
+
+        unique_df = input_df.drop_duplicates(subset=feature_id, keep="first")
+        positions = pd.Index(unique_df[feature_id].to_numpy()).get_indexer(self.get_feature(feature_id)[:, 0])
+        values = unique_df[columns].to_numpy()
+
+        missing = positions < 0
+        if not np.any(missing):
+            return values[positions, :]
+
+        if fill_value is None:
+            missing_values = np.unique(self.df[feature_id].to_numpy()[missing])
+            raise UserInputError(f"The values for {feature_id} {missing_values} are missing.")
+
+        # the missing particles have position -1, i.e. they get the appended row
+        values = np.vstack([values, np.full((1, len(columns)), fill_value)])
+        return values[positions, :]
+
+    def get_group_index(self, feature_id="tomo_id"):
+        """Returns the group index of the feature: a dictionary mapping each unique value of the feature to the
+        (ascending) row positions of the particles with that value.
+
+        Parameters
+        ----------
+        feature_id : str, default="tomo_id"
+            The column name to group the particles by. Defaults to "tomo_id".
+
+        Returns
+        -------
+        dict
+            Dictionary with the unique values of the feature as keys and numpy.ndarray with the row positions (to be
+            used with `df.iloc`) as values. The keys are sorted in ascending order, NaN values are not part of any
+            group.
+
+        Raises
+        ------
+        UserInputError
+            In case the feature_id is not existing column in self.df dataframe.
+
+        Notes
+        -----
+        The index is created in a single pass over the column once it is needed and cached. It is recreated
+        automatically once the column is replaced. If its values are changed in place (e.g.
+        `motl.df.loc[mask, feature_id] = value`), :meth:`cryocat.cryomotl.Motl.invalidate_cache` has to be called.
+
+        """
+
+        if feature_id not in self.df.columns:
+            raise UserInputError(f"The class Motl does not contain column with name {feature_id}")
+
+        def create_index():
+            feature = self.df[feature_id]
+            return feature.groupby(feature, sort=True, observed=True).indices
+
+        return self._get_cached(("group_index", feature_id), [feature_id], create_index)
+
     def get_motl_subset(self, feature_values, feature_id="tomo_id", return_df=False, reset_index=True):
         """Get a subset of the Motl object based on specified feature values.
 
@@ -964,15 +1815,11 @@ class Motl:
 
         """
 
-        if isinstance(feature_values, list):
-            feature_values = np.array(feature_values)
-        else:
-            feature_values = np.array([feature_values])
+        group_index = self.get_group_index(feature_id)
+        empty_idx = np.empty((0,), dtype=int)
+        subset_idx = [empty_idx] + [group_index.get(i, empty_idx) for i in np.ravel(feature_values)]
 
-        new_df = Motl.create_empty_motl_df()
-        for i in feature_values:
-            df_i = self.df.loc[self.df[feature_id] == i].copy()
-            new_df = pd.concat([new_df, df_i])
+        new_df = self.df.iloc[np.concatenate(subset_idx)]
 
         if reset_index:
             new_df = new_df.reset_index(drop=True)
@@ -992,24 +1839,56 @@ class Motl:
             First motl.
         motl2 : :class:`Motl`
             Second motl.
-        feature_id : str, default="subtomo_id"
-            Feature ID to use for intersection. Defaults to "subtomo_id".
+        feature_id : str or list, default="subtomo_id"
+            Feature ID (or list of them for a composite key) to use for intersection. Defaults to "subtomo_id".
 
         Returns
         -------
         :class:`Motl`
-            The intersection (based on feature_id) of two motls.
+            The intersection (based on feature_id) of two motls, i.e. the particles of motl1 that are also in motl2.
+
+        See Also
+        --------
+        :meth:`cryocat.cryomotl.Motl.compare`
 
         """
-        m1 = cls.load(motl1.df)
-        m2 = cls.load(motl2.df)
+        m1 = cls.load(motl1, share_data=True)
+        m2 = cls.load(motl2, share_data=True)
 
-        s1 = m1.df.merge(m2.df[feature_id], how="inner")
+        s1 = m1.compare(m2, key=feature_id).intersection
 
-        if s1.shape[0] == 0:
+        if s1.df.shape[0] == 0:
             warnings.warn("The intersection of the two motls is empty.")
 
-        return cls(s1.reset_index(drop=True))
+        return cls(s1.df)
+
+    def compare(self, other_motl, key="subtomo_id"):
+        """Matches the particles of this motl and the other motl by the key in one pass. The result provides the
+        intersection, the differences and the per-column changes of the matched particles.
+
+        Parameters
+        ----------
+        other_motl : :class:`Motl`
+            The motl to compare with.
+        key : str or list, default="subtomo_id"
+            Column name or list of column names identifying the particles, e.g. ["tomo_id", "subtomo_id"]. Defaults
+            to "subtomo_id".
+
+        Returns
+        -------
+        :class:`cryocat.cryomotl.MotlComparison`
+            The comparison of the two motls.
+
+        Examples
+        --------
+        >>> comparison = motl_it5.compare(motl_it4)
+        >>> common_motl = comparison.intersection
+        >>> new_motl = comparison.difference
+        >>> comparison.get_change_report(["class", "score"])
+
+        """
+
+        return MotlComparison(self, other_motl, key=key)
 
     def renumber_objects_sequentially(self, starting_number=1):
         """Renumber objects sequentially, starting with 1 or provided number.
@@ -1067,7 +1946,6 @@ class Motl:
         """
         coord1 = self.get_coordinates()[idx, :]
         coord2 = self.get_coordinates()[nn_idx, :]
-        print(coord1.shape, coord2.shape)
         c_coord = coord2 - coord1
 
         angles = self.df[["phi", "theta", "psi"]].values
@@ -1085,33 +1963,18 @@ class Motl:
         phi_rotation = np.rad2deg(np.arctan(c_coord[:, 1] / c_coord[:, 0]))
         """
         # starting frame created from the first orientation
-        w1 = geom.euler_angles_to_normals(angles[0, :])
-        w2 = c_coord[0, :] / np.linalg.norm(c_coord[0, :])
-        w3 = np.cross(w1, w2)
-        w3 = (w3 / np.linalg.norm(w3)).reshape(
-            3,
-        )
-        w_base_mat = np.asarray([w1.reshape((3,)), w2, w3]).T
-        print(w1, w2, w3)
-        print(w_base_mat)
+        w1 = geom.euler_angles_to_normals(angles[0, :]).reshape((1, 3))
+        w_base_mat = geom.frames_from_vectors(w1, c_coord[:1, :])[0].T
 
+        # frames of all other particles are rotated by the starting frame at once
         v1 = geom.euler_angles_to_normals(angles)
+        v_base_mats = geom.frames_from_vectors(v1[1:, :], c_coord[1:, :])
 
         rot_angles = np.zeros(angles.shape)
-
-        for i in range(1, angles.shape[0]):
-            v2 = c_coord[i, :] / np.linalg.norm(c_coord[i, :])
-            v3 = np.cross(v1[i, :], v2)
-            v3 = (v3 / np.linalg.norm(v3)).reshape(
-                3,
-            )
-            v_base_mat = np.asarray([v1[i, :].reshape((3,)), v2, v3])
-            final_mat = np.matmul(w_base_mat, v_base_mat)
-            final_rot = rot.from_matrix(final_mat)
-            rot_angles[i, :] = final_rot.as_euler("zxz", degrees=True)
+        if angles.shape[0] > 1:
+            rot_angles[1:, :] = rot.from_matrix(np.matmul(w_base_mat, v_base_mats)).as_euler("zxz", degrees=True)
 
         new_coord = (coord1 + coord2) / 2.0
-        print(new_coord[0, :])
         new_motl_df = Motl.create_empty_motl_df()
 
         new_motl_df[["x", "y", "z"]] = new_coord
@@ -1147,44 +2010,143 @@ class Motl:
 
         return self.df.loc[:, feature_id].unique()
 
-    @classmethod
-    def load(cls, input_motl, motl_type="emmotl"):
-        """This function is a factory function that returns an instance of the appropriate Motl class.
+    def iter_groups(self, feature_id="tomo_id"):
+        """Iterates over the particles grouped by the feature.
+
+        Parameters
+        ----------
+        feature_id : str, default="tomo_id"
+            The column name to group the particles by. Defaults to "tomo_id".
+
+        Yields
+        ------
+        tuple
+            The value of the feature and :class:`Motl` with the particles having that value. The groups are yielded
+            in ascending order of the feature values.
+
+        Notes
+        -----
+        The grouping is based on :meth:`cryocat.cryomotl.Motl.get_group_index` and thus requires only one pass over the
+        data, independently of the number of groups. The subsets keep their original index. If the particles of the
+        group are stored in contiguous rows (e.g. in motl sorted by the feature) the subset is a view of `df` without
+        copying the data - in such case it should be used only for reading.
+
+        Examples
+        --------
+        >>> for tomo_id, tomo_motl in motl.iter_groups("tomo_id"):
+        ...     print(tomo_id, tomo_motl.df.shape[0])
+
+        """
+
+        for value, group_idx in self.get_group_index(feature_id).items():
+            if group_idx[-1] - group_idx[0] + 1 == group_idx.shape[0]:
+                group_df = self.df.iloc[group_idx[0] : group_idx[-1] + 1]
+            else:
+                group_df = self.df.take(group_idx)
+
+            yield value, Motl(group_df)
+
+    @classmethod
+    def load(cls, input_motl, motl_type="emmotl", share_data=False):
+        """This function is a factory function that returns an instance of the appropriate Motl class.
+
+        Parameters
+        ----------
+        input_motl : pandas.DataFrame or Motl
+            Either path to the motl or pandas.DataFrame in the format corresponding
+            to general motl_df or in the format specific to the motl_type.
+        motl_type : str, {'emmotl', 'dynamo', 'relion', 'stopgap', 'h5'}
+            A string indicating what type of Motl input should be loaded (emmotl, relion, stopgap, dynamo, h5).
+            Defaults to emmotl.
+        share_data : bool, default=False
+            Used only if input_motl is :class:`Motl`. If True, the returned motl shares the data with the input_motl
+            instead of copying them (see :meth:`cryocat.cryomotl.Motl.copy`). It is meant for functions that only read
+            the motl. Defaults to False.
+
+        Returns
+        -------
+        child of :class:`Motl`
+           Subclass of the abstract class :class:`Motl` specified by `motl_type`.
+
+        Raises
+        ------
+        UserInputError
+            In case the motl_type is not supported.
+
+        """
+
+        if isinstance(input_motl, Motl):
+            # with copy-on-write the data are copied only once they are changed
+            return input_motl.copy(deep=not (share_data or is_copy_on_write_enabled()))
+
+        if motl_type == "emmotl":
+            return EmMotl(input_motl)
+        elif motl_type == "relion":
+            return RelionMotl(input_motl)
+        elif motl_type == "stopgap":
+            return StopgapMotl(input_motl)
+        elif motl_type == "dynamo":
+            return DynamoMotl(input_motl)
+        elif motl_type == "h5":
+            return H5Motl(input_motl)
+        else:
+            raise UserInputError(f"Provided motl file {input_motl} has format that is currently not supported.")
+
+    @staticmethod
+    def iter_load(input_path, motl_type="emmotl", chunk_rows=1000000, global_renumbering=False):
+        """Loads the particle list from the file by chunks, i.e. only one chunk of the particles is held in memory.
+        It allows filtering or conversion of particle lists that do not fit into memory.
 
         Parameters
         ----------
-        input_motl : pandas.DataFrame or Motl
-            Either path to the motl or pandas.DataFrame in the format corresponding
-            to general motl_df or in the format specific to the motl_type.
-        motl_type : str, {'emmotl', 'dynamo', 'relion', 'stopgap'}
-            A string indicating what type of Motl input should be loaded (emmotl, relion, stopgap, dynamo).
-            Defaults to emmotl.
+        input_path : str
+            Path to the motl file.
+        motl_type : str, {'emmotl', 'relion', 'stopgap', 'h5'}
+            Type of the motl file (see :meth:`cryocat.cryomotl.Motl.load`). Defaults to emmotl.
+        chunk_rows : int, default=1000000
+            Maximal number of particles in one chunk. Defaults to 1000000.
+        global_renumbering : bool, default=False
+            Used only for Relion files. If True, the particles are renumbered exactly as by
+            :meth:`cryocat.cryomotl.Motl.load`, which requires one more pass over the file (see
+            :meth:`cryocat.cryomotl.RelionMotl.iter_chunks`). Defaults to False.
 
         Returns
         -------
-        child of :class:`Motl`
-           Subclass of the abstract class :class:`Motl` specified by `motl_type`.
+        generator
+            Generator of the motls (subclasses of :class:`Motl` specified by `motl_type`) with consecutive chunks of
+            the particles. For Relion files, each chunk carries the optics table of the file.
 
         Raises
         ------
         UserInputError
-            In case the motl_type is not supported.
+            If the file does not exist or the motl_type does not support reading by chunks.
+
+        Notes
+        -----
+        The renumbering of the particles in Relion files (non-increasing subtomogram numbers, half-sets) continues
+        across the chunks, i.e. the new subtomogram numbers are unique within the whole file (see
+        :meth:`cryocat.cryomotl.RelionMotl.iter_chunks`).
+
+        Examples
+        --------
+        >>> for motl_chunk in Motl.iter_load("particles.star", motl_type="relion", chunk_rows=500000):
+        ...     motl_chunk.remove_out_of_bounds_particles("dimensions.txt")
 
         """
 
-        if isinstance(input_motl, Motl):
-            return copy.deepcopy(input_motl)
+        if not os.path.isfile(input_path):
+            raise UserInputError(f"Provided file {input_path} does not exist.")
 
         if motl_type == "emmotl":
-            return EmMotl(input_motl)
+            return EmMotl.iter_chunks(input_path, chunk_rows)
         elif motl_type == "relion":
-            return RelionMotl(input_motl)
+            return RelionMotl.iter_chunks(input_path, chunk_rows, global_renumbering=global_renumbering)
         elif motl_type == "stopgap":
-            return StopgapMotl(input_motl)
-        elif motl_type == "dynamo":
-            return DynamoMotl(input_motl)
+            return StopgapMotl.iter_chunks(input_path, chunk_rows)
+        elif motl_type == "h5":
+            return H5Motl.iter_chunks(input_path, chunk_rows)
         else:
-            raise UserInputError(f"Provided motl file {input_motl} has format that is currently not supported.")
+            raise UserInputError(f"Reading by chunks is not supported for motl type {motl_type}.")
 
     def remove_feature(self, feature_id, feature_values):
         """The function removes particles based on their feature (i.e. tomo number).
@@ -1231,7 +2193,7 @@ class Motl:
         This method modifies the `df` attribute of the object.
 
         """
-        self.df.loc[:, "subtomo_id"] = list(range(1, len(self.df) + 1))
+        self.df["subtomo_id"] = np.arange(1, len(self.df) + 1).astype(self.df["subtomo_id"].dtype)
 
     def scale_coordinates(self, scaling_factor):
         """Scales coordinates (including shifts) by the scaling factor.
@@ -1255,6 +2217,44 @@ class Motl:
             shift_column = "shift_" + coord
             self.df[shift_column] = self.df[shift_column] * scaling_factor
 
+    def spatial_index(self, feature_id="tomo_id"):
+        """Returns the spatial index of the particle positions (coordinates including shifts) with one KDTree per
+        group of particles given by the feature.
+
+        Parameters
+        ----------
+        feature_id : str, optional
+            The column name to group the particles by. If None, all particles are in one tree. Defaults to "tomo_id".
+
+        Returns
+        -------
+        :class:`cryocat.cryomotl.SpatialIndex`
+            The spatial index.
+
+        Notes
+        -----
+        The index is cached and the trees are created on demand, i.e. repeated analyses of the same motl (or a motl
+        loaded from it with `share_data=True`) share them. The index is recreated automatically once the coordinates,
+        shifts or the feature columns are replaced. If their values are changed in place,
+        :meth:`cryocat.cryomotl.Motl.invalidate_cache` has to be called.
+
+        Examples
+        --------
+        >>> spatial_index = motl.spatial_index("tomo_id")
+        >>> distances, nn_idx = spatial_index.query(motl.get_coordinates(1), k=2, group=1)
+
+        """
+
+        columns = ["x", "y", "z", "shift_x", "shift_y", "shift_z"]
+        if feature_id is not None:
+            columns.append(feature_id)
+
+        def create_index():
+            group_index = None if feature_id is None else self.get_group_index(feature_id)
+            return SpatialIndex(self.get_coordinates().astype(float), group_index)
+
+        return self._get_cached(("spatial_index", feature_id), columns, create_index)
+
     def split_by_feature(self, feature_id, write_out=False, output_prefix=""):
         """Splits motl by the feature_id and writes them out.
 
@@ -1284,11 +2284,12 @@ class Motl:
 
         """
         uniq_values = self.get_unique_values(feature_id)
+        group_index = self.get_group_index(feature_id)
         motls = list()
 
         for value in uniq_values:
             # submotl = self.__class__(self.df.loc[self.df[feature_id] == value])
-            submotl = Motl(self.df.loc[self.df[feature_id] == value])
+            submotl = Motl(self.df.take(group_index.get(value, np.empty((0,), dtype=int))))
             motls.append(submotl)
 
             if write_out:
@@ -1304,7 +2305,7 @@ class Motl:
         ----------
         output_path : str
             The path to write the motl file to.
-        motl_type : str, {'emmotl', 'dynamo', 'relion', 'stopgap'}
+        motl_type : str, {'emmotl', 'dynamo', 'relion', 'stopgap', 'h5'}
             The type of motl file to write. Defaults to "emmotl".
 
         Returns
@@ -1326,6 +2327,8 @@ class Motl:
             StopgapMotl(self.df).write_out(output_path)
         elif motl_type.lower() == "dynamo":
             DynamoMotl(self.df).write_out(output_path)
+        elif motl_type.lower() == "h5":
+            H5Motl(self.df).write_out(output_path)
         else:
             raise UserInputError(f"Provided motl file {output_path} has format that is currently not supported.")
 
@@ -1360,29 +2363,39 @@ class Motl:
         if zero_padding is None:
             zero_padding = self.get_max_number_digits(feature_id)
 
+        # Split the particles only once and scale the coordinates for all of them together
+        group_index = self.get_group_index(feature_id)
+        coordinates = (
+            self.df.loc[:, ["x", "y", "z"]].to_numpy() * binning
+            + self.df.loc[:, ["shift_x", "shift_y", "shift_z"]].to_numpy() * binning
+        )
+        classes = self.df.loc[:, "class"].to_numpy().astype(int)
+
+        empty_idx = np.empty((0,), dtype=int)
+
         for value in uniq_values:
-            fm = self.get_motl_subset(value, feature_id=feature_id, reset_index=True)
+            idx = group_index.get(value, empty_idx)
             feature_str = str(value).zfill(zero_padding)
 
             output_txt = f"{outpath}{feature_str}_model.txt"
             output_mod = f"{outpath}{feature_str}.mod"
 
-            fm.scale_coordinates(binning)
-            coord_df = pd.DataFrame(fm.get_coordinates(), columns=["x", "y", "z"])
-            class_v = fm.df.loc[:, "class"].astype(
-                int
-            )  # TODO add possibility to create object based on other feature_id
+            # TODO add possibility to create object based on other feature_id
+            class_v = classes[idx]
             if np.any(class_v == 0):
-                class_v = (
-                    class_v + 1
-                )  # increase class ID by 1, this prevents the function later to crash in case no classification has been run yet. Mind to revert class ID if necessary
-                # obj = pd.Series(np.arange(1,len(fm.df)+1,1))
-            # else:
-            # obj = class_v
-            dummy = pd.Series(np.repeat(1, len(fm.df)))
-
-            pos_df = pd.concat([class_v, dummy, coord_df], axis=1)
-            # pos_df = pos_df.astype(float)
+                # increase class ID by 1, this prevents the function later to crash in case no classification has been
+                # run yet. Mind to revert class ID if necessary
+                class_v = class_v + 1
+
+            pos_df = pd.DataFrame(
+                {
+                    "class": class_v,
+                    "dummy": np.ones(len(idx), dtype=int),
+                    "x": coordinates[idx, 0],
+                    "y": coordinates[idx, 1],
+                    "z": coordinates[idx, 2],
+                }
+            )
             pos_df.to_csv(output_txt, sep="\t", header=False, index=False)
 
             # Create model files from the coordinates
@@ -1406,7 +2419,8 @@ class Motl:
 
         Notes
         -----
-        The rounding follows round-half-up convention, not the banker's rounding which is default in Python.
+        The rounding follows round-half-up convention, not the banker's rounding which is default in Python. See
+        :meth:`cryocat.mathutils.round_half_up` for more details.
 
         This method modifies the `df` attribute of the object.
 
@@ -1421,31 +2435,37 @@ class Motl:
         """
 
         # Python 0.5 rounding: round(1.5) = 2, BUT round(2.5) = 2, while in Matlab round(2.5) = 3
-        def round_and_recenter(row):
-            new_row = row.copy()
-            shifted_x = row["x"] + row["shift_x"]
-            shifted_y = row["y"] + row["shift_y"]
-            shifted_z = row["z"] + row["shift_z"]
-            new_row["x"] = float(decimal.Decimal(shifted_x).to_integral_value(rounding=decimal.ROUND_HALF_UP))
-            new_row["y"] = float(decimal.Decimal(shifted_y).to_integral_value(rounding=decimal.ROUND_HALF_UP))
-            new_row["z"] = float(decimal.Decimal(shifted_z).to_integral_value(rounding=decimal.ROUND_HALF_UP))
-            new_row["shift_x"] = shifted_x - new_row["x"]
-            new_row["shift_y"] = shifted_y - new_row["y"]
-            new_row["shift_z"] = shifted_z - new_row["z"]
-            return new_row
-
-        self.df = self.df.apply(round_and_recenter, axis=1)
+        shifted_coord = self.df.loc[:, ["x", "y", "z"]].to_numpy(dtype=float) + self.df.loc[
+            :, ["shift_x", "shift_y", "shift_z"]
+        ].to_numpy(dtype=float)
+        rounded_coord = mathutils.round_half_up(shifted_coord)
+
+        new_shifts = shifted_coord - rounded_coord
+
+        self.df = self.df.assign(
+            x=rounded_coord[:, 0],
+            y=rounded_coord[:, 1],
+            z=rounded_coord[:, 2],
+            shift_x=new_shifts[:, 0],
+            shift_y=new_shifts[:, 1],
+            shift_z=new_shifts[:, 2],
+        )
         warnings.warn("The coordinates for subtomogram extraction were changed, new extraction is necessary!")
 
     @classmethod
-    def merge_and_renumber(cls, motl_list):
+    def merge_and_renumber(cls, motl_list, motl_type="emmotl", n_workers=1):
         """Merge a list of Motl instances or paths to motl files to a single motl. It renumbers its particles and objects
          to ensure uniqueness.
 
         Parameters
         ----------
-        motl_list : list
-            A list of Motl instances or paths.
+        motl_list : list or str
+            A list of Motl instances or paths, or a glob pattern matching the motl files (e.g. "tm/*_tm.em"). The
+            files matching the pattern are merged in the sorted order of their paths.
+        motl_type : str, {'emmotl', 'dynamo', 'relion', 'stopgap', 'h5'}
+            Type of the motl files (see :meth:`cryocat.cryomotl.Motl.load`). Defaults to "emmotl".
+        n_workers : int, default=1
+            Number of threads used to read the motl files concurrently. Defaults to 1.
 
         Returns
         -------
@@ -1455,12 +2475,23 @@ class Motl:
         Raises
         ------
         UserInputError
-            If motl_list is not a list or is empty.
+            If motl_list is not a list or is empty, if the glob pattern does not match any file or if some of the
+            entries is neither Motl instance nor path.
+
+        Notes
+        -----
+        The Motl instances are not copied and the files are read only once. The merged columns are preallocated and
+        filled motl by motl, the object and particle numbers are shifted by offsets computed from the per-motl minima
+        and maxima only. The object_id values of a motl are shifted only if its smallest value is not larger than the
+        largest (shifted) value of the previous motl.
 
         """
 
-        merged_df = cls.create_empty_motl_df()
-        feature_add = 0
+        if isinstance(motl_list, str) and glob.has_magic(motl_list):
+            pattern = motl_list
+            motl_list = sorted(glob.glob(pattern))
+            if len(motl_list) == 0:
+                raise UserInputError(f"No motl files match the pattern {pattern}.")
 
         if not isinstance(motl_list, list) or len(motl_list) == 0:
             raise UserInputError(
@@ -1469,18 +2500,61 @@ class Motl:
             )
 
         for m in motl_list:
-            motl = cls.load(m)
-            feature_min = min(motl.df.loc[:, "object_id"])
+            if not isinstance(m, (Motl, str, os.PathLike)):
+                raise UserInputError(f"Provided entry {m} is neither Motl instance nor path to a motl file.")
+
+        def get_motl_df(m):
+            if isinstance(m, Motl):
+                return m.df
+            return cls.load(m, motl_type=motl_type).df
+
+        motl_dfs = run_in_parallel(get_motl_df, motl_list, n_workers=n_workers)
+
+        # the merged motl is compact if all the input motls were
+        is_compact = all(Motl.is_compact_df(m_df) for m_df in motl_dfs)
 
+        n_rows = np.array([m_df.shape[0] for m_df in motl_dfs])
+        starts = np.concatenate([[0], np.cumsum(n_rows)])
+
+        # the offsets depend on the previous motl only through its largest object_id
+        object_offsets = np.zeros((len(motl_dfs),))
+        feature_add = 0
+        for i, m_df in enumerate(motl_dfs):
+            if n_rows[i] == 0:
+                continue
+            object_ids = m_df["object_id"].to_numpy()
+            feature_min = np.nanmin(object_ids)
             if feature_min <= feature_add:
-                motl.df.loc[:, "object_id"] = motl.df.loc[:, "object_id"] + (feature_add - feature_min + 1)
+                object_offsets[i] = feature_add - feature_min + 1
+            feature_add = np.nanmax(object_ids) + object_offsets[i]
+
+        motl_dtypes = [m_df.dtypes.to_dict() for m_df in motl_dfs]
+        merged_columns = {}
+        for c in Motl.motl_columns:
+            dtypes = [m_dtypes[c] for m_dtypes in motl_dtypes]
+            if not is_compact:
+                dtypes.append(np.float64)
+            merged_columns[c] = np.empty((starts[-1],), dtype=np.result_type(*dtypes))
+
+        for i, m_df in enumerate(motl_dfs):
+            if len(set(motl_dtypes[i].values())) == 1:
+                # motls with a single dtype are copied as one array, without creating a Series for each column
+                values = m_df.to_numpy()
+                positions = m_df.columns.get_indexer(Motl.motl_columns)
+                for c, p in zip(Motl.motl_columns, positions):
+                    merged_columns[c][starts[i] : starts[i + 1]] = values[:, p]
+            else:
+                for c in Motl.motl_columns:
+                    merged_columns[c][starts[i] : starts[i + 1]] = m_df[c].to_numpy()
+
+        merged_columns["object_id"] += np.repeat(object_offsets, n_rows).astype(merged_columns["object_id"].dtype)
+        merged_columns["subtomo_id"] = np.arange(1, starts[-1] + 1).astype(merged_columns["subtomo_id"].dtype)
+        del motl_dfs
 
-            merged_df = pd.concat([merged_df, motl.df])
-            feature_add = max(motl.df.loc[:, "object_id"])
+        merged_motl = cls(pd.DataFrame(merged_columns, copy=False))
 
-        merged_motl = cls(merged_df)
-        merged_motl.renumber_particles()
-        merged_motl.df.reset_index(inplace=True, drop=True)
+        if is_compact:
+            merged_motl.compact()
 
         return merged_motl
 
@@ -1489,8 +2563,10 @@ class Motl:
 
         Parameters
         ----------
-        dimensions : str
-            Filepath or ndarray specifying tomograms' dimensions.
+        dimensions : str or pandas.DataFrame or array-like
+            Filepath, DataFrame or ndarray specifying tomograms' dimensions. See
+            :meth:`cryocat.ioutils.dimensions_load` for more information on formatting. If the dimensions do not
+            contain tomo_id, they are used for all tomograms.
         boundary_type : str, {"center", "whole"}
             Specify whether only the center should be part of the tomogram ("center") or the whole
             box ("whole"). In the latter case, the box_size have to be specified as well. Defaults to "center".
@@ -1499,7 +2575,8 @@ class Motl:
 
         Notes
         -----
-        This method modifies the `df` attribute of the object.
+        This method modifies the `df` attribute of the object. The dimensions are joined to the particles by tomo_id
+        (see :meth:`cryocat.cryomotl.Motl.get_values_by_feature`) and all tomograms are checked at once.
 
         Returns
         -------
@@ -1511,6 +2588,8 @@ class Motl:
             In case the boundary_type is "whole" and the box_size is not specified.
         UserInputError
             In case boundary_type is neither "whole" or "center".
+        UserInputError
+            In case the dimensions for some of the tomograms in the motl are missing.
 
         """
         dim = ioutils.dimensions_load(dimensions)
@@ -1528,21 +2607,17 @@ class Motl:
             raise UserInputError(f"Unknown type of boundaries: {boundary_type}")
 
         recentered = self.get_coordinates()
-        idx_list = []
-        for i, row in recentered.iterrows():
-            tn = row["tomo_id"]
-            tomo_dim = dim.loc[dim["tomo_id"] == tn, "x":"z"].reset_index(drop=True)
-            c_min = [c - boundary for c in row["x":"z"]]
-            c_max = [c + boundary for c in row["x":"z"]]
-            if (
-                (all(c_min) >= 0)
-                and (c_max[0] < tomo_dim["x"][0])
-                and (c_max[1] < tomo_dim["y"][0])
-                and (c_max[2] < tomo_dim["z"][0])
-            ):
-                idx_list.append(i)
 
-        self.df = self.df.iloc[idx_list].reset_index(drop=True)
+        if "tomo_id" in dim.columns:
+            tomo_dims = self.get_values_by_feature(dim, ["x", "y", "z"])
+        else:
+            tomo_dims = dim.loc[:, ["x", "y", "z"]].to_numpy()[:1, :]
+
+        c_min = recentered - boundary
+        c_max = recentered + boundary
+        within_bounds = np.all(c_min >= 0, axis=1) & np.all(c_max < tomo_dims, axis=1)
+
+        self.df = self.df.iloc[np.flatnonzero(within_bounds)].reset_index(drop=True)
 
         print(f"Removed {original_size - len(self.df)} particles.")
         print(f"Original size {original_size}, new_size {len(self.df)}")
@@ -1592,7 +2667,7 @@ class Motl:
         self.df.reset_index(inplace=True, drop=True)
 
     @staticmethod
-    def recenter_to_subparticle(input_motl, input_mask, rotation=None):
+    def recenter_to_subparticle(input_motl, input_mask=None, rotation=None, mask_center=None, box_size=None):
         """Computes the center of mass of the provided binary mask and computes the necessary shift between the mask box
         center and the center of mass. This shift is applied to the motl positions. If rotation is specified it applies
         it to the shifted particles as well.
@@ -1601,21 +2676,41 @@ class Motl:
         ----------
         input_motl: Motl or str or Pandas.DataFrame
             Input motl to apply the recentering to (see :meth:`cryocat.cryomotl.Motl.load` for more details on format)
-        input_mask : str
+        input_mask : str or numpy.ndarray or list, optional
             Binary mask specified either as a file path or ndarray. The box size of the mask
-            should correspond to the box size of the reference on which the mask was placed.
+            should correspond to the box size of the reference on which the mask was placed. A list of masks can be
+            provided to recenter the motl to several subparticles at once. Either input_mask or mask_center has to be
+            specified. Defaults to None.
         rotation : scipy.spatial.transform._rotation.Rotation
             Rotation to apply on the new positions. Defaults to None.
+        mask_center : array-like, optional
+            Precomputed center(s) of the subparticle(s) in the box of the reference, either of shape (3,) or (N, 3). If
+            specified, the masks are not needed. Defaults to None.
+        box_size : int or array-like, optional
+            Box size of the reference, required if mask_center is specified. Defaults to None.
+
+        Returns
+        -------
+        :class:`Motl` or list
+            Motl with shifted coordinates. If a list of masks or an array of shape (N, 3) with mask centers is
+            specified, a list with one motl for each of them is returned.
+
+        Raises
+        ------
+        UserInputError
+            If neither input_mask nor mask_center is specified or if mask_center is specified without box_size.
 
         Notes
         -----
-        This method modifies the `df` attribute of the object.
+        The rotations of the particles are computed only once and shared by all subparticles. The masks are not
+        written to the disk, their centers are computed from the arrays in memory.
 
-
-        Returns
-        -------
-        :class:`Motl`
-            Motl with shifted coordinates.
+        Examples
+        --------
+        >>> entry_mask = cryomask.spherical_mask(64, 3, center=[32, 32, 50])
+        >>> exit_mask = cryomask.spherical_mask(64, 3, center=[32, 32, 14])
+        >>> motl_entry, motl_exit = Motl.recenter_to_subparticle(motl, [entry_mask, exit_mask])
+        >>> motl_entry = Motl.recenter_to_subparticle(motl, mask_center=[32, 32, 50], box_size=64)
 
         """
 
@@ -1624,67 +2719,143 @@ class Motl:
         else:
             motl_orig = Motl.load(input_motl)
 
-        input_mask = cryomap.read(input_mask)
-        old_center = np.array(input_mask.shape) / 2
-        mask_center = cryomask.get_mass_center(input_mask)  # find center of mask
-        shifts = mask_center - old_center  # get shifts
-        print(shifts)
-        # change shifts in the motl accordingly
-        motl = motl_orig.shift_positions(shifts, inplace=False)
-        motl.update_coordinates()
+        if mask_center is not None:
+            if box_size is None:
+                raise UserInputError("The box size has to be specified together with the mask center.")
+            is_batch = np.ndim(mask_center) == 2
+            mask_centers = np.atleast_2d(np.asarray(mask_center, dtype=float))
+            old_centers = np.broadcast_to(np.asarray(box_size, dtype=float) / 2, mask_centers.shape)
+        elif input_mask is not None:
+            is_batch = isinstance(input_mask, (list, tuple))
+            masks = [cryomap.read(m) for m in (input_mask if is_batch else [input_mask])]
+            mask_centers = np.array([cryomask.get_mass_center(m) for m in masks])  # find center of mask
+            old_centers = np.array([np.array(m.shape) / 2 for m in masks])
+        else:
+            raise UserInputError("Either the mask or the mask center has to be specified.")
+
+        shifts = mask_centers - old_centers  # get shifts
+
+        # the rotations are cached in motl_orig, so all shifts below reuse the same rotation evaluation
+        recentered_motls = []
+        for shift in shifts:
+            # change shifts in the motl accordingly
+            motl = motl_orig.shift_positions(shift, inplace=False)
+            motl.update_coordinates()
+
+            if rotation is not None:
+                motl.apply_rotation(rotation)
 
-        if rotation is not None:
-            motl.apply_rotation(rotation)
+            recentered_motls.append(motl)
 
-        return motl
+        if is_batch:
+            return recentered_motls
+        else:
+            return recentered_motls[0]
 
-    def apply_tomo_rotation(self, rotation_angles, tomo_id, tomo_dim):
+    def apply_tomo_rotation(self, rotation_angles, tomo_id=None, tomo_dim=None):
         """Apply tomogram rotation to the corresponding particles in the motl. The rotation angles can come e.g. from
-        trimvol command or from slicer in etomo. Currently works only for one tomogram.
+        trimvol command or from slicer in etomo.
 
         Parameters
         ----------
         rotation_angles : array-like
-            Rotation angles in degrees corresponding to rotation around x, y, and z axis.
-        tomo_id : int
-            Tomo ID of the particles that should be rotated and shifted.
-        tomo_dim : array-like
-            Dimensions of the tomogram in x, y, z.
+            Rotation angles in degrees corresponding to rotation around x, y, and z axis. If multiple tomograms are
+            specified, it can be an array of shape (N, 3) with rotation angles for each of them.
+        tomo_id : int or array-like, optional
+            Tomo ID(s) of the particles that should be rotated and shifted. If not specified, the tomograms from
+            tomo_dim are used if it contains tomo_id, otherwise all tomograms in the motl. Defaults to None.
+        tomo_dim : str or pandas.DataFrame or array-like
+            Dimensions of the tomogram in x, y, z. If multiple tomograms are specified, it can be an array of shape
+            (N, 3) with dimensions for each of them (in the order of tomo_id). It can be also specified in any format
+            supported by :meth:`cryocat.ioutils.dimensions_load` - if it contains tomo_id, the dimensions are joined
+            to the particles by it.
 
         Returns
         -------
         feature_motl : Motl
-            A new motl with rotated and shifted particles.
+            A new motl with rotated and shifted particles. In case of multiple tomograms, the particles are ordered
+            by the order of tomo_id.
+
+        Raises
+        ------
+        UserInputError
+            If the tomo_dim is not specified, if tomo_id contains duplicates or if the dimensions for some of the
+            tomograms are missing.
+
+        Notes
+        -----
+        All tomograms are processed at once - the rotations of the tomograms are created once and assigned to their
+        particles.
+
+        Examples
+        --------
+        >>> dims = ioutils.dimensions_load("dimensions.txt")  # tomo_id x y z
+        >>> rotated_motl = motl.apply_tomo_rotation(angles, dims["tomo_id"], dims)
+
         """
 
-        def rotate_points(points, rot, tomo_dim):
-            dim = np.asarray(tomo_dim)
-            points = points - dim / 2
-            points = rot.apply(points) + dim / 2
-            return points
+        if tomo_dim is None:
+            raise UserInputError("The dimensions of the tomograms have to be specified.")
+
+        if isinstance(tomo_dim, (str, pd.DataFrame)):
+            tomo_dim = ioutils.dimensions_load(tomo_dim)
+        elif np.asarray(tomo_dim).ndim == 2 and np.asarray(tomo_dim).shape[1] == 4:
+            tomo_dim = ioutils.dimensions_load(np.asarray(tomo_dim))
+        else:
+            tomo_dim = np.atleast_2d(tomo_dim)
+
+        if tomo_id is not None:
+            tomo_ids = np.atleast_1d(tomo_id)
+        elif isinstance(tomo_dim, pd.DataFrame) and "tomo_id" in tomo_dim.columns:
+            tomo_ids = tomo_dim["tomo_id"].to_numpy()
+        else:
+            tomo_ids = self.get_unique_values("tomo_id")
+
+        tomo_index = pd.Index(tomo_ids)
+        if not tomo_index.is_unique:
+            raise UserInputError("The tomo_id contains duplicated values.")
+
+        # particles of the selected tomograms, ordered by the order of tomo_ids
+        tomo_positions = tomo_index.get_indexer(self.get_feature("tomo_id")[:, 0])
+        particle_idx = np.flatnonzero(tomo_positions >= 0)
+        particle_idx = particle_idx[np.argsort(tomo_positions[particle_idx], kind="stable")]
+        tomo_positions = tomo_positions[particle_idx]
+
+        feature_motl = Motl(self.df.iloc[particle_idx].reset_index(drop=True))
+        if particle_idx.shape[0] == 0:
+            return feature_motl
+
+        if isinstance(tomo_dim, pd.DataFrame):
+            if "tomo_id" in tomo_dim.columns:
+                dims = feature_motl.get_values_by_feature(tomo_dim, ["x", "y", "z"]).astype(float)
+            else:
+                dims = tomo_dim[["x", "y", "z"]].to_numpy(dtype=float)[[0] * particle_idx.shape[0], :]
+        else:
+            dims = tomo_dim[np.minimum(tomo_positions, tomo_dim.shape[0] - 1), :].astype(float)
+
+        # one rotation per tomogram (x, y, z angles), assigned to the particles
+        rotation_angles = np.atleast_2d(rotation_angles)[: tomo_ids.shape[0], :]
+        tomo_rotations = rot.from_euler("zyx", angles=rotation_angles[:, ::-1], degrees=True)
+        coord_rot = tomo_rotations[np.minimum(tomo_positions, rotation_angles.shape[0] - 1)]
+
+        def rotate_points(points):
+            return coord_rot.apply(points - dims / 2) + dims / 2
 
-        feature_motl = self.get_motl_subset(tomo_id, feature_id="tomo_id")
-        coord_rot = rot.from_euler(
-            "zyx", angles=[rotation_angles[2], rotation_angles[1], rotation_angles[0]], degrees=True
-        )
         coord = feature_motl.get_coordinates()
-        coord = rotate_points(coord, coord_rot, tomo_dim)
+        particle_rotations = feature_motl.get_rotations()
+        rotated_coord = rotate_points(coord)
 
-        shift_x_coord = feature_motl.shift_positions([1, 0, 0], inplace=False).get_coordinates()
-        shift_y_coord = feature_motl.shift_positions([0, 1, 0], inplace=False).get_coordinates()
-        shift_z_coord = feature_motl.shift_positions([0, 0, 1], inplace=False).get_coordinates()
+        # particle axes are shifted and rotated the same way as the positions
+        x_vector = rotate_points(coord + particle_rotations.apply([1, 0, 0])) - rotated_coord
+        y_vector = rotate_points(coord + particle_rotations.apply([0, 1, 0])) - rotated_coord
+        z_vector = rotate_points(coord + particle_rotations.apply([0, 0, 1])) - rotated_coord
 
-        x_vector = rotate_points(shift_x_coord, coord_rot, tomo_dim) - coord
-        y_vector = rotate_points(shift_y_coord, coord_rot, tomo_dim) - coord
         phi_angle = geom.angle_between_vectors(x_vector, y_vector)
-        rot_angles = geom.normals_to_euler_angles(
-            rotate_points(shift_z_coord, coord_rot, tomo_dim) - coord, output_order="zxz"
-        )
+        rot_angles = geom.normals_to_euler_angles(z_vector, output_order="zxz")
         rot_angles[:, 0] = phi_angle
 
-        print(x_vector[0], y_vector[0])
         feature_motl.fill({"angles": rot_angles})
-        feature_motl.fill({"coord": coord})
+        feature_motl.fill({"coord": rotated_coord})
 
         return feature_motl
 
@@ -1709,25 +2880,21 @@ class Motl:
             A new instance of motl with shifted coordinate (only if inplace is set to False).
         """
 
-        def shift_coords(row):
-            v = np.array(shift)
-            euler_angles = np.array([[row["phi"], row["theta"], row["psi"]]])
-            orientations = rot.from_euler(seq="zxz", angles=euler_angles, degrees=True)
-            rshifts = orientations.apply(v)
+        # all particles are rotated at once with the (cached) rotations of the motl
+        rshifts = self.get_rotations().apply(np.asarray(shift, dtype=float))
+        new_motl = self if inplace else copy.deepcopy(self)
+        new_motl.df = new_motl.df.assign(
+            shift_x=new_motl.df["shift_x"].to_numpy() + rshifts[:, 0],
+            shift_y=new_motl.df["shift_y"].to_numpy() + rshifts[:, 1],
+            shift_z=new_motl.df["shift_z"].to_numpy() + rshifts[:, 2],
+        ).reset_index(drop=True)
 
-            row["shift_x"] = row["shift_x"] + rshifts[0][0]
-            row["shift_y"] = row["shift_y"] + rshifts[0][1]
-            row["shift_z"] = row["shift_z"] + rshifts[0][2]
-            return row
-
-        if inplace:
-            self.df = self.df.apply(shift_coords, axis=1).reset_index(drop=True)
-        else:
-            new_motl = copy.deepcopy(self)
-            new_motl.df = new_motl.df.apply(shift_coords, axis=1).reset_index(drop=True)
+        if not inplace:
             return new_motl
 
-    def split_in_asymmetric_subunits(self, symmetry, xyz_shift):
+    def split_in_asymmetric_subunits(
+        self, symmetry, xyz_shift, output_path=None, motl_type="emmotl", chunk_rows=16384
+    ):
         """Split the motive list into assymetric subunits.
 
         Parameters
@@ -1739,11 +2906,30 @@ class Motl:
         xyz_shift : numpy.ndarray
             Shift by which the center of current particles should be shifted to be centered at first
             subunit.
+        output_path : str, optional
+            If specified, the expanded particle list is not returned but written to this file block by block, i.e.
+            the expanded particle list is never stored in the memory as a whole. Defaults to None.
+        motl_type : str, {"emmotl", "h5"}
+            Format of the output file, used only if output_path is specified. Defaults to "emmotl".
+        chunk_rows : int, default=16384
+            Number of particles that are expanded at once. Only these particles and their subunits are stored in the
+            intermediate arrays. Defaults to 16384.
 
         Returns
         -------
-        :class:`Motl`
-            Splitted particle list.
+        :class:`Motl` or None
+            Splitted particle list, None if output_path is specified.
+
+        Raises
+        ------
+        UserInputError
+            If the output format does not support writing by blocks.
+
+        Notes
+        -----
+        The new particles are sorted by the original subtomo_id, the subunits of one particle are next to each other.
+        The original subtomo_id is stored in geom5 and the number of the subunit in geom2. The coordinates are
+        updated (see :meth:`cryocat.cryomotl.Motl.update_coordinates`).
 
         Warnings
         --------
@@ -1757,12 +2943,12 @@ class Motl:
             elif symmetry.lower().startswith("d"):
                 s_type = 2  # d symmetry
             else:
-                ValueError("Unknown symmetry - currently only c and are supported!")
+                raise ValueError("Unknown symmetry - currently only c and are supported!")
         elif isinstance(symmetry, (int, float)):
             s_type = 1  # c symmetry
             nfold = symmetry
         else:
-            ValueError(
+            raise ValueError(
                 "The symmetry has to be specified as a string (starting with c or d) or as a number (float, int)!"
             )
 
@@ -1806,39 +2992,116 @@ class Motl:
         center_shift[:, 1] = rot_rho * np.sin(rep_the)
         center_shift[:, 2] = rep_z
 
-        new_motl_df = pd.concat([self.df] * n_subunits)
+        # particles are expanded in the order of their subtomo_id, each particle by blocks of n_subunits rows
+        order = np.argsort(self.df["subtomo_id"].to_numpy(), kind="stable")
+        n_rows = order.shape[0] * n_subunits
+        chunk_rows = max(1, int(chunk_rows))
 
-        new_motl_df["geom5"] = new_motl_df["subtomo_id"]
-        new_motl_df = new_motl_df.sort_values(by="subtomo_id")
-        new_motl_df["geom2"] = np.tile(np.arange(1, n_subunits + 1).reshape(n_subunits, 1), (len(self.df), 1))
+        blocks = (
+            Motl.get_subunits_block(self.df.take(order[start : start + chunk_rows]), new_angles, center_shift, start)
+            for start in range(0, max(order.shape[0], 1), chunk_rows)
+        )
 
-        euler_angles = new_motl_df[["phi", "theta", "psi"]]
-        rotations = rot.from_euler(seq="zxz", angles=euler_angles, degrees=True)
-        center_shift = np.tile(center_shift, (len(self.df), 1))
-        new_angles = np.tile(new_angles, (len(self.df), 1))
-        new_motl_df.loc[:, ["shift_x", "shift_y", "shift_z"]] = new_motl_df.loc[
-            :, ["shift_x", "shift_y", "shift_z"]
-        ] + rotations.apply(center_shift)
+        if output_path is not None:
+            if motl_type.lower() == "emmotl":
+                EmMotl.write_out_blocks(output_path, blocks, n_rows)
+            elif motl_type.lower() == "h5":
+                H5Motl.write_out_blocks(output_path, blocks, n_rows)
+            else:
+                raise UserInputError(f"Writing by blocks is supported only for emmotl and h5 formats, not {motl_type}.")
 
-        new_rotations = rotations * rot.from_euler(seq="zxz", angles=new_angles, degrees=True)
-        new_motl_df.loc[:, ["phi", "theta", "psi"]] = new_rotations.as_euler(seq="zxz", degrees=True)
+            warnings.warn("The coordinates for subtomogram extraction were changed, new extraction is necessary!")
+            return None
 
-        new_motl_df["subtomo_id"] = np.arange(1, len(new_motl_df) + 1)
-        new_motl = Motl(new_motl_df)
-        new_motl.update_coordinates()
-        new_motl.df.reset_index(inplace=True, drop=True)
-        return new_motl
+        # the output is preallocated and filled by blocks
+        new_columns = {}
+        first_row = 0
+        for block_df in blocks:
+            if not new_columns:
+                new_columns = {c: np.empty((n_rows,), dtype=block_df[c].dtype) for c in block_df.columns}
+            for c in block_df.columns:
+                new_columns[c][first_row : first_row + block_df.shape[0]] = block_df[c].to_numpy()
+            first_row += block_df.shape[0]
+
+        warnings.warn("The coordinates for subtomogram extraction were changed, new extraction is necessary!")
+        return Motl(pd.DataFrame(new_columns, columns=self.df.columns, copy=False))
+
+    @staticmethod
+    def get_subunits_block(motl_df, subunit_angles, center_shift, first_particle=0):
+        """Expands each particle in motl_df into its asymmetric subunits. It is used by
+        :meth:`cryocat.cryomotl.Motl.split_in_asymmetric_subunits` to process the particle list by blocks.
+
+        Parameters
+        ----------
+        motl_df : pandas.DataFrame
+            Particles to be expanded.
+        subunit_angles : numpy.ndarray
+            Euler angles (zxz, in degrees) of the subunits relative to the particle, shape (n_subunits, 3).
+        center_shift : numpy.ndarray
+            Position of the subunits relative to the particle center, shape (n_subunits, 3).
+        first_particle : int, default=0
+            Number of particles expanded before this block - the new subtomo_id values start at
+            first_particle * n_subunits + 1. Defaults to 0.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Particle list with n_subunits rows per particle. The original subtomo_id is stored in geom5, the number of
+            the subunit in geom2, the new positions are already rounded (see
+            :meth:`cryocat.cryomotl.Motl.update_coordinates`).
+
+        """
+
+        n_subunits = subunit_angles.shape[0]
+        n_particles = motl_df.shape[0]
+
+        new_columns = {c: np.repeat(motl_df[c].to_numpy(), n_subunits) for c in motl_df.columns}
+        new_columns["geom5"] = new_columns["subtomo_id"]
+        new_columns["geom2"] = np.tile(np.arange(1, n_subunits + 1), n_particles)
+        new_columns["subtomo_id"] = np.arange(
+            first_particle * n_subunits + 1, (first_particle + n_particles) * n_subunits + 1
+        )
+
+        # the rotations are computed once per particle and subunit and expanded by indexing
+        rotations = rot.from_euler(seq="zxz", angles=motl_df[["phi", "theta", "psi"]].to_numpy(), degrees=True)
+        subunit_rotations = rot.from_euler(seq="zxz", angles=subunit_angles, degrees=True)
+        subunit_rotations = subunit_rotations[np.tile(np.arange(n_subunits), n_particles)]
+        if n_particles > 0:
+            rotations = rotations[np.repeat(np.arange(n_particles), n_subunits)]
+
+        shifts = np.repeat(motl_df[["shift_x", "shift_y", "shift_z"]].to_numpy(dtype=float), n_subunits, axis=0)
+        shifts += rotations.apply(np.tile(center_shift, (n_particles, 1)))
+
+        new_rotations = rotations * subunit_rotations
+        new_angles = new_rotations.as_euler(seq="zxz", degrees=True)
+        for i, c in enumerate(["phi", "theta", "psi"]):
+            new_columns[c] = new_angles[:, i].astype(np.result_type(new_columns[c].dtype, np.float32), copy=False)
+
+        # same as update_coordinates
+        shifted_coord = np.repeat(motl_df[["x", "y", "z"]].to_numpy(dtype=float), n_subunits, axis=0) + shifts
+        rounded_coord = mathutils.round_half_up(shifted_coord)
+        shifted_coord -= rounded_coord
+        for i, c in enumerate(["x", "y", "z"]):
+            new_columns[c] = rounded_coord[:, i]
+            new_columns[f"shift_{c}"] = shifted_coord[:, i]
+
+        return pd.DataFrame(new_columns, columns=motl_df.columns, copy=False)
 
 
 class EmMotl(Motl):
-    def __init__(self, input_motl=None, header=None):
+    # size of the EM header in bytes, the types of the data are given by emfile.specs.dtype_spec
+    header_size = 512
+    # number of particles converted at once while reading
+    read_block_rows = 1048576
+
+    def __init__(self, input_motl=None, header=None, keep_float32=False):
         if input_motl is not None:
             if isinstance(input_motl, EmMotl):
                 self = copy.deepcopy(input_motl)
             elif isinstance(input_motl, pd.DataFrame):
                 self.check_df_type(input_motl)
             elif isinstance(input_motl, str):
-                self.df, self.header = self.read_in(input_motl)
+                self.df, self.header = self.read_in(input_motl, keep_float32=keep_float32 or self.compact_mode)
             else:
                 raise UserInputError(
                     f"Provided input_motl is neither DataFrame nor path to the motl file: {input_motl}."
@@ -1871,13 +3134,18 @@ class EmMotl(Motl):
         raise ValueError("Provided motl does not have the correct format.")
 
     @staticmethod
-    def read_in(emfile_path):
+    def read_in(emfile_path, keep_float32=False):
         """Reads in an EM file and returns a pandas DataFrame and header.
 
         Parameters
         ----------
         emfile_path : str
             The path to the EM file.
+        keep_float32 : bool, default=False
+            If True, the values are kept in the single precision as they are stored in the file and the DataFrame
+            uses directly the memory-mapped file, i.e. the data are read only once they are accessed and the memory
+            usage corresponds to the file size. If False, the values are converted to double precision. Defaults to
+            False.
 
         Returns
         -------
@@ -1889,23 +3157,87 @@ class EmMotl(Motl):
         Raises
         ------
         UserInputError
-            If the provided file does not exist or if it contains a different number of columns than expected.
+            If the provided file does not exist, if it contains a different number of columns than expected, if its
+            data type is unknown or complex or if it is incomplete.
+
+        Notes
+        -----
+        Only the header is parsed by emfile. The particles are read by blocks of
+        :attr:`cryocat.cryomotl.EmMotl.read_block_rows` rows and converted directly into the final array, so the peak
+        memory does not include the single precision copy of the whole file. With keep_float32 the file is
+        memory-mapped in copy-on-write mode, i.e. changing the values does not change the file.
 
         """
 
         if not os.path.isfile(emfile_path):
             raise UserInputError(f"Provided file {emfile_path} does not exist.")
 
-        header, parsed_emfile = emfile.read(emfile_path)
-        if not len(parsed_emfile[0][0]) == 20:
-            raise UserInputError(
-                f"Provided file contains {len(parsed_emfile[0][0])} columns, while 20 columns are expected."
-            )
+        header, _ = emfile.read(emfile_path, header_only=True)
+        if not header["xdim"] == 20:
+            raise UserInputError(f"Provided file contains {header['xdim']} columns, while 20 columns are expected.")
+
+        if header["dtype"] not in emfile.specs.dtype_spec:
+            raise UserInputError(f"Provided file contains data of unknown type {header['dtype']}.")
+
+        dtype = np.dtype(emfile.specs.dtype_spec[header["dtype"]])
+        if dtype.shape != ():
+            raise UserInputError("Provided file contains complex data which are not supported.")
+        n_particles = header["ydim"] * header["zdim"]
+        expected_size = EmMotl.header_size + n_particles * 20 * dtype.itemsize
+
+        if os.path.getsize(emfile_path) < expected_size:
+            raise UserInputError(f"Provided file {emfile_path} is incomplete.")
 
-        motl_df = pd.DataFrame(data=parsed_emfile[0], dtype=float, columns=Motl.motl_columns)
+        if keep_float32 and dtype == np.float32 and n_particles > 0:
+            motl_array = np.memmap(
+                emfile_path, dtype=dtype, mode="c", offset=EmMotl.header_size, shape=(n_particles, 20)
+            )
+        else:
+            # the file is converted by blocks directly into the final array
+            motl_array = np.empty((n_particles, 20), dtype=np.float32 if keep_float32 else float)
+            with open(emfile_path, "rb") as em_file:
+                em_file.seek(EmMotl.header_size)
+                for start in range(0, n_particles, EmMotl.read_block_rows):
+                    stop = min(start + EmMotl.read_block_rows, n_particles)
+                    block = np.fromfile(em_file, dtype=dtype, count=(stop - start) * 20)
+                    motl_array[start:stop, :] = block.reshape((stop - start, 20))
+
+        # the particles are in rows, the DataFrame uses the transposed array as its (only) block without copy
+        motl_df = pd.DataFrame(data=motl_array, columns=Motl.motl_columns, copy=False)
 
         return motl_df, header
 
+    @staticmethod
+    def iter_chunks(emfile_path, chunk_rows=1000000):
+        """Reads in an EM file by chunks of particles.
+
+        Parameters
+        ----------
+        emfile_path : str
+            The path to the EM file.
+        chunk_rows : int, default=1000000
+            Maximal number of particles in one chunk. Defaults to 1000000.
+
+        Yields
+        ------
+        :class:`EmMotl`
+            Motl with the next chunk of the particles.
+
+        Notes
+        -----
+        The file is memory-mapped (see :meth:`cryocat.cryomotl.EmMotl.read_in`) and only the particles of the current
+        chunk are converted to double precision.
+
+        """
+
+        motl_df, header = EmMotl.read_in(emfile_path, keep_float32=True)
+
+        for start in range(0, motl_df.shape[0], chunk_rows):
+            chunk_df = motl_df.iloc[start : start + chunk_rows]
+            if not EmMotl.compact_mode:
+                chunk_df = chunk_df.astype(float)
+            yield EmMotl(chunk_df, header=header)
+
     def write_out(self, output_path):
         """Writes out the dataframe as emfile.
 
@@ -1925,6 +3257,49 @@ class EmMotl(Motl):
         self.header = {}  # FIXME fails on writing back the header
         emfile.write(output_path, motl_array, self.header, overwrite=True)
 
+    @staticmethod
+    def write_out_blocks(output_path, blocks, n_rows):
+        """Writes out a particle list given by blocks as emfile. Only one block is kept in the memory at a time.
+
+        Parameters
+        ----------
+        output_path : str
+            Name of the file to be written out (including the path).
+        blocks : iterable of pandas.DataFrame
+            Consecutive parts of the particle list, each with columns :attr:`cryocat.cryomotl.Motl.motl_columns`.
+            Other columns are not written out.
+        n_rows : int
+            Total number of particles in all blocks.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        UserInputError
+            If some of the blocks do not contain all columns from :attr:`cryocat.cryomotl.Motl.motl_columns` or if
+            the blocks do not contain n_rows particles in total.
+
+        """
+
+        # header only, the ydim is set to the final number of particles
+        n_columns = len(Motl.motl_columns)
+        emfile.write(output_path, np.empty((1, 0, n_columns), dtype=np.single), {"ydim": n_rows}, overwrite=True)
+
+        written_rows = 0
+        with open(output_path, "ab") as em_file:
+            for block_df in blocks:
+                missing_columns = [c for c in Motl.motl_columns if c not in block_df.columns]
+                if missing_columns:
+                    raise UserInputError(f"The particle list does not contain columns {missing_columns}.")
+
+                block_df[Motl.motl_columns].fillna(0.0).to_numpy(dtype=np.single).tofile(em_file)
+                written_rows += block_df.shape[0]
+
+        if written_rows != n_rows:
+            raise UserInputError(f"Expected {n_rows} particles but {written_rows} particles were written out.")
+
 
 class RelionMotl(Motl):
     default_version = 3.1
@@ -1982,6 +3357,10 @@ class RelionMotl(Motl):
         "rlnClassNumber",
     ]
 
+    # patterns for parsing the ids from the names of tomograms and subtomograms
+    first_number_pattern = re.compile(r"(\d+)")
+    second_number_pattern = re.compile(r"\d+\D+(\d+)")
+
     def __init__(self, input_motl=None, version=None, pixel_size=None, binning=None, optics_data=None):
         super().__init__()
         self.version = version
@@ -2012,6 +3391,9 @@ class RelionMotl(Motl):
 
         self.set_version_specific_names()
 
+        if self.compact_mode:
+            self.compact()
+
     def set_pixel_size(self):
         """Sets the pixel size of the object (self.pixel_size). The function first checks if the pixel size has already
         been set, and if it has not, then it will try to get the pixel size from either the self.relion_df or
@@ -2171,49 +3553,193 @@ class RelionMotl(Motl):
 
         Notes
         -----
-        Currently returns only optics data for Relion version 3.1 and higher.
-
-        TODO: Add support for Relion 3.0 and lower.
+        Currently returns only optics data for Relion version 3.1 and higher.
+
+        TODO: Add support for Relion 3.0 and lower.
+
+        """
+
+        if "data_optics" in input_list:
+            return input_list.index("data_optics")
+        else:
+            return None
+
+    def read_in(self, input_path):
+        """Reads in a starfile and returns the particle list, version of the starfile and optics data if present.
+
+        Parameters
+        ----------
+        input_path : str
+            The path to the starfile.
+
+        Returns
+        -------
+        frames : pandas.DataFrame
+            Pandas.DataFrame containing the particle list in relion format.
+        version : float
+            The version extracted from the starfile. See meth:`cryocat.cryomotl.RelionMotl.get_version_from_file` for
+            more info.
+        optics_df : pandas.DataFrame or None
+            Pandas.DataFrame containing optics if available, otherwise None.
+
+        """
+
+        frames, specifiers, _ = starfileio.Starfile.read(input_path)
+
+        version = RelionMotl.get_version_from_file(frames, specifiers)
+
+        data_id = RelionMotl._get_data_particles_id(specifiers)
+        optics_id = RelionMotl._get_optics_id(specifiers)
+
+        optics_df = None
+        if optics_id is not None and self.optics_data is None:
+            optics_df = frames[optics_id]
+
+        return frames[data_id], version, optics_df
+
+    @staticmethod
+    def iter_chunks(input_path, chunk_rows=1000000, global_renumbering=False):
+        """Reads in a starfile by chunks of particles and converts them to motls.
+
+        Parameters
+        ----------
+        input_path : str
+            The path to the starfile.
+        chunk_rows : int, default=1000000
+            Maximal number of particles in one chunk. Defaults to 1000000.
+        global_renumbering : bool, default=False
+            If True, the particles are renumbered exactly as by :meth:`cryocat.cryomotl.RelionMotl.parse_subtomo_id`
+            for the whole particle list, which requires reading the subtomogram numbers and half-sets of all particles
+            first. If False, the file is read only once and the renumbering is decided chunk by chunk (see Notes).
+            Defaults to False.
+
+        Yields
+        ------
+        :class:`RelionMotl`
+            Motl with the next chunk of the particles. The optics data of the file are stored in `optics_data` of
+            each chunk.
+
+        Raises
+        ------
+        UserInputError
+            If the starfile does not contain particle list.
+
+        Notes
+        -----
+        Only the optics data and the particle list are read from the starfile, the particle list directly from its
+        position in the file (see :meth:`cryocat.starfileio.Starfile.iter_read`). The version is determined from the
+        first chunk and used for all of them. The original subtomogram numbers are stored in `geom3` and the
+        renumbering continues from one chunk to the next, so the new numbers are unique and increasing:
+
+        - if the particle list contains rlnRandomSubset, the particles are numbered by their half-sets (see
+          :meth:`cryocat.cryomotl.RelionMotl.get_halfset_subtomo_ids`),
+        - otherwise the subtomogram numbers are kept as long as they increase, from the first chunk where they do not
+          the particles are numbered in sequence after the previous particle.
+
+        This corresponds to :meth:`cryocat.cryomotl.Motl.load` for particle lists with both half-sets, with
+        increasing subtomogram numbers or with consecutive numbers starting from 1 in each tomogram. Only the current
+        chunk is held in memory. With global_renumbering the
+        result is the same as with :meth:`cryocat.cryomotl.Motl.load` in all cases, at the cost of one more pass over
+        the file and memory for the subtomogram numbers of all particles.
 
         """
 
-        if "data_optics" in input_list:
-            return input_list.index("data_optics")
-        else:
-            return None
+        index = starfileio.Starfile.get_index(input_path)
+        specifiers = [block["specifier"] for block in index]
+        data_id = RelionMotl._get_data_particles_id(specifiers)
+        optics_id = RelionMotl._get_optics_id(specifiers)
 
-    def read_in(self, input_path):
-        """Reads in a starfile and returns the particle list, version of the starfile and optics data if present.
+        optics_df = None
+        if optics_id is not None:
+            optics_df = starfileio.Starfile.read_rows(input_path, index[optics_id])
+
+        version = None
+        renumbering = None
+        n_previous = 0
+        previous_id = 0
+
+        for chunk_df in starfileio.Starfile.iter_read(input_path, data_id, chunk_rows=chunk_rows):
+            if version is None:
+                version = RelionMotl.get_version_from_file([chunk_df], [specifiers[data_id]])
+            relion_motl = RelionMotl(chunk_df, version=version, optics_data=optics_df)
+
+            if renumbering is None:
+                if global_renumbering:
+                    renumbering = relion_motl._get_renumbering(input_path, data_id, chunk_rows)
+                elif "rlnRandomSubset" in index[data_id]["columns"]:
+                    renumbering = "halfsets"
+                else:
+                    renumbering = "increasing"
+
+            # the renumbering of the particles continues from the previous chunks
+            subtomo_idx = relion_motl.df["geom3"].to_numpy()
+            if renumbering == "increasing" and subtomo_idx.shape[0] > 0:
+                if subtomo_idx[0] <= previous_id or np.any(np.diff(subtomo_idx) <= 0):
+                    renumbering = "sequence"
+                    n_previous = int(previous_id)
+
+            if renumbering == "halfsets":
+                halfset_num = chunk_df["rlnRandomSubset"].values % 2
+                subtomo_idx = RelionMotl.get_halfset_subtomo_ids(halfset_num, previous_id)
+            elif renumbering == "sequence":
+                subtomo_idx = np.arange(n_previous + 1, n_previous + chunk_df.shape[0] + 1)
+
+            if chunk_df.shape[0] > 0:
+                relion_motl.df["subtomo_id"] = subtomo_idx
+                relion_motl.relion_df["ccSubtomoID"] = subtomo_idx
+                previous_id = subtomo_idx[-1]
+            n_previous += chunk_df.shape[0]
+
+            yield relion_motl
+
+    def _get_renumbering(self, input_path, data_id, chunk_rows):
+        """Decides how the particles of the whole particle list are renumbered by
+        :meth:`cryocat.cryomotl.RelionMotl.parse_subtomo_id`, reading only the subtomogram numbers and half-sets.
 
         Parameters
         ----------
         input_path : str
             The path to the starfile.
+        data_id : int
+            The position of the particle list in the starfile.
+        chunk_rows : int
+            Maximal number of particles read at once.
 
         Returns
         -------
-        frames : pandas.DataFrame
-            Pandas.DataFrame containing the particle list in relion format.
-        version : float
-            The version extracted from the starfile. See meth:`cryocat.cryomotl.RelionMotl.get_version_from_file` for
-            more info.
-        optics_df : pandas.DataFrame or None
-            Pandas.DataFrame containing optics if available, otherwise None.
+        str
+            "halfsets" if the particles are numbered by their half-sets, "sequence" if the subtomogram numbers are not
+            unique and the particles are numbered from 1, "none" if the subtomogram numbers are kept.
 
         """
 
-        frames, specifiers, _ = starfileio.Starfile.read(input_path)
-
-        version = RelionMotl.get_version_from_file(frames, specifiers)
-
-        data_id = RelionMotl._get_data_particles_id(specifiers)
-        optics_id = RelionMotl._get_optics_id(specifiers)
+        block = starfileio.Starfile.get_index(input_path)[data_id]
+        if "rlnRandomSubset" in block["columns"]:
+            halfsets = set()
+            for chunk_df in starfileio.Starfile.iter_read(
+                input_path, data_id, chunk_rows=chunk_rows, columns=["rlnRandomSubset"]
+            ):
+                halfsets.update(chunk_df["rlnRandomSubset"].dropna().unique())
+            if len(halfsets) == 2:
+                return "halfsets"
+
+        if self.subtomo_id_name not in block["columns"]:
+            return "none"
+
+        subtomo_idx = []
+        for chunk_df in starfileio.Starfile.iter_read(
+            input_path, data_id, chunk_rows=chunk_rows, columns=[self.subtomo_id_name]
+        ):
+            subtomo_idx.append(
+                RelionMotl.parse_numbers(chunk_df[self.subtomo_id_name], self._get_subtomo_id_pattern(), cache=False)
+            )
+        subtomo_idx = np.concatenate(subtomo_idx)
 
-        optics_df = None
-        if optics_id is not None and self.optics_data is None:
-            optics_df = frames[optics_id]
+        return "none" if len(np.unique(subtomo_idx)) == len(subtomo_idx) else "sequence"
 
-        return frames[data_id], version, optics_df
+    def _get_subtomo_id_pattern(self):
+        # Relion 4.0 and higher stores only the number in the last entry
+        return None if self.version >= 4.0 else self.second_number_pattern
 
     def convert_angles_from_relion(self, relion_df):
         """The function converts angles from the Relion format, which corresponds to ZYZ Euler convention,
@@ -2328,6 +3854,60 @@ class RelionMotl(Motl):
                 self.df[motl_column] = self.df[motl_column].values / self.pixel_size
 
             self.df[motl_column].fillna(0, inplace=True)
+            self.invalidate_cache(motl_column)
+
+    @staticmethod
+    def parse_numbers(names, pattern=None, entry=-1, cache=True):
+        """Parses numbers from path-like names (e.g. "/path/TS_018/12") stored in a column of Relion DataFrame.
+
+        Parameters
+        ----------
+        names : pandas.Series
+            The names to parse. If they are already numbers, they are returned as they are.
+        pattern : re.Pattern, optional
+            Compiled regular expression with one group that extracts the number from the entry (e.g.
+            :attr:`cryocat.cryomotl.RelionMotl.first_number_pattern`). If None, the whole entry is converted to
+            number. Defaults to None.
+        entry : int, default=-1
+            Which entry of the name split at the last "/" should be parsed: -1 for the last entry (file name), 0 for
+            the rest of the path. Names without "/" are parsed as a whole. Defaults to -1.
+        cache : bool, default=True
+            If True, each unique name is parsed only once and the results are mapped back to all rows. It should be
+            False for names that are (mostly) unique such as subtomogram names. Defaults to True.
+
+        Returns
+        -------
+        numpy.ndarray
+            The parsed numbers as float values, one per row.
+
+        Raises
+        ------
+        UserInputError
+            If the number cannot be parsed from some of the names.
+
+        """
+
+        if pd.api.types.is_numeric_dtype(names.dtype):
+            return names.to_numpy()
+
+        if cache:
+            codes, unique_names = pd.factorize(names, use_na_sentinel=False)
+        else:
+            codes, unique_names = np.arange(names.shape[0]), names.to_numpy()
+
+        if pd.api.types.infer_dtype(unique_names, skipna=False) in ("integer", "floating", "mixed-integer-float"):
+            return np.asarray(unique_names, dtype=float)[codes]
+
+        try:
+            entries = [name.rsplit("/", 1)[entry] for name in unique_names]
+            if pattern is None:
+                unique_numbers = np.array([float(e) for e in entries])
+            else:
+                unique_numbers = np.array([float(pattern.search(e).group(1)) for e in entries])
+        except (AttributeError, TypeError, ValueError):
+            raise UserInputError(f"The numbers could not be parsed from the names in the column {names.name}.")
+
+        return unique_numbers[codes]
 
     def parse_tomo_id(self, relion_df):
         """The function parses the tomogram id from a Relion starfile. The function takes
@@ -2358,18 +3938,7 @@ class RelionMotl(Motl):
         """
 
         if self.tomo_id_name in relion_df.columns:
-            micrograph_names = relion_df[self.tomo_id_name].tolist()
-
-            if all(isinstance(i, (int, float)) for i in micrograph_names):
-                tomo_idx = micrograph_names
-            else:
-                tomo_names = [i.rsplit("/", 1)[-1] for i in micrograph_names]
-                tomo_idx = []
-
-                for j in tomo_names:
-                    tomo_idx.append(float(re.search(r"\d+", j).group()))
-
-            self.df["tomo_id"] = tomo_idx
+            self.df["tomo_id"] = RelionMotl.parse_numbers(relion_df[self.tomo_id_name], self.first_number_pattern)
 
         # in case there is no migrograph name fetch tomo id from subtomo path
         elif self.subtomo_id_name in relion_df.columns:
@@ -2377,18 +3946,10 @@ class RelionMotl(Motl):
                 tomo_position = -1
             else:
                 tomo_position = 0
-            micrograph_names = relion_df[self.subtomo_id_name].tolist()
 
-            if all(isinstance(i, (int, float)) for i in micrograph_names):
-                tomo_idx = micrograph_names
-            else:
-                tomo_names = [i.rsplit("/", 1)[tomo_position] for i in micrograph_names]
-                tomo_idx = []
-
-                for j in tomo_names:
-                    tomo_idx.append(float(re.findall(r"\d+", j)[0]))
-
-            self.df["tomo_id"] = tomo_idx
+            self.df["tomo_id"] = RelionMotl.parse_numbers(
+                relion_df[self.subtomo_id_name], self.first_number_pattern, entry=tomo_position
+            )
 
     def parse_subtomo_id(self, relion_df):
         """The function parses the subtomogram id from a Relion starfile. The function takes
@@ -2425,21 +3986,9 @@ class RelionMotl(Motl):
         """
         # parsing out subtomo number
         if self.subtomo_id_name in relion_df.columns:
-            image_names = relion_df[self.subtomo_id_name].tolist()
-
-            # Note: following will fail if the subtomos are named differently for each row - once with string, once with
-            # number
-            if all(isinstance(i, (int, float)) for i in image_names):
-                subtomo_idx = image_names
-            else:
-                subtomo_names = [i.rsplit("/", 1)[-1] for i in image_names]
-                subtomo_idx = []
-
-                for j in subtomo_names:
-                    if self.version >= 4.0:
-                        subtomo_idx.append(float(j))
-                    else:
-                        subtomo_idx.append(float(re.findall(r"\d+", j)[1]))
+            subtomo_idx = RelionMotl.parse_numbers(
+                relion_df[self.subtomo_id_name], self._get_subtomo_id_pattern(), cache=False
+            )
 
         # Check if the subtomo_idx are unique and if not store them at geom3 and renumber particles
         self.df["geom3"] = subtomo_idx
@@ -2450,18 +3999,34 @@ class RelionMotl(Motl):
 
         # If there is information about half-sets renumber the subtomo_idx accordintly
         if "rlnRandomSubset" in relion_df.columns and relion_df["rlnRandomSubset"].nunique() == 2:
-            halfset_num = relion_df["rlnRandomSubset"].values % 2
-            c = 1 if halfset_num[0] == 1 else 2
-            subtomo_id_num = [c]
-            for i in range(1, self.df.shape[0]):
-                if (c % 2 == 1 and halfset_num[i] == 1) or (c % 2 == 0 and halfset_num[i] == 0):
-                    c += 2
-                else:
-                    c += 1
-                # c = np.ceil(c / 2) * 2 + halfset_num[i]
-                subtomo_id_num.append(c)
+            self.df["subtomo_id"] = RelionMotl.get_halfset_subtomo_ids(relion_df["rlnRandomSubset"].values % 2)
+
+    @staticmethod
+    def get_halfset_subtomo_ids(halfset_num, previous_id=0):
+        """Numbers the particles so that the particles from the first half-set have odd numbers and the particles
+        from the second half-set even numbers. Each particle gets the smallest number with the correct parity that is
+        larger than the number of the previous particle.
 
-            self.df["subtomo_id"] = subtomo_id_num
+        Parameters
+        ----------
+        halfset_num : numpy.ndarray
+            Half-set of each particle: 1 for the first half-set, 0 for the second one.
+        previous_id : int, default=0
+            Number of the particle preceding the first one, e.g. the last number from the previous chunk of the
+            particle list. Defaults to 0.
+
+        Returns
+        -------
+        numpy.ndarray
+            The new subtomogram numbers.
+
+        """
+
+        # the parity of each number corresponds to the half-set - the step is 2 if the half-set does not change
+        previous_num = np.concatenate(([previous_id % 2], halfset_num[:-1]))
+        steps = np.where(halfset_num == previous_num, 2, 1)
+
+        return previous_id + np.cumsum(steps)
 
     def convert_to_motl(self, relion_df, version=None, optics_df=None):
         """The function converts a DataFrame in relion format into a motl DataFrame.
@@ -2703,9 +4268,9 @@ class RelionMotl(Motl):
         elif optics_data is not None:
             if isinstance(optics_data, str):
                 if version >= 3.1:
-                    optics_df, _ = starfileio.get_frame_and_comments(optics_data, "data_optics")
+                    optics_df, _ = starfileio.Starfile.read_block(optics_data, "data_optics")
                 else:
-                    optics_df, _ = starfileio.get_frame_and_comments(optics_data, "data_")
+                    optics_df, _ = starfileio.Starfile.read_block(optics_data, "data_")
             elif isinstance(optics_data, dict):
                 optics_df = pd.DataFrame(optics_data)
             else:
@@ -3260,21 +4825,28 @@ class StopgapMotl(Motl):
             elif isinstance(input_motl, pd.DataFrame):
                 self.check_df_type(input_motl)
             elif isinstance(input_motl, str):
-                sg_df = self.read_in(input_motl)
+                sg_df = self.read_in(input_motl, compact=self.compact_mode)
                 self.convert_to_motl(sg_df)
             else:
                 raise UserInputError(
                     f"Provided input_motl is neither DataFrame nor path to the motl file: {input_motl}."
                 )
 
+        if self.compact_mode:
+            self.compact()
+
     @staticmethod
-    def read_in(input_path):
+    def read_in(input_path, compact=False):
         """Reads in a starfile in stopgap format and returns the particles as a dataframe in stopgap format.
 
         Parameters
         ----------
         input_path : str
             The path to the starfile in stopgap format.
+        compact : bool, default=False
+            Whether to parse the columns directly into int32 ids, float32 values and categorical halfsets (see
+            :meth:`cryocat.starfileio.Starfile.get_schema`) instead of converting them to numbers afterwards.
+            Defaults to False.
 
         Returns
         -------
@@ -3290,16 +4862,50 @@ class StopgapMotl(Motl):
 
         """
 
-        frames, specifiers, _ = starfileio.Starfile.read(input_path)
+        # only the particle list is parsed, other blocks are skipped
+        index = starfileio.Starfile.get_index(input_path)
+        sg_id = starfileio.Starfile.get_specifier_id([block["specifier"] for block in index], "data_stopgap_motivelist")
 
-        if "data_stopgap_motivelist" not in specifiers:
+        if sg_id is None:
             raise UserInputError(f"Provided starfile does not contain particle list: {input_path}.")
         else:
-            sg_id = starfileio.Starfile.get_specifier_id(specifiers, "data_stopgap_motivelist")
-            stopgap_df = frames[sg_id]
+            stopgap_df = starfileio.Starfile.read_rows(input_path, index[sg_id], schema="stopgap" if compact else None)
 
         return stopgap_df
 
+    @staticmethod
+    def iter_chunks(input_path, chunk_rows=1000000):
+        """Reads in a starfile in stopgap format by chunks of particles and converts them to motls.
+
+        Parameters
+        ----------
+        input_path : str
+            The path to the starfile in stopgap format.
+        chunk_rows : int, default=1000000
+            Maximal number of particles in one chunk. Defaults to 1000000.
+
+        Yields
+        ------
+        :class:`StopgapMotl`
+            Motl with the next chunk of the particles.
+
+        Raises
+        ------
+        UserInputError
+            If the starfile does not contain the 'data_stopgap_motivelist' specifier, i.e., is not a particle list.
+
+        """
+
+        index = starfileio.Starfile.get_index(input_path)
+        sg_id = starfileio.Starfile.get_specifier_id([block["specifier"] for block in index], "data_stopgap_motivelist")
+
+        if sg_id is None:
+            raise UserInputError(f"Provided starfile does not contain particle list: {input_path}.")
+
+        schema = "stopgap" if StopgapMotl.compact_mode else None
+        for chunk_df in starfileio.Starfile.iter_read(input_path, sg_id, chunk_rows=chunk_rows, schema=schema):
+            yield StopgapMotl(chunk_df)
+
     def convert_to_motl(self, stopgap_df, keep_halfsets=False):
         """Converts a stopgap DataFrame to a motl DataFrame and stores it in self.df.
 
@@ -3461,6 +5067,9 @@ class DynamoMotl(Motl):
                     f"Provided input_motl is neither DataFrame nor path to the motl file: {input_motl}."
                 )
 
+        if self.compact_mode:
+            self.compact()
+
     @staticmethod
     def read_in(input_path):
         """Reads in a file from the specified input path and returns a pandas DataFrame in dynamo format.
@@ -3554,6 +5163,9 @@ class ModMotl(Motl):
                     f"Provided input_motl is neither DataFrame nor path to the mod file: {input_motl}."
                 )
 
+        if self.compact_mode:
+            self.compact()
+
     @staticmethod
     def read_in(input_path, mod_prefix="", mod_suffix=".mod"):
         """Reads in IMOD model file(s) from a file or specified directory. In case a path to the directory is
@@ -3685,6 +5297,311 @@ class ModMotl(Motl):
         self.update_coordinates()
 
 
+class H5Motl(Motl):
+    """Motl stored in HDF5 file with one (optionally compressed) dataset per column. The column types are preserved
+    and additional columns (beyond :attr:`cryocat.cryomotl.Motl.motl_columns`) are supported. Individual columns and
+    row ranges can be read without reading the rest of the file.
+
+    The particles are stored in the group "motl" with attribute "columns" defining the column order. Categorical
+    columns are stored as integer codes with the categories stored in the group "categories".
+    """
+
+    format_version = 1
+
+    def __init__(self, input_motl=None, row_range=None):
+        if input_motl is not None:
+            if isinstance(input_motl, H5Motl):
+                self.df = input_motl.df.copy()
+            elif isinstance(input_motl, pd.DataFrame):
+                self.check_df_type(input_motl)
+            elif isinstance(input_motl, str):
+                self.convert_to_motl(self.read_in(input_motl, row_range=row_range))
+            else:
+                raise UserInputError(
+                    f"Provided input_motl is neither DataFrame nor path to the motl file: {input_motl}."
+                )
+        else:
+            self.df = Motl.create_empty_motl_df()
+
+    def convert_to_motl(self, input_df):
+        """Sets the input_df as `df`. The input_df has to contain all columns from
+        :attr:`cryocat.cryomotl.Motl.motl_columns`, additional columns are kept after them.
+
+        Parameters
+        ----------
+        input_df : pandas.DataFrame
+            Particle list with all the motl columns.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        UserInputError
+            If some of the motl columns are missing.
+
+        """
+
+        missing_columns = set(Motl.motl_columns) - set(input_df.columns)
+        if missing_columns:
+            raise UserInputError(f"Provided motl does not contain following columns: {sorted(missing_columns)}.")
+
+        extra_columns = [c for c in input_df.columns if c not in Motl.motl_columns]
+        if list(input_df.columns) != Motl.motl_columns + extra_columns:
+            input_df = input_df[Motl.motl_columns + extra_columns]
+
+        # reset_index copies the data
+        if not input_df.index.equals(pd.RangeIndex(input_df.shape[0])):
+            input_df = input_df.reset_index(drop=True)
+
+        self.df = input_df
+
+    @staticmethod
+    def read_in(input_path, columns=None, row_range=None):
+        """Reads in particles from the HDF5 motl file.
+
+        Parameters
+        ----------
+        input_path : str
+            Path to the file.
+        columns : list, optional
+            Columns to read. If None, all columns are read. Defaults to None.
+        row_range : tuple, optional
+            Start and stop row (following python slicing, i.e. the stop row is not included) to read. If None, all
+            rows are read. Defaults to None.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Particle list with the stored column types.
+
+        Raises
+        ------
+        UserInputError
+            If the file does not exist, is not a motl file or some of the columns are not stored in the file.
+
+        Notes
+        -----
+        Only the chunks containing the requested rows of the requested columns are read from the disk. Columns
+        sharing the same numeric type are read directly into one array which is used by the DataFrame without
+        copying.
+
+        Examples
+        --------
+        >>> H5Motl.read_in("particles.h5", columns=["tomo_id", "score"], row_range=(0, 1000))
+
+        """
+
+        if not os.path.isfile(input_path):
+            raise UserInputError(f"Provided file {input_path} does not exist.")
+
+        with h5py.File(input_path, "r") as h5_file:
+            if "motl" not in h5_file:
+                raise UserInputError(f"Provided file {input_path} does not contain motl.")
+
+            motl_group = h5_file["motl"]
+            stored_columns = [str(c) for c in motl_group.attrs["columns"]]
+            n_rows = int(motl_group.attrs["n_rows"])
+
+            if columns is None:
+                columns = stored_columns
+            else:
+                columns = [columns] if isinstance(columns, str) else list(columns)
+                missing_columns = set(columns) - set(stored_columns)
+                if missing_columns:
+                    raise UserInputError(f"Columns {sorted(missing_columns)} are not stored in {input_path}.")
+
+            start, stop, _ = slice(*(row_range if row_range is not None else (None,))).indices(n_rows)
+            stop = max(start, stop)
+
+            # numeric columns of the same type are read into one array (one block in the DataFrame)
+            blocks = {}
+            other_columns = {}
+            for c in columns:
+                dataset = motl_group[c]
+                if dataset.attrs["kind"] == "numeric":
+                    blocks.setdefault(dataset.dtype, []).append(c)
+                elif dataset.attrs["kind"] == "categorical":
+                    categories = h5_file["categories"][c]
+                    categories = categories.asstr()[:] if h5py.check_string_dtype(categories.dtype) else categories[:]
+                    other_columns[c] = pd.Categorical.from_codes(dataset[start:stop], categories=categories)
+                else:
+                    other_columns[c] = dataset.asstr()[start:stop].astype(object)
+
+            frames = []
+            for dtype, block_columns in blocks.items():
+                block = np.empty((stop - start, len(block_columns)), dtype=dtype, order="F")
+                if stop > start:
+                    for i, c in enumerate(block_columns):
+                        motl_group[c].read_direct(block[:, i], source_sel=np.s_[start:stop])
+                frames.append(pd.DataFrame(block, columns=block_columns, copy=False))
+
+            if other_columns:
+                frames.append(pd.DataFrame(other_columns))
+
+        if len(frames) == 1:
+            motl_df = frames[0]
+        else:
+            motl_df = pd.concat(frames, axis=1) if frames else pd.DataFrame()
+
+        if list(motl_df.columns) != columns:
+            motl_df = motl_df[columns]
+
+        return motl_df
+
+    @staticmethod
+    def iter_chunks(input_path, chunk_rows=1000000):
+        """Reads in particles from the HDF5 motl file by chunks.
+
+        Parameters
+        ----------
+        input_path : str
+            Path to the file.
+        chunk_rows : int, default=1000000
+            Maximal number of particles in one chunk. Defaults to 1000000.
+
+        Yields
+        ------
+        :class:`H5Motl`
+            Motl with the next chunk of the particles.
+
+        """
+
+        with h5py.File(input_path, "r") as h5_file:
+            if "motl" not in h5_file:
+                raise UserInputError(f"Provided file {input_path} does not contain motl.")
+            n_rows = int(h5_file["motl"].attrs["n_rows"])
+
+        for start in range(0, n_rows, chunk_rows):
+            yield H5Motl(input_path, row_range=(start, start + chunk_rows))
+
+    def write_out(self, output_path, compression=None, chunk_rows=65536):
+        """Writes out the particle list to HDF5 file.
+
+        Parameters
+        ----------
+        output_path : str
+            Name of the file to be written out (including the path).
+        compression : str, {"gzip", "lzf"}, optional
+            Compression filter for the columns. If None, the data are not compressed which results in the fastest
+            reading. Defaults to None.
+        chunk_rows : int, default=65536
+            Number of rows in one chunk - the smallest unit that is read from the file. Defaults to 65536.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        UserInputError
+            If some of the columns have type which cannot be stored.
+
+        """
+
+        n_rows = self.df.shape[0]
+        chunks = (min(chunk_rows, n_rows),) if n_rows > 0 else None
+
+        with h5py.File(output_path, "w") as h5_file:
+            motl_group = h5_file.create_group("motl")
+            motl_group.attrs["format_version"] = H5Motl.format_version
+            motl_group.attrs["columns"] = [str(c) for c in self.df.columns]
+            motl_group.attrs["n_rows"] = n_rows
+
+            for c in self.df.columns:
+                column = self.df[c]
+
+                if isinstance(column.dtype, pd.CategoricalDtype):
+                    kind = "categorical"
+                    data = column.cat.codes.to_numpy()
+                    categories = column.cat.categories.to_numpy()
+                    if categories.dtype == object:
+                        categories = categories.astype(str).astype(object)
+                        h5_file.create_dataset(f"categories/{c}", data=categories, dtype=h5py.string_dtype())
+                    else:
+                        h5_file.create_dataset(f"categories/{c}", data=categories)
+                elif column.dtype == object or pd.api.types.is_string_dtype(column.dtype):
+                    kind = "string"
+                    data = column.astype(str).to_numpy(dtype=object)
+                elif pd.api.types.is_numeric_dtype(column.dtype) or pd.api.types.is_bool_dtype(column.dtype):
+                    kind = "numeric"
+                    data = column.to_numpy()
+                else:
+                    raise UserInputError(f"Column {c} has type {column.dtype} which is not supported.")
+
+                dataset = motl_group.create_dataset(
+                    c,
+                    data=data,
+                    dtype=h5py.string_dtype() if kind == "string" else None,
+                    chunks=chunks,
+                    compression=compression if chunks else None,
+                )
+                dataset.attrs["kind"] = kind
+
+    @staticmethod
+    def write_out_blocks(output_path, blocks, n_rows, compression=None, chunk_rows=65536):
+        """Writes out a particle list given by blocks to HDF5 file. Only one block is kept in the memory at a time. The
+        columns and their types are defined by the first block and only numeric columns are supported.
+
+        Parameters
+        ----------
+        output_path : str
+            Name of the file to be written out (including the path).
+        blocks : iterable of pandas.DataFrame
+            Consecutive parts of the particle list with the same columns.
+        n_rows : int
+            Total number of particles in all blocks.
+        compression : str, {"gzip", "lzf"}, optional
+            Compression filter for the columns. Defaults to None.
+        chunk_rows : int, default=65536
+            Number of rows in one chunk of the HDF5 datasets. Defaults to 65536.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        UserInputError
+            If some of the columns are not numeric or if the blocks do not contain n_rows particles in total.
+
+        """
+
+        chunks = (min(chunk_rows, n_rows),) if n_rows > 0 else None
+        written_rows = 0
+
+        with h5py.File(output_path, "w") as h5_file:
+            motl_group = h5_file.create_group("motl")
+            motl_group.attrs["format_version"] = H5Motl.format_version
+            motl_group.attrs["n_rows"] = n_rows
+
+            for block_df in blocks:
+                if "columns" not in motl_group.attrs:
+                    motl_group.attrs["columns"] = [str(c) for c in block_df.columns]
+                    for c in block_df.columns:
+                        if not pd.api.types.is_numeric_dtype(block_df[c].dtype):
+                            raise UserInputError(f"Column {c} has type {block_df[c].dtype} which is not supported.")
+                        dataset = motl_group.create_dataset(
+                            c,
+                            shape=(n_rows,),
+                            dtype=block_df[c].dtype,
+                            chunks=chunks,
+                            compression=compression if chunks else None,
+                        )
+                        dataset.attrs["kind"] = "numeric"
+
+                if written_rows + block_df.shape[0] > n_rows:
+                    raise UserInputError(f"The blocks contain more than {n_rows} particles.")
+
+                for c in block_df.columns:
+                    motl_group[c][written_rows : written_rows + block_df.shape[0]] = block_df[c].to_numpy()
+                written_rows += block_df.shape[0]
+
+        if written_rows != n_rows:
+            raise UserInputError(f"Expected {n_rows} particles but {written_rows} particles were written out.")
+
+
 def emmotl2relion(
     input_motl,
     output_motl_path=None,
@@ -3826,3 +5743,158 @@ def stopgap2relion(
         )
 
     return rln_motl
+
+
+# converters between the motl types, used by convert_motls
+motl_converters = {
+    ("emmotl", "relion"): emmotl2relion,
+    ("relion", "emmotl"): relion2emmotl,
+    ("stopgap", "emmotl"): stopgap2emmotl,
+    ("emmotl", "stopgap"): emmotl2stopgap,
+    ("relion", "stopgap"): relion2stopgap,
+    ("stopgap", "relion"): stopgap2relion,
+}
+
+
+def convert_motl_file(converter, input_path, output_path, converter_params):
+    """Converts one motl file and reports the result instead of raising, so one failing file does not stop the
+    batch conversion.
+
+    Parameters
+    ----------
+    converter : callable
+        One of the converters from :data:`cryocat.cryomotl.motl_converters`.
+    input_path : str
+        Path to the input motl file.
+    output_path : str
+        Path to the output motl file. Missing directories are created.
+    converter_params : dict
+        Additional parameters of the converter.
+
+    Returns
+    -------
+    tuple
+        Status ("converted" or "failed"), number of particles, conversion time in seconds and error message (empty
+        if the conversion succeeded).
+
+    """
+
+    start = time.perf_counter()
+    try:
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        motl = converter(input_path, output_motl_path=output_path, **converter_params)
+        return "converted", motl.df.shape[0], time.perf_counter() - start, ""
+    except Exception as e:
+        return "failed", 0, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+
+def convert_motls(
+    input_motls, output_type, output_pattern, input_type="emmotl", n_workers=1, overwrite=False, **converter_params
+):
+    """Converts many motl files to another format, e.g. per-tomogram particle lists from template matching.
+
+    Parameters
+    ----------
+    input_motls : str or list
+        Glob pattern (e.g. "tm/*_tm.em") or list of paths to the motl files.
+    output_type : str, {'relion', 'emmotl', 'stopgap'}
+        Format of the output motls.
+    output_pattern : str
+        Pattern of the output paths with placeholders {stem} (input file name without extension), {name} (input
+        file name) and {dir} (input directory), e.g. "relion/{stem}.star".
+    input_type : str, {'emmotl', 'relion', 'stopgap'}
+        Format of the input motls. Defaults to "emmotl".
+    n_workers : int, default=1
+        Number of processes converting the files. If it is 1, the files are converted in the current process.
+        Defaults to 1.
+    overwrite : bool, default=False
+        If False, the files with an output that is newer than the input are skipped. Defaults to False.
+    **converter_params
+        Additional parameters passed to the converter, e.g. pixel_size or tomo_format (see
+        :func:`cryocat.cryomotl.emmotl2relion` and the other converters in :data:`cryocat.cryomotl.motl_converters`).
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per input file with columns "input_path", "output_path", "status" ("converted", "skipped" or
+        "failed"), "n_particles", "time" (conversion time in seconds) and "error".
+
+    Raises
+    ------
+    UserInputError
+        If the conversion between the types is not supported, the converter does not accept some of the
+        converter_params, no input files are found or the output pattern maps different inputs to the same output.
+
+    Examples
+    --------
+    >>> results = convert_motls("tm/*_tm.em", "relion", "relion/{stem}.star", n_workers=8, pixel_size=2.176)
+    >>> results[results["status"] == "failed"]
+
+    """
+
+    if (input_type, output_type) not in motl_converters:
+        raise UserInputError(f"Conversion from {input_type} to {output_type} is not supported.")
+
+    # the parameters are checked once here, otherwise each file would fail on them separately
+    converter = motl_converters[(input_type, output_type)]
+    converter_args = set(inspect.signature(converter).parameters) - {"input_motl", "output_motl_path"}
+    unknown_params = sorted(set(converter_params) - converter_args)
+    if unknown_params:
+        raise UserInputError(
+            f"Conversion from {input_type} to {output_type} does not support parameters {unknown_params}. "
+            f"Supported parameters are {sorted(converter_args)}."
+        )
+
+    if isinstance(input_motls, str):
+        input_paths = sorted(glob.glob(input_motls))
+    else:
+        input_paths = [str(p) for p in input_motls]
+
+    if len(input_paths) == 0:
+        raise UserInputError(f"No motl files were found for {input_motls}.")
+
+    output_paths = []
+    for input_path in input_paths:
+        name = os.path.basename(input_path)
+        output_paths.append(
+            output_pattern.format(stem=os.path.splitext(name)[0], name=name, dir=os.path.dirname(input_path))
+        )
+
+    if len(set(output_paths)) != len(output_paths):
+        raise UserInputError(f"The output pattern {output_pattern} maps different input files to the same output.")
+
+    results = pd.DataFrame({"input_path": input_paths, "output_path": output_paths})
+    results["status"] = "skipped"
+    results["n_particles"] = 0
+    results["time"] = 0.0
+    results["error"] = ""
+
+    to_convert = [
+        i
+        for i, (input_path, output_path) in enumerate(zip(input_paths, output_paths))
+        if overwrite
+        or not os.path.isfile(output_path)
+        or os.path.getmtime(output_path) < os.path.getmtime(input_path)
+    ]
+
+    arguments = (
+        [converter] * len(to_convert),
+        [input_paths[i] for i in to_convert],
+        [output_paths[i] for i in to_convert],
+        [converter_params] * len(to_convert),
+    )
+
+    if n_workers is None or n_workers <= 1 or len(to_convert) <= 1:
+        converted = list(map(convert_motl_file, *arguments))
+    else:
+        # small files are sent to the workers in batches to reduce the communication overhead
+        chunksize = max(1, len(to_convert) // (4 * n_workers))
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(to_convert))) as executor:
+            converted = list(executor.map(convert_motl_file, *arguments, chunksize=chunksize))
+
+    if converted:
+        results.loc[to_convert, ["status", "n_particles", "time", "error"]] = converted
+
+    return results
@@ -6,6 +6,7 @@ import matplotlib.pyplot as plt
 import os
 from scipy.interpolate import InterpolatedUnivariateSpline
 from scipy.interpolate import splprep, splev
+from scipy.spatial import KDTree
 
 ANGLE_DEGREES_TOL = 10e-12
 
@@ -774,6 +775,100 @@ def point_pairwise_dist(coord_1, coord_2):
     return pairwise_dist
 
 
+def get_indices_within_radius(coord, query_points, radius):
+    """Find all points from coord that are within the radius of at least one of the query points. The search is done
+    using KDTree, i.e. only true neighbors of the query points are evaluated.
+
+    Parameters
+    ----------
+    coord : ndarray
+        An array of shape (N, 3) with coordinates of points to search in.
+    query_points : ndarray
+        An array of shape (M, 3) with coordinates of query points.
+    radius : float
+        The search radius. Points with distance smaller or equal to the radius are returned.
+
+    Returns
+    -------
+    ndarray
+        Sorted array of unique indices (type int) of points from coord that are within the radius of any query point.
+
+    """
+
+    coord = np.asarray(coord).reshape(-1, 3)
+    query_points = np.asarray(query_points).reshape(-1, 3)
+
+    if coord.shape[0] == 0 or query_points.shape[0] == 0:
+        return np.empty((0,), dtype=int)
+
+    tree = KDTree(coord)
+    nn_idx = tree.query_ball_point(query_points, r=radius, return_sorted=False)
+
+    return np.unique(np.concatenate(nn_idx.tolist()).astype(int))
+
+
+def greedy_distance_suppression(coord, scores, radius, score_cut=None, neighbors=None):
+    """Greedy non-maximum suppression of points based on their distance. The points are processed in the order of
+    their scores (starting with the highest one) and all points closer than the radius to the currently processed
+    point are suppressed. Suppressed points are not processed anymore. The neighbors are found using KDTree, so only
+    true neighbors of the kept points are evaluated.
+
+    Parameters
+    ----------
+    coord : ndarray
+        An array of shape (N, 3) with coordinates of the points.
+    scores : ndarray
+        An array of shape (N,) with scores of the points. The point with the greater score is kept.
+    radius : float
+        The distance cutoff. Points with distance strictly smaller than the radius are suppressed.
+    score_cut : float, optional
+        Points with scores below this value are suppressed right away. Defaults to None.
+    neighbors : array-like, optional
+        Precomputed indices of points within the radius (distance smaller or equal) of each point, e.g. from
+        :meth:`cryocat.cryomotl.SpatialIndex.query_radius`. If None, they are found using KDTree. Defaults to None.
+
+    Returns
+    -------
+    ndarray
+        Boolean array of shape (N,) with True for points that should be kept.
+
+    Notes
+    -----
+    The result is identical to the brute-force approach where distances from each kept point to all other points are
+    computed by :meth:`cryocat.geom.point_pairwise_dist`.
+
+    """
+
+    coord = np.asarray(coord).reshape(-1, 3)
+    scores = np.asarray(scores)
+
+    keep = np.ones((coord.shape[0],), dtype=bool)
+
+    if score_cut is not None:
+        keep[scores < score_cut] = False
+
+    if coord.shape[0] == 0:
+        return keep
+
+    if neighbors is None:
+        tree = KDTree(coord)
+
+    for j in np.argsort(scores)[::-1]:
+        if not keep[j]:
+            continue
+
+        if neighbors is None:
+            nn_idx = np.asarray(tree.query_ball_point(coord[j, :], r=radius), dtype=int)
+        else:
+            nn_idx = np.asarray(neighbors[j], dtype=int)
+        # KDTree returns points with distance <= radius, keep only those strictly closer
+        dist = point_pairwise_dist(coord[j : j + 1, :], coord[nn_idx, :])
+        keep[nn_idx[dist < radius]] = False
+        keep[j] = True
+
+    return keep
+
+
 def area_triangle(coords):
     """Calculate the area of a triangle given its vertex coordinates. See
     https://stackoverflow.com/questions/71346322/numpy-area-of-triangle-and-equation-of-a-plane-on-which-triangle-lies-on
@@ -1423,6 +1518,36 @@ def normalize_vectors(v):
     return v / norm
 
 
+def frames_from_vectors(first_vectors, second_vectors):
+    """Build a local frame for each pair of vectors. The rows of each frame are the first vector (used as it is), the
+    normalized second vector and the normalized cross product of the two.
+
+    Parameters
+    ----------
+    first_vectors : numpy.ndarray
+        First vectors (e.g. normals of the particles), shape (N, 3).
+    second_vectors : numpy.ndarray
+        Second vectors (e.g. directions to the neighbors), shape (N, 3).
+
+    Returns
+    -------
+    numpy.ndarray
+        Frames with shape (N, 3, 3), the vectors are stored in rows.
+
+    Examples
+    --------
+    >>> frames_from_vectors(np.array([[0.0, 0.0, 1.0]]), np.array([[2.0, 0.0, 0.0]]))
+    array([[[0., 0., 1.],
+            [1., 0., 0.],
+            [0., 1., 0.]]])
+    """
+
+    second_vectors = normalize_vectors(second_vectors)
+    third_vectors = normalize_vectors(np.cross(first_vectors, second_vectors))
+
+    return np.stack([first_vectors, second_vectors, third_vectors], axis=1)
+
+
 def angle_between_n_vectors(v1, v2):
     # Ensure both vectors are normalized
     v1_u = normalize_vectors(v1)
@@ -1,5 +1,6 @@
 import struct
 import os
+import numpy as np
 import pandas as pd
 from dataclasses import dataclass
 from cryocat import ioutils
@@ -330,35 +331,63 @@ def read_mod_file(file_path):
 
 
 def write_model_binary(df, filename):
-    # Count the number of object IDs and contours
-    num_objects = df["object_id"].nunique()
+    # All IMOD headers and points are multiples of 4 bytes, so the whole model is assembled as one buffer of 4-byte
+    # words (raw big-endian bytes viewed as uint32) and written out at once
+    object_codes, object_ids = pd.factorize(df["object_id"], sort=False)
+    contour_ids = df["contour_id"].to_numpy()
+    num_objects = len(object_ids)
+
+    # Objects keep the order of their first appearance, contours are sorted within each object
+    order = np.lexsort((contour_ids, object_codes))
+    object_codes = object_codes[order]
+    contour_ids = contour_ids[order]
+    coordinates = df[["x", "y", "z"]].to_numpy()[order].astype(">f4")
+
+    num_points = len(order)
+    new_contour = np.ones(num_points, dtype=bool)
+    new_contour[1:] = (object_codes[1:] != object_codes[:-1]) | (contour_ids[1:] != contour_ids[:-1])
+    contour_starts = np.flatnonzero(new_contour)
+    contour_objects = object_codes[contour_starts]
+    points_per_contour = np.diff(np.append(contour_starts, num_points))
+    contours_per_object = np.unique(contour_objects, return_counts=True)[1]
+    contours_before_object = np.cumsum(contours_per_object) - contours_per_object
+
+    header_words = np.frombuffer(b"IMODV1.2" + ModelHeader(objsize=num_objects).to_bytes(), dtype=np.uint32)
+    object_words = np.frombuffer(ObjectHeader().to_bytes(), dtype=np.uint32)
+    contour_size = struct.calcsize(ContourHeader.header_format) // 4
+    object_size = object_words.size
+    contsize_word = struct.calcsize(">64s 68s") // 4
+
+    num_words = header_words.size + num_objects * object_size + contour_starts.size * contour_size + num_points * 3
+    buffer = np.empty(num_words + 1, dtype=np.uint32)
+    buffer[: header_words.size] = header_words
+    buffer[-1:] = np.frombuffer(b"IEOF", dtype=np.uint32)
+    data_start = header_words.size
+
+    # Word position of every object header, contour header and point in the file
+    object_positions = (
+        data_start
+        + np.arange(num_objects) * object_size
+        + contours_before_object * contour_size
+        + contour_starts[contours_before_object] * 3
+    )
+    contour_indices = np.arange(contour_starts.size)
+    contour_positions = data_start + (contour_objects + 1) * object_size + contour_indices * contour_size
+    contour_positions += contour_starts * 3
+    point_contours = np.cumsum(new_contour) - 1
+    point_positions = data_start + (object_codes + 1) * object_size + (point_contours + 1) * contour_size
+    point_positions += np.arange(num_points) * 3
+
+    object_headers = np.tile(object_words, (num_objects, 1))
+    object_headers[:, contsize_word] = contours_per_object.astype(">i4").view(np.uint32)
+    buffer[object_positions[:, np.newaxis] + np.arange(object_size)] = object_headers
+
+    contour_headers = np.zeros((contour_starts.size, contour_size), dtype=">i4")
+    contour_headers[:, 0] = np.frombuffer(b"CONT", dtype=">i4")[0]
+    contour_headers[:, 1] = points_per_contour
+    buffer[contour_positions[:, np.newaxis] + np.arange(contour_size)] = contour_headers.view(np.uint32)
+
+    buffer[point_positions[:, np.newaxis] + np.arange(3)] = coordinates.view(np.uint32)
 
-    # Open the file in binary write mode
     with open(filename, "wb") as file:
-        # Write the magic bytes and version id
-        file.write(b"IMODV1.2")
-
-        # Create and write the header
-        header = ModelHeader(objsize=num_objects)
-        file.write(header.to_bytes())
-
-        # Loop over unique object IDs
-        for obj_id in df["object_id"].unique():
-            object_df = df[df["object_id"] == obj_id]
-
-            # Create and write the ObjectHeader
-            obj_header = ObjectHeader(contsize=object_df["contour_id"].nunique())
-            file.write(obj_header.to_bytes())
-
-            # Loop over contours of the current object
-            for contour_id, contour_data in object_df.groupby("contour_id"):
-                # Create and write the ContourHeader
-                contour_header = ContourHeader(psize=len(contour_data))
-                file.write(contour_header.to_bytes())
-
-                # Write x, y, z coordinates for each contour
-                coordinates = contour_data[["x", "y", "z"]].values.astype(">f4")
-                file.write(coordinates.tobytes())
-
-        # Write the end of data marker
-        file.write(b"IEOF")
+        file.write(buffer.tobytes())
@@ -182,3 +182,41 @@ def get_similar_size_factors(number, order="ascending"):
             return sort(i, number // i)
     # If no factors are found, return the number itself and 1
     return sort(number, 1)
+
+
+def round_half_up(input_values):
+    """Round the input values to the nearest integer with ties rounded away from zero (i.e. Matlab-like rounding, not
+    the banker's rounding which is default in Python and numpy).
+
+    Parameters
+    ----------
+    input_values : array-like or float
+        Values to be rounded.
+
+    Returns
+    -------
+    numpy.ndarray
+        Rounded values (type float) with the same shape as the input.
+
+    Notes
+    -----
+    The result is identical to rounding each value through `decimal.Decimal(value).to_integral_value()` with the
+    `decimal.ROUND_HALF_UP` mode. The fractional part is computed as `value - trunc(value)` which is exact for
+    floating point numbers, therefore values like 0.49999999999999994 are not rounded up as it would happen with
+    `floor(value + 0.5)`.
+
+    Examples
+    --------
+    >>> round_half_up([0.5, 1.5, 2.5, -2.5, 2.4999])
+    array([ 1.,  2.,  3., -3.,  2.])
+    """
+
+    values = np.asarray(input_values, dtype=float)
+    truncated = np.trunc(values)
+
+    # inf - inf results in nan which is never rounded, infinite values are thus kept as they are
+    with np.errstate(invalid="ignore"):
+        fraction = values - truncated
+        rounded = truncated + np.sign(values) * (np.abs(fraction) >= 0.5)
+
+    return rounded
@@ -6,7 +6,6 @@ from scipy.spatial.transform import Rotation as srot
 from cryocat import geom
 import seaborn as sns
 from scipy.spatial import KDTree
-import sklearn.neighbors as sn
 import matplotlib.pyplot as plt
 
 
@@ -24,8 +23,7 @@ def get_nn_within_distance(feature_motl, radius, unique_only=True):
         return unique_arrays
 
     coord = feature_motl.get_coordinates()
-    kdt_nn = sn.KDTree(coord)
-    nn_idx = kdt_nn.query_radius(coord, radius)
+    nn_idx = feature_motl.spatial_index(feature_id=None).query_radius(coord, radius)
 
     # create id array to check where the NN was the same particle
     ordered_idx = np.arange(0, nn_idx.shape[0], 1)
@@ -52,8 +50,7 @@ def get_feature_nn_indices(fm_a, fm_nn, nn_number=1):
     coord_nn = fm_nn.get_coordinates()
 
     nn_count = min(nn_number, coord_nn.shape[0])
-    kdt_nn = sn.KDTree(coord_nn)
-    nn_dist, nn_idx = kdt_nn.query(coord_a, k=nn_count)
+    nn_dist, nn_idx = fm_nn.spatial_index(feature_id=None).query(coord_a, k=nn_count)
     ordered_idx = np.arange(0, nn_idx.shape[0], 1)
 
     return (
@@ -179,15 +176,10 @@ def get_nn_distances(motl_a, motl_nn, pixel_size=1.0, nn_number=1, feature="tomo
         coord_nn = fm_nn.get_coordinates() * pixel_size
         coord_a = fm_a.get_coordinates() * pixel_size
 
-        # get angles
-        angles_a = fm_a.get_angles()
-        angles_a = angles_a[idx, :]
-        angles_nn = fm_nn.get_angles()
-        rotations = srot.from_euler("zxz", angles=angles_a, degrees=True)
-
-        angles = -fm_a.df[["psi", "theta", "phi"]].values
-        angles = angles[idx, :]
-        rot = srot.from_euler("zxz", angles=angles, degrees=True)
+        # get rotations, the inverse ones rotate the particles to zero
+        rotations = motl_a.get_rotations(f, feature_id=feature)[idx]
+        rotations_nn_all = motl_nn.get_rotations(f, feature_id=feature)
+        rot = rotations.inv()
 
         subtomos_nn = fm_nn.df["subtomo_id"].to_numpy()
         subtomos_a = fm_a.df["subtomo_id"].to_numpy()
@@ -197,9 +189,7 @@ def get_nn_distances(motl_a, motl_nn, pixel_size=1.0, nn_number=1, feature="tomo
             centered_coord.append(c_coord)
             nn_dist.append(dist[:, i] * pixel_size)
 
-            angles_nn_sel = angles_nn[nn_idx[:, i], :]
-
-            rotations_nn = srot.from_euler("zxz", angles=angles_nn_sel, degrees=True)
+            rotations_nn = rotations_nn_all[nn_idx[:, i]]
             angular_distances.append(geom.compare_rotations(rotations, rotations_nn, rotation_type=rotation_type))
 
             rotated_coord.append(rot.apply(c_coord))
@@ -239,13 +229,11 @@ def get_nn_rotations(motl_a, motl_nn, nn_number=1, feature="tomo_id", type_id="g
 
         idx, idx_nn, _, nn_count = get_feature_nn_indices(fm_a, fm_nn, nn_number)
 
-        angles_nn = fm_nn.get_angles()
-        angles_ref_to_zero = -fm_a.get_feature(["psi", "theta", "phi"])
-        rot_to_zero = srot.from_euler("zxz", angles=angles_ref_to_zero[idx, :], degrees=True)
+        rotations_nn = motl_nn.get_rotations(f, feature_id=feature)
+        rot_to_zero = motl_a.get_rotations(f, feature_id=feature)[idx].inv()
 
         for i in range(nn_count):
-            rot_nn = srot.from_euler("zxz", angles=angles_nn[idx_nn[:, i], :], degrees=True)
-            nn_rotations.append(rot_to_zero * rot_nn)
+            nn_rotations.append(rot_to_zero * rotations_nn[idx_nn[:, i]])
 
     nn_rotations = srot.concatenate(nn_rotations)
     points_on_sphere = geom.visualize_rotations(nn_rotations, plot_rotations=False)
@@ -300,7 +288,7 @@ def filter_nn_radial_stats(input_stats, binary_mask):
 
 
 def get_nn_stats_within_radius(input_motl, nn_radius, feature="tomo_id", index_by_feature=True):
-    input_motl = cryomotl.Motl.load(input_motl)
+    input_motl = cryomotl.Motl.load(input_motl, share_data=True)
 
     # Get unique feature idx
     features = np.unique(input_motl.df.loc[:, feature].values)
@@ -322,10 +310,8 @@ def get_nn_stats_within_radius(input_motl, nn_radius, feature="tomo_id", index_b
         coord = fm.get_coordinates()
         center_idx, nn_idx = get_nn_within_distance(fm, nn_radius, unique_only=False)
 
-        angles_nn = fm.get_angles()
-        angles_ref_to_zero = -fm.get_feature(["psi", "theta", "phi"])
-
-        rotations = fm.get_rotations()
+        # same order as in fm, the rotations are cached by input_motl
+        rotations = input_motl.get_rotations(f, feature_id=feature)
 
         subtomos_idx = fm.df["subtomo_id"].to_numpy()
 
@@ -334,29 +320,29 @@ def get_nn_stats_within_radius(input_motl, nn_radius, feature="tomo_id", index_b
         else:
             motl_idx = input_motl.df.index[input_motl.df[feature] == f].to_numpy()
 
-        for i, c in enumerate(center_idx):
-            rot_to_zero = srot.from_euler("zxz", angles=angles_ref_to_zero[c, :], degrees=True)
-
-            for n in nn_idx[i]:
-                rot_nn = srot.from_euler("zxz", angles=angles_nn[n, :], degrees=True)
-                nn_rotations.append(rot_to_zero * rot_nn)
-
-                c_coord = coord[n, :] - coord[c, :]
-                centered_coord.append(c_coord)
-
-                rotated_coord.append(rot_to_zero.apply(c_coord))
-
-                rotations_nn = srot.from_euler("zxz", angles=angles_nn[n, :], degrees=True)
-                ang_dist, cone_dist, inplane_dist = geom.compare_rotations(
-                    rotations[c], rotations_nn, rotation_type="all"
-                )
-                angular_distances.append(ang_dist)
-                cone_distances.append(cone_dist)
-                inplane_distances.append(inplane_dist)
-                query_points.append(subtomos_idx[c])
-                query_motl_idx.append(motl_idx[c])
-                nn_points.append(subtomos_idx[n])
-                nn_motl_idx.append(motl_idx[n])
+        # all pairs of center particles and their neighbors are processed at once
+        pair_c = np.repeat(np.asarray(center_idx, dtype=int), [len(n) for n in nn_idx])
+        if pair_c.shape[0] == 0:
+            continue
+        pair_n = np.concatenate([np.asarray(n, dtype=int) for n in nn_idx])
+
+        rotations_c = rotations[pair_c]
+        rotations_nn = rotations[pair_n]
+        rot_to_zero = rotations_c.inv()
+        nn_rotations.append(rot_to_zero * rotations_nn)
+
+        c_coord = coord[pair_n, :] - coord[pair_c, :]
+        centered_coord.append(c_coord)
+        rotated_coord.append(rot_to_zero.apply(c_coord))
+
+        ang_dist, cone_dist, inplane_dist = geom.compare_rotations(rotations_c, rotations_nn, rotation_type="all")
+        angular_distances.append(ang_dist)
+        cone_distances.append(cone_dist)
+        inplane_distances.append(inplane_dist)
+        query_points.append(subtomos_idx[pair_c])
+        query_motl_idx.append(motl_idx[pair_c])
+        nn_points.append(subtomos_idx[pair_n])
+        nn_motl_idx.append(motl_idx[pair_n])
 
     nn_rotations = srot.concatenate(nn_rotations)
     points_on_sphere = geom.visualize_rotations(nn_rotations, plot_rotations=False)
@@ -366,7 +352,7 @@ def get_nn_stats_within_radius(input_motl, nn_radius, feature="tomo_id", index_b
     rotated_coord = np.vstack(rotated_coord)
     angular_distances = np.atleast_2d(np.concatenate(angular_distances)).T
     cone_distances = np.atleast_2d(np.concatenate(cone_distances)).T
-    inplane_distances = np.atleast_2d(np.asarray(inplane_distances)).T
+    inplane_distances = np.atleast_2d(np.concatenate(inplane_distances)).T
     query_points = [np.atleast_1d(arr) for arr in query_points]
     query_points = np.atleast_2d(np.concatenate(query_points)).T
     query_motl_idx = [np.atleast_1d(arr) for arr in query_motl_idx]
@@ -439,16 +425,14 @@ def get_nn_within_radius(
     features = np.intersect1d(features_a, features_nn, assume_unique=True)
 
     nn_count = []
+    spatial_index = motl_nn.spatial_index(feature)
 
     for f in features:
         fm_a = motl_a.get_motl_subset(f, feature_id=feature)
-        fm_nn = motl_nn.get_motl_subset(f, feature_id=feature)
-
-        coord_a = fm_a.get_coordinates() * pixel_size
-        coord_nn = fm_nn.get_coordinates() * pixel_size
+        coord_a = fm_a.get_coordinates()
 
-        kdt_nn = sn.KDTree(coord_nn)
-        fm_nn_count = kdt_nn.query_radius(coord_a, r=nn_radius, count_only=True)
+        # the coordinates in the index are in voxels
+        fm_nn_count = spatial_index.query_radius(coord_a, r=nn_radius / pixel_size, group=f, count_only=True)
 
         nn_count.append(fm_nn_count)
 
@@ -6,7 +6,6 @@ from scipy.spatial.transform import Rotation as srot
 from cryocat import geom
 import seaborn as sns
 from scipy.spatial import KDTree
-import sklearn.neighbors as sn
 import matplotlib.pyplot as plt
 
 
@@ -30,13 +29,10 @@ def add_occupancy(
 
 
 def get_feature_nn(fm_entry, fm_exit, remove_duplicates=True):
-    coord_entry = fm_entry.get_coordinates()
     coord_exit = fm_exit.get_coordinates()
 
-    kdt_entry = sn.KDTree(coord_entry)
-
     # return 2 NN for each point
-    dist, idx = kdt_entry.query(coord_exit, k=1)
+    dist, idx = fm_entry.spatial_index(feature_id=None).query(coord_exit, k=1)
 
     return dist, idx
 
@@ -48,10 +44,8 @@ def get_feature_nn_indices(fm_entry, fm_exit, remove_duplicates=True):
     if coord_entry.size <= 3:
         return [], [], []
 
-    kdt_entry = sn.KDTree(coord_entry)
-
     # return 2 NN for each point
-    dist, idx = kdt_entry.query(coord_exit, k=2)
+    dist, idx = fm_entry.spatial_index(feature_id=None).query(coord_exit, k=2)
 
     # create id array to check where the NN was the same particle
     ordered_idx = np.arange(0, idx.shape[0], 1)
@@ -325,18 +319,12 @@ def get_nn_distances(
         centered_coord.append(c_coord)
         nn_dist.append(dist * pixel_size)
 
-        # rotations = fm_entry.get_rotations()
-        all_angles = fm_entry.get_angles()
-        angles = all_angles[idx, :]
-        angles_nn = all_angles[nn_idx, :]
-        rotations = srot.from_euler("zxz", angles=angles, degrees=True)
-        rotations_nn = srot.from_euler("zxz", angles=angles_nn, degrees=True)
+        all_rotations = fm_entry.get_rotations()
+        rotations = all_rotations[idx]
+        rotations_nn = all_rotations[nn_idx]
         angular_distances.append(geom.compare_rotations(rotations, rotations_nn)[res_id])
 
-        angles = -fm_entry.df[["psi", "theta", "phi"]].values
-        angles = angles[idx, :]
-        rot = srot.from_euler("zxz", angles=angles, degrees=True)
-        rotated_coord.append(rot.apply(c_coord))
+        rotated_coord.append(rotations.inv().apply(c_coord))
         subtomos_all = fm_entry.df["subtomo_id"].to_numpy()
         subtomo_idx_nn.append(subtomos_all[nn_idx])
         subtomo_idx.append(subtomos_all[idx])
@@ -377,13 +365,8 @@ def get_nn_rotations(
         if len(idx) == 0:
             continue
 
-        angles_nn = fm_entry.get_angles()
-        rot_nn = srot.from_euler("zxz", angles=angles_nn[idx_nn, :], degrees=True)
-
-        angles_ref_to_zero = -fm_entry.get_feature(["psi", "theta", "phi"])
-        rot_to_zero = srot.from_euler("zxz", angles=angles_ref_to_zero[idx, :], degrees=True)
-
-        nn_rotations.append(rot_to_zero * rot_nn)
+        all_rotations = fm_entry.get_rotations()
+        nn_rotations.append(all_rotations[idx].inv() * all_rotations[idx_nn])
 
     nn_rotations = srot.concatenate(nn_rotations)
     points_on_sphere = geom.visualize_rotations(nn_rotations, plot_rotations=False)
@@ -593,6 +576,7 @@ def assign_class(
                 )
 
             motl.df.loc[motl.df["tomo_id"] == t] = tm_all
+            motl.invalidate_cache()
 
         cl += 1
 
@@ -606,6 +590,7 @@ def assign_class(
             motl.df["class"] != unassigned_class, ["geom3", "geom4", "geom5"]
         ].values
         motl.df.loc[motl.df["class"] != unassigned_class, ["shift_x", "shift_y", "shift_z"]] = 0.0
+        motl.invalidate_cache(["x", "y", "z", "shift_x", "shift_y", "shift_z"])
         motl.df["geom3"] = 0.0
 
     motl.df["geom4"] = motl.df["geom2"].values
@@ -844,8 +829,9 @@ def trace_chains(
         coord_entry = fm_entry.get_coordinates()
         coord_exit = fm_exit.get_coordinates()
 
-        kdt_entry = sn.KDTree(coord_entry)
-        kdt_exit = sn.KDTree(coord_exit)
+        # the subsets have the same order of particles as the groups in the spatial index
+        kdt_entry = motl_entry.spatial_index(feature).get_tree(f)
+        kdt_exit = motl_exit.spatial_index(feature).get_tree(f)
 
         for i, current_point in enumerate(coord_exit):
             if ~remain_exit[i]:
@@ -570,6 +570,40 @@ def evaluate_multirun_stability(input_motls, input_motl_type="stopgap"):
     return common_occupancies
 
 
+def get_class_changes(previous_df, current_df, classes):
+    """Count the subtomograms that moved into each of the classes between two iterations.
+
+    Parameters
+    ----------
+    previous_df : pandas.DataFrame
+        Particle list (motl DataFrame) from the previous iteration.
+    current_df : pandas.DataFrame
+        Particle list (motl DataFrame) from the current iteration.
+    classes : iterable
+        Classes to count the changes for.
+
+    Returns
+    -------
+    dict
+        For each class, the number of subtomograms that are in the class in the current iteration but were not in it
+        in the previous one (including subtomograms missing in the previous iteration).
+
+    Notes
+    -----
+    The particles are matched by subtomo_id in one pass using :meth:`cryocat.cryomotl.Motl.compare`.
+    """
+
+    comparison = cryomotl.Motl(current_df).compare(cryomotl.Motl(previous_df), key="subtomo_id")
+    matched = comparison.matched_idx >= 0
+
+    current_class = current_df["class"].to_numpy()
+    previous_class = np.full(current_class.shape, np.nan)
+    previous_class[matched] = previous_df["class"].to_numpy()[comparison.matched_idx[matched]]
+    moved = current_class != previous_class
+
+    return {cls: int(np.count_nonzero(moved & (current_class == cls))) for cls in classes}
+
+
 def get_subtomos_class_stability(motl_base_name, start_it, end_it, motl_type="stopgap"):
     """Calculate the class stability of subtomograms over iterations.
 
@@ -607,13 +641,9 @@ def get_subtomos_class_stability(motl_base_name, start_it, end_it, motl_type="st
     # Concatenate the list of DataFrames into a single DataFrame
     changing_subtomos = {cls: [] for cls in dfs[0]["class"].unique()}
     for i in range(1, len(dfs)):
-        previous_df = dfs[i - 1]
-        current_df = dfs[i]
+        class_changes = get_class_changes(dfs[i - 1], dfs[i], changing_subtomos.keys())
         for cls in changing_subtomos.keys():
-            previous_sids = set(previous_df.loc[previous_df["class"] == cls, "subtomo_id"])
-            current_sids = set(current_df.loc[current_df["class"] == cls, "subtomo_id"])
-            num_different_sids = len(current_sids.difference(previous_sids))
-            changing_subtomos[cls].append(num_different_sids)
+            changing_subtomos[cls].append(class_changes[cls])
 
     return changing_subtomos
 
@@ -674,13 +704,9 @@ def evaluate_classification(
 
     changing_subtomos = {cls: [] for cls in dfs[0]["class"].unique()}
     for i in range(1, len(dfs)):
-        previous_df = dfs[i - 1]
-        current_df = dfs[i]
+        class_changes = get_class_changes(dfs[i - 1], dfs[i], changing_subtomos.keys())
         for cls in changing_subtomos.keys():
-            previous_sids = set(previous_df.loc[previous_df["class"] == cls, "subtomo_id"])
-            current_sids = set(current_df.loc[current_df["class"] == cls, "subtomo_id"])
-            num_different_sids = len(current_sids.difference(previous_sids))
-            changing_subtomos[cls].append(num_different_sids)
+            changing_subtomos[cls].append(class_changes[cls])
 
     # sort the dictionaries
     occupancy = dict(sorted(occupancy.items()))
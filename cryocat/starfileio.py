@@ -1,5 +1,13 @@
 from enum import Enum
+import csv
+import io
+import itertools
+import json
+import mmap
+import numpy as np
+import os
 import pandas as pd
+import re
 from os import path
 import warnings
 
@@ -313,6 +321,79 @@ class Token:
 
 
 class Starfile:
+    # a line that ends the rows of a block: empty line, comment, column, loop or a new specifier (the pattern starts
+    # with the newline before it, so the search can skip quickly to the line starts)
+    rows_end_pattern = re.compile(r"\n[^\S\n]*(?:$|#|_|loop_|data_)", re.MULTILINE)
+    rows_end_pattern_bytes = re.compile(rows_end_pattern.pattern.encode(), re.MULTILINE)
+
+    # dtypes of the known columns of the particle lists, see :meth:`cryocat.starfileio.Starfile.get_schema`
+    relion_optics_columns = {
+        "rlnOpticsGroup": "int32",
+        "rlnOpticsGroupName": "category",
+        "rlnMicrographOriginalPixelSize": "float32",
+        "rlnVoltage": "float32",
+        "rlnSphericalAberration": "float32",
+        "rlnAmplitudeContrast": "float32",
+        "rlnImagePixelSize": "float32",
+        "rlnImageSize": "int32",
+        "rlnImageDimensionality": "int32",
+        "rlnCtfDataAreCtfPremultiplied": "int32",
+    }
+
+    relion_particles_columns = {
+        "rlnCoordinateX": "float32",
+        "rlnCoordinateY": "float32",
+        "rlnCoordinateZ": "float32",
+        "rlnAngleRot": "float32",
+        "rlnAngleTilt": "float32",
+        "rlnAnglePsi": "float32",
+        "rlnOriginXAngst": "float32",
+        "rlnOriginYAngst": "float32",
+        "rlnOriginZAngst": "float32",
+        "rlnMicrographName": "category",
+        "rlnImageName": "str",
+        "rlnCtfImage": "str",
+        "rlnPixelSize": "float32",
+        "rlnOpticsGroup": "int32",
+        "rlnGroupNumber": "int32",
+        "rlnClassNumber": "int32",
+        "rlnRandomSubset": "int32",
+        "rlnLogLikeliContribution": "float32",
+        "rlnMaxValueProbDistribution": "float32",
+        "rlnNrOfSignificantSamples": "int32",
+        "rlnAutopickFigureOfMerit": "float32",
+    }
+
+    column_schemas = {
+        "relion3.1": {**relion_optics_columns, **relion_particles_columns},
+        "relion4": {
+            **relion_optics_columns,
+            **relion_particles_columns,
+            "rlnTomoName": "category",
+            "rlnTomoParticleName": "str",
+            "rlnTomoSubtomogramBinning": "float32",
+            "rlnTomoTiltSeriesPixelSize": "float32",
+        },
+        "stopgap": {
+            "motl_idx": "int32",
+            "tomo_num": "int32",
+            "object": "int32",
+            "subtomo_num": "int32",
+            "halfset": "category",
+            "orig_x": "float32",
+            "orig_y": "float32",
+            "orig_z": "float32",
+            "score": "float32",
+            "x_shift": "float32",
+            "y_shift": "float32",
+            "z_shift": "float32",
+            "phi": "float32",
+            "psi": "float32",
+            "the": "float32",
+            "class": "int32",
+        },
+    }
+
     def __init__(self, file_path=None, frames=None, specifiers=None, comments=None):
         """
         This function reads a starfile with a *.star extension into a tuple of a list of Pandas DataFrame, a list of Data
@@ -363,7 +444,7 @@ class Starfile:
             return frames, specifiers, comments
 
     @staticmethod
-    def read(file_path, data_id=None):
+    def read(file_path, data_id=None, engine="fast", schema=None):
         """This function parses a starfile into a tuple of a list of Pandas DataFrame, a list of Data Specifier, and a list of
         comments.
 
@@ -378,6 +459,14 @@ class Starfile:
             the starfile to be parsed
         file_path :
 
+        engine : str, default="fast"
+            the parser to use: "fast" scans the lines for the block boundaries and reads the rows of each block at once
+            (see :meth:`cryocat.starfileio.Starfile.parse_blocks`), "tokenizer" tokenizes the whole file word by word.
+            Both of them return the same result. If data_id is specified, the fast engine parses only the requested
+            block (see :meth:`cryocat.starfileio.Starfile.get_index`). Defaults to "fast".
+        schema : str or dict, optional
+            the dtypes of the known columns, see :meth:`cryocat.starfileio.Starfile.get_schema`. If not specified, all
+            columns are converted to numbers where possible. Defaults to None.
 
         Returns
         -------
@@ -386,6 +475,18 @@ class Starfile:
 
         """
 
+        if engine not in ("fast", "tokenizer"):
+            raise ValueError(f"Unknown engine {engine}, supported engines are fast and tokenizer.")
+
+        if engine == "fast":
+            if data_id is not None:
+                # only the requested block is parsed
+                block = Starfile.get_index(file_path)[data_id]
+                return Starfile.read_rows(file_path, block, schema=schema), block["specifier"], block["comments"]
+
+            with open(file_path, mode="r") as file:
+                return Starfile.parse_blocks(file.read(), schema=schema)
+
         with open(file_path, mode="r") as file:
             raw_starfile = file.read()
 
@@ -404,14 +505,660 @@ class Starfile:
         if len(tokens) > 0:
             raise IOError(f"Expected a specifier or an end of token but got {tokens[0].token_type}")
 
+        schema = Starfile.get_schema(schema)
         for i, f in enumerate(frames):
-            frames[i] = f.apply(pd.to_numeric, errors="ignore")
+            dtypes = {c: schema[c] for c in f.columns if c in schema}
+            other_columns = f.columns.difference(dtypes.keys(), sort=False)
+            f[other_columns] = f[other_columns].apply(pd.to_numeric, errors="ignore")
+            frames[i] = Starfile.cast_columns(f, dtypes)
 
         if data_id is not None:
             return frames[data_id], specifiers[data_id], comments[data_id]
         else:
             return frames, specifiers, comments
 
+    @staticmethod
+    def parse_blocks(raw_starfile, schema=None):
+        """This function parses the text of a starfile into a tuple of a list of Pandas DataFrame, a list of Data
+        Specifier, and a list of comments.
+
+        Only the lines of the specifiers, columns and comments are processed one by one (see
+        :meth:`cryocat.starfileio.Starfile.scan_blocks`). All the rows of each block are read at once by
+        :meth:`cryocat.starfileio.Starfile.rows_to_frame`.
+
+        Parameters
+        ----------
+        raw_starfile : str
+            the text of the starfile to be parsed
+        schema : str or dict, optional
+            the dtypes of the known columns, see :meth:`cryocat.starfileio.Starfile.get_schema`. Defaults to None.
+
+        Returns
+        -------
+        tuple
+            a tuples of a list of Pandas DataFrames, list of specifiers, and list of comments
+
+        Notes
+        -----
+        The comments are assigned to the blocks in the same way as by the tokenizer: the comments preceding the rows
+        of a block belong to it, the comments after the rows belong to the next block and the comments at the end of
+        the file are dropped.
+
+        """
+
+        frames = []
+        specifiers = []
+        comments = []
+
+        for specifier, columns, block_comments, rows_start, rows_end in Starfile.scan_blocks(raw_starfile):
+            frames.append(Starfile.rows_to_frame(raw_starfile[rows_start:rows_end], columns, schema=schema))
+            specifiers.append(specifier)
+            comments.append(block_comments)
+
+        return frames, specifiers, comments
+
+    @staticmethod
+    def scan_blocks(raw_starfile):
+        """This function scans the text of a starfile for its blocks without parsing their rows.
+
+        Parameters
+        ----------
+        raw_starfile : str or bytes-like
+            the text of the starfile to be scanned, either as `str` or as bytes (e.g. `mmap.mmap` of the file) which
+            are decoded as utf-8
+
+        Yields
+        ------
+        tuple
+            a tuple of the specifier, list of columns, list of comments, and the start and end position of the rows of
+            the block in raw_starfile. Blocks without rows have the same start and end position.
+
+        Raises
+        ------
+        IOError
+            If the file contains something else than loop blocks.
+
+        Notes
+        -----
+        The end of the rows of a block is found by a single search for an empty line, a comment or a new specifier,
+        column or loop.
+
+        """
+
+        if isinstance(raw_starfile, str):
+            newline, rows_end_pattern = "\n", Starfile.rows_end_pattern
+        else:
+            newline, rows_end_pattern = b"\n", Starfile.rows_end_pattern_bytes
+
+        specifier = None
+        columns = None
+        block_comments = []
+
+        position = 0
+        while position < len(raw_starfile):
+            line_end = raw_starfile.find(newline, position)
+            line_end = len(raw_starfile) if line_end == -1 else line_end
+            line = raw_starfile[position:line_end]
+            if not isinstance(line, str):
+                line = line.decode("utf-8")
+
+            content, has_comment, comment = line.partition("#")
+            content = content.strip()
+
+            if content.startswith("_") and columns is not None:
+                # the comments of the columns (usually their numbers) are not stored
+                columns.append(content.split()[0][1:])
+                position = line_end + 1
+                continue
+
+            if columns and content.startswith("data_"):
+                # block without rows
+                yield specifier, columns, block_comments, position, position
+                specifier, columns, block_comments = None, None, []
+
+            if has_comment:
+                block_comments.append(comment.strip())
+
+            if not content:
+                pass
+            elif specifier is None:
+                specifier = content
+            elif content == "loop_" and columns is None:
+                columns = []
+            elif columns:
+                rows_end = rows_end_pattern.search(raw_starfile, line_end)
+                line_end = len(raw_starfile) if rows_end is None else rows_end.start()
+                yield specifier, columns, block_comments, position, line_end
+                specifier, columns, block_comments = None, None, []
+            else:
+                raise IOError(f"Got unexpected {content} after the specifier {specifier}.")
+
+            position = line_end + 1
+
+        if columns is not None:
+            yield specifier, columns, block_comments, len(raw_starfile), len(raw_starfile)
+        elif specifier is not None:
+            raise IOError(f"Expected the columns of the specifier {specifier} but the file ended.")
+
+    @staticmethod
+    def build_index(file_path):
+        """This function builds an index of the blocks of a starfile in one scan of the file, without parsing any
+        rows.
+
+        Parameters
+        ----------
+        file_path : str
+            the path to the starfile
+
+        Returns
+        -------
+        list
+            a list with a dictionary for each block containing its "specifier", "columns", "comments" and the byte
+            offsets "rows_start" and "rows_end" of its rows in the file
+
+        Notes
+        -----
+        The file is memory-mapped, so only the lines of the specifiers, columns and comments are read into memory.
+
+        """
+
+        with open(file_path, mode="rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return []
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as raw_starfile:
+                return [
+                    {
+                        "specifier": specifier,
+                        "columns": columns,
+                        "comments": comments,
+                        "rows_start": rows_start,
+                        "rows_end": rows_end,
+                    }
+                    for specifier, columns, comments, rows_start, rows_end in Starfile.scan_blocks(raw_starfile)
+                ]
+
+    @staticmethod
+    def get_index(file_path, cache=False):
+        """This function returns the index of the blocks of a starfile (see
+        :meth:`cryocat.starfileio.Starfile.build_index`).
+
+        Parameters
+        ----------
+        file_path : str
+            the path to the starfile
+        cache : bool, default=False
+            whether to store the index next to the starfile (as {file_path}.idx) and reuse it as long as the
+            modification time and the size of the starfile do not change. Defaults to False.
+
+        Returns
+        -------
+        list
+            a list with a dictionary for each block, see :meth:`cryocat.starfileio.Starfile.build_index`
+
+        """
+
+        index_path = f"{file_path}.idx"
+        file_stat = os.stat(file_path)
+        file_key = {"mtime": file_stat.st_mtime_ns, "size": file_stat.st_size}
+
+        if cache and path.isfile(index_path):
+            try:
+                with open(index_path, mode="r") as index_file:
+                    cached_index = json.load(index_file)
+                if cached_index.get("file") == file_key:
+                    return cached_index["blocks"]
+            except (OSError, ValueError, AttributeError):
+                pass
+
+        index = Starfile.build_index(file_path)
+
+        if cache:
+            try:
+                with open(index_path, mode="w") as index_file:
+                    json.dump({"file": file_key, "blocks": index}, index_file)
+            except OSError as e:
+                warnings.warn(f"The index of {file_path} could not be stored: {e}")
+
+        return index
+
+    @staticmethod
+    def _get_block(index, specifier):
+        if isinstance(specifier, str):
+            spec_id = Starfile.get_specifier_id([block["specifier"] for block in index], specifier)
+            if spec_id is None:
+                raise ValueError(f"There is no entry with specifier {specifier}.")
+        else:
+            spec_id = specifier
+
+        return index[spec_id]
+
+    @staticmethod
+    def _check_columns(block, columns):
+        if columns is not None:
+            missing_columns = [c for c in columns if c not in block["columns"]]
+            if missing_columns:
+                raise ValueError(f"The columns {missing_columns} are not in the block {block['specifier']}.")
+
+    @staticmethod
+    def read_rows(file_path, block, columns=None, schema=None):
+        """This function reads the rows of one block of a starfile directly from their position in the file.
+
+        Parameters
+        ----------
+        file_path : str
+            the path to the starfile
+        block : dict
+            the block from the index of the starfile (see :meth:`cryocat.starfileio.Starfile.get_index`)
+        columns : list, optional
+            names of the columns to read. If not specified, all columns are read. Defaults to None.
+        schema : str or dict, optional
+            the dtypes of the known columns, see :meth:`cryocat.starfileio.Starfile.get_schema`. Defaults to None.
+
+        Returns
+        -------
+        pandas.DataFrame
+            the rows of the block with values converted to numbers where possible
+
+        Raises
+        ------
+        ValueError
+            If some of the columns are not in the block.
+
+        """
+
+        Starfile._check_columns(block, columns)
+
+        with open(file_path, mode="rb") as file:
+            file.seek(block["rows_start"])
+            rows = file.read(block["rows_end"] - block["rows_start"]).decode("utf-8")
+
+        return Starfile.rows_to_frame(rows, block["columns"], usecols=columns, schema=schema)
+
+    @staticmethod
+    def read_block(file_path, specifier, columns=None, cache_index=False, schema=None):
+        """This function reads only one block of a starfile, optionally only some of its columns.
+
+        Parameters
+        ----------
+        file_path : str
+            the path to the starfile
+        specifier : str or int
+            the specifier of the block (e.g. "data_particles") or its position in the file
+        columns : list, optional
+            names of the columns to read. If not specified, all columns are read. Defaults to None.
+        cache_index : bool, default=False
+            whether to cache the index of the file, see :meth:`cryocat.starfileio.Starfile.get_index`. Defaults to
+            False.
+        schema : str or dict, optional
+            the dtypes of the known columns, see :meth:`cryocat.starfileio.Starfile.get_schema`. Defaults to None.
+
+        Returns
+        -------
+        tuple
+            a tuple of a Pandas DataFrame with the rows of the block and a list of its comments
+
+        Raises
+        ------
+        ValueError
+            If there is no block with the specifier in the file or if some of the columns are not in the block.
+
+        Examples
+        --------
+        >>> optics_df, _ = Starfile.read_block("particles.star", "data_optics")
+        >>> coord_df, _ = Starfile.read_block("particles.star", "data_particles", columns=["rlnCoordinateX"])
+        >>> particles_df, _ = Starfile.read_block("particles.star", "data_particles", schema="relion4")
+
+        """
+
+        index = Starfile.get_index(file_path, cache=cache_index)
+
+        block = Starfile._get_block(index, specifier)
+
+        return Starfile.read_rows(file_path, block, columns=columns, schema=schema), block["comments"]
+
+    @staticmethod
+    def iter_read(file_path, specifier, chunk_rows=100000, columns=None, cache_index=False, schema=None):
+        """This function reads one block of a starfile in chunks of rows, so the block is never held in memory as a
+        whole.
+
+        Parameters
+        ----------
+        file_path : str
+            the path to the starfile
+        specifier : str or int
+            the specifier of the block (e.g. "data_particles") or its position in the file
+        chunk_rows : int, default=100000
+            maximal number of rows in one chunk. Defaults to 100000.
+        columns : list, optional
+            names of the columns to read. If not specified, all columns are read. Defaults to None.
+        cache_index : bool, default=False
+            whether to cache the index of the file, see :meth:`cryocat.starfileio.Starfile.get_index`. Defaults to
+            False.
+        schema : str or dict, optional
+            the dtypes of the known columns, see :meth:`cryocat.starfileio.Starfile.get_schema`. Defaults to None.
+
+        Yields
+        ------
+        pandas.DataFrame
+            the next chunk of the rows of the block with the column names of the block and values converted to
+            numbers where possible. A block without rows is yielded once as an empty DataFrame with its columns.
+
+        Raises
+        ------
+        ValueError
+            If there is no block with the specifier in the file or if some of the columns are not in the block.
+
+        Notes
+        -----
+        The position of the block is found in the index of the file and the rows are read from there directly, the
+        other blocks are skipped. The values are converted to numbers for each chunk separately - a column with
+        numbers only in some of the chunks will have different types in different chunks, unless its dtype is
+        given by the schema. Categorical columns have only the categories of the values in the chunk.
+
+        Examples
+        --------
+        >>> for particles_df in Starfile.iter_read("particles.star", "data_particles", chunk_rows=500000):
+        ...     tomo_df = particles_df.loc[particles_df["rlnTomoName"] == "TS_001"]
+
+        """
+
+        index = Starfile.get_index(file_path, cache=cache_index)
+
+        block = Starfile._get_block(index, specifier)
+        Starfile._check_columns(block, columns)
+
+        return Starfile._iter_rows(file_path, block, chunk_rows, columns, Starfile.get_schema(schema))
+
+    @staticmethod
+    def _iter_rows(file_path, block, chunk_rows, columns, schema):
+        remaining = block["rows_end"] - block["rows_start"]
+        if remaining == 0:
+            yield Starfile.rows_to_frame([], block["columns"], usecols=columns, schema=schema)
+            return
+
+        with open(file_path, mode="rb") as file:
+            file.seek(block["rows_start"])
+            while remaining > 0:
+                # the last line of the rows does not have to end with a newline before the end of the block
+                rows = b"".join(itertools.islice(file, chunk_rows))[:remaining]
+                if not rows:
+                    break
+                remaining -= len(rows)
+                yield Starfile.rows_to_frame(rows.decode("utf-8"), block["columns"], usecols=columns, schema=schema)
+
+    @staticmethod
+    def get_schema(schema):
+        """This function returns the dtypes of the known columns of a starfile.
+
+        Parameters
+        ----------
+        schema : str or dict
+            the name of one of the schemas in `Starfile.column_schemas` ("relion3.1", "relion4" or "stopgap") or a
+            dictionary mapping the column names to their dtypes. None stands for an empty schema.
+
+        Returns
+        -------
+        dict
+            a dictionary mapping the column names to their dtypes
+
+        Raises
+        ------
+        ValueError
+            If there is no schema with the name.
+
+        Notes
+        -----
+        The readers parse the columns of the schema directly into their dtypes (e.g. int32 ids, float32 values and
+        categorical names of the tomograms) without converting them to numbers afterwards. The other columns are
+        converted to numbers where possible. Note that float32 keeps only about 7 significant digits.
+
+        Examples
+        --------
+        >>> Starfile.get_schema("relion4")["rlnTomoName"]
+        'category'
+        >>> Starfile.get_schema({"rlnClassNumber": "int8"})
+        {'rlnClassNumber': 'int8'}
+
+        """
+
+        if schema is None:
+            return {}
+        elif isinstance(schema, str):
+            if schema not in Starfile.column_schemas:
+                raise ValueError(
+                    f"Unknown schema {schema}, supported schemas are {', '.join(Starfile.column_schemas)}."
+                )
+            return Starfile.column_schemas[schema]
+        else:
+            return schema
+
+    @staticmethod
+    def is_integer_castable(values, dtype):
+        """This function checks whether numbers can be converted to an integer dtype without any change.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            the numbers to be converted
+        dtype : numpy.dtype
+            the integer dtype
+
+        Returns
+        -------
+        bool
+            True if all the numbers are integers (also if stored as floats) within the range of the dtype
+
+        """
+
+        if values.shape[0] == 0:
+            return True
+
+        info = np.iinfo(getattr(dtype, "numpy_dtype", dtype))
+        if values.dtype.kind == "f" and not np.array_equal(values, np.trunc(values)):
+            return False
+
+        return values.dtype.kind in "iuf" and values.min() >= info.min and values.max() <= info.max
+
+    @staticmethod
+    def cast_columns(frame, dtypes):
+        """This function converts the columns of a Pandas DataFrame to the given dtypes.
+
+        Parameters
+        ----------
+        frame : pandas.DataFrame
+            the frame to be converted
+        dtypes : dict
+            a dictionary mapping the column names to their dtypes
+
+        Returns
+        -------
+        pandas.DataFrame
+            the frame with converted columns
+
+        Raises
+        ------
+        IOError
+            If the values of some of the columns cannot be converted to their dtype, including values that would
+            change by the conversion to an integer dtype (e.g. 1.5 or numbers out of its range).
+
+        """
+
+        if not dtypes:
+            return frame
+
+        frame = frame.copy()
+        for column, dtype in dtypes.items():
+            try:
+                if dtype in ("str", "category", str):
+                    frame[column] = frame[column].astype(str).astype(dtype)
+                    continue
+
+                values = pd.to_numeric(frame[column])
+                target_dtype = pd.api.types.pandas_dtype(dtype)
+                if target_dtype.kind in "iu" and not Starfile.is_integer_castable(values.to_numpy(), target_dtype):
+                    raise ValueError("the values are not integers within the range of the dtype")
+                frame[column] = values.astype(target_dtype)
+            except (ValueError, TypeError) as e:
+                raise IOError(f"The values of the column {column} cannot be converted to {dtype}: {e}") from e
+
+        return frame
+
+    @staticmethod
+    def check_field_counts(text, n_columns, chunk_size=16777216):
+        """This function checks that all rows have the expected number of values without parsing them.
+
+        Parameters
+        ----------
+        text : str
+            the text with the rows, values are separated by whitespaces and anything after # is a comment
+        n_columns : int
+            the expected number of values in each row
+        chunk_size : int, default=16777216
+            the number of bytes processed at once. Defaults to 16777216.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        IOError
+            If some of the rows has a different number of values. Empty lines and lines with comments only are
+            skipped.
+
+        """
+
+        raw = text.encode("utf-8")
+        start = 0
+        n_lines = 0
+
+        while start < len(raw):
+            end = raw.find(b"\n", min(start + chunk_size, len(raw)))
+            end = len(raw) if end == -1 else end + 1
+            chunk = np.frombuffer(raw, dtype=np.uint8, count=end - start, offset=start)
+
+            # a value starts with a character that is not a whitespace (or a control character) following one
+            is_value = chunk > 32
+            value_starts = np.flatnonzero(is_value[1:] & ~is_value[:-1]) + 1
+            if is_value[0]:
+                value_starts = np.concatenate(([0], value_starts))
+
+            line_ends = np.append(np.flatnonzero(chunk[:-1] == 10) + 1, chunk.shape[0])
+            line_starts = np.concatenate(([0], line_ends[:-1]))
+            counts = np.diff(np.searchsorted(value_starts, line_ends), prepend=0)
+
+            # the lines with comments are rare, their values are counted one by one
+            if raw.find(b"#", start, end) != -1:
+                comment_positions = np.flatnonzero(chunk == 35)
+                for i in np.unique(np.searchsorted(line_starts, comment_positions, side="right") - 1):
+                    line = raw[start + line_starts[i] : start + line_ends[i]].decode("utf-8")
+                    counts[i] = len(line.split("#", 1)[0].split())
+
+            wrong_lines = np.flatnonzero((counts != 0) & (counts != n_columns))
+            if wrong_lines.shape[0] > 0:
+                i = wrong_lines[0]
+                raise IOError(
+                    f"Expected {n_columns} values in each row but the line {n_lines + i + 1} has {counts[i]} values."
+                )
+
+            n_lines += line_starts.shape[0]
+            start = end
+
+    @staticmethod
+    def rows_to_frame(rows, columns, usecols=None, schema=None):
+        """This function converts rows of a starfile block to a Pandas DataFrame.
+
+        Parameters
+        ----------
+        rows : list or str
+            list of rows (`str` type) with values separated by whitespaces or the text with all the rows. Anything
+            after # is treated as a comment and skipped.
+        columns : list
+            a list of column names
+        usecols : list, optional
+            names of the columns to return (in that order). If not specified, all columns are returned. Defaults to
+            None.
+        schema : str or dict, optional
+            the dtypes of the known columns, see :meth:`cryocat.starfileio.Starfile.get_schema`. These columns are
+            parsed directly into their dtypes. Defaults to None.
+
+        Returns
+        -------
+        pandas.DataFrame
+            the rows with values converted to numbers where possible
+
+        Raises
+        ------
+        IOError
+            If the number of values in some of the rows does not correspond to the number of columns or if the values
+            of some of the columns from the schema cannot be converted to their dtype.
+
+        """
+
+        schema = Starfile.get_schema(schema)
+        dtypes = {c: schema[c] for c in (columns if usecols is None else usecols) if c in schema}
+
+        if len(rows) == 0:
+            return Starfile.cast_columns(pd.DataFrame(columns=columns if usecols is None else usecols), dtypes)
+
+        text = rows if isinstance(rows, str) else "\n".join(rows)
+
+        # the values of the columns that are not read are skipped by pandas without checking their number
+        if usecols is not None:
+            Starfile.check_field_counts(text, len(columns))
+
+        def read_text(usecols, **kwargs):
+            # without index_col=False the first values of rows with one extra value would be used as the index, with it
+            # pandas warns about the extra values that would be dropped
+            with warnings.catch_warnings():
+                warnings.simplefilter("error", pd.errors.ParserWarning)
+                try:
+                    return pd.read_csv(
+                        io.StringIO(text),
+                        sep=r"\s+",
+                        header=None,
+                        names=columns,
+                        usecols=usecols,
+                        index_col=False,
+                        quoting=csv.QUOTE_NONE,
+                        na_filter=False,
+                        comment="#",
+                        **kwargs,
+                    )
+                except (pd.errors.ParserError, pd.errors.ParserWarning) as e:
+                    raise IOError(f"Expected {len(columns)} values in each row: {str(e).strip()}") from e
+
+        # the numbers are parsed by the C parser directly, its default precision gives the same values as to_numeric;
+        # the integer columns are converted after the parsing as the parser wraps the values out of the dtype range
+        numeric_dtypes = {c: d for c, d in dtypes.items() if pd.api.types.is_integer_dtype(d)}
+        try:
+            frame = read_text(usecols, dtype={c: d for c, d in dtypes.items() if c not in numeric_dtypes} or None)
+        except ValueError:
+            # values that do not fit the dtype (e.g. text in a float column) are converted after the parsing as well
+            numeric_dtypes = {c: d for c, d in dtypes.items() if d not in ("str", "category", str)}
+            frame = read_text(usecols, dtype={c: d for c, d in dtypes.items() if c not in numeric_dtypes} or None)
+
+        # missing values of the short rows are read as empty strings
+        last_column = frame.iloc[:, -1]
+        if not pd.api.types.is_numeric_dtype(last_column) and (last_column == "").any():
+            raise IOError(f"Expected {len(columns)} values in each row but some of the rows are shorter.")
+
+        frame = Starfile.cast_columns(frame, numeric_dtypes)
+
+        # values like True/False are kept as strings
+        bool_columns = frame.columns[frame.dtypes == bool].difference(dtypes.keys(), sort=False).tolist()
+        if bool_columns:
+            frame[bool_columns] = read_text(usecols=bool_columns, dtype=str)[bool_columns]
+
+        object_columns = frame.columns[frame.dtypes == object].difference(dtypes.keys(), sort=False)
+        frame[object_columns] = frame[object_columns].apply(pd.to_numeric, errors="ignore")
+
+        if usecols is not None:
+            frame = frame[list(usecols)]
+
+        return frame
+
     @staticmethod
     def get_specifier_id(speficiers, specifier_id):
         if specifier_id in speficiers:
@@ -421,17 +1168,83 @@ class Starfile:
 
     @staticmethod
     def get_frame_and_comments(file_path, specifier):
-        frames, specifiers, comments = Starfile.read(file_path)
+        return Starfile.read_block(file_path, specifier)
 
-        spec_id = Starfile.get_specifier_id(specifiers, specifier)
+    @staticmethod
+    def format_rows(frame, width=10):
+        """This function formats the rows of a Pandas DataFrame as lines of a starfile block.
 
-        if spec_id is None:
-            raise ValueError(f"There is no entry with specifier {specifier}.")
+        Parameters
+        ----------
+        frame : pandas.DataFrame
+            the rows to be formatted
+        width : int, default=10
+            minimal width of each value, shorter values are padded with spaces from the right. Defaults to 10.
+
+        Returns
+        -------
+        list
+            list of rows (`str` type) with the values separated by tabs
 
-        return frames[spec_id], comments[spec_id]
+        Notes
+        -----
+        The values are formatted column by column with `str`, the same as `"{:<10}".format(str(value))` applied to
+        each cell. Numeric and string columns are factorized first and each distinct value is formatted only once
+        (floats are distinguished by their bits, so e.g. -0.0 and 0.0 stay different).
+
+        """
+
+        formatted_columns = []
+        for column in frame.columns:
+            values = frame[column].to_numpy()
+
+            if values.dtype.kind in "biuf" or pd.api.types.infer_dtype(values, skipna=False) == "string":
+                keys = values.view(f"i{values.itemsize}") if values.dtype.kind == "f" else values
+                codes, uniques = pd.factorize(keys, use_na_sentinel=False)
+                if values.dtype.kind == "f":
+                    uniques = uniques.view(values.dtype)
+                unique_strings = list(map(str.ljust, map(str, uniques.tolist()), itertools.repeat(width)))
+                formatted_columns.append(np.array(unique_strings, dtype=object)[codes].tolist())
+            else:
+                object_values = frame[column].astype(object).tolist()
+                formatted_columns.append(list(map(str.ljust, map(str, object_values), itertools.repeat(width))))
+
+        return list(map("\t".join, zip(*formatted_columns)))
 
     @staticmethod
-    def write(frames, path, specifiers=None, comments=None, number_columns=True, float_precision=6):
+    def write(frames, path, specifiers=None, comments=None, number_columns=True, float_precision=6, chunk_rows=100000):
+        """This function writes a list of Pandas DataFrames as blocks of a starfile.
+
+        Parameters
+        ----------
+        frames : list
+            list of Pandas DataFrames to be written
+        path : str
+            the path of the starfile
+        specifiers : list, optional
+            list of the specifiers of the blocks. If not specified, "data" is used for all of them. Defaults to None.
+        comments : list, optional
+            list with a list of comments for each block. Defaults to None.
+        number_columns : bool, default=True
+            whether to write the numbers of the columns after their names. The columns of blocks with "stopgap" in their
+            specifier are never numbered. Defaults to True.
+        float_precision : int, default=6
+            number of decimals the values are rounded to. Defaults to 6.
+        chunk_rows : int, default=100000
+            number of rows that are formatted and written at once. Defaults to 100000.
+
+        Raises
+        ------
+        ValueError
+            If the lengths of the frames, specifiers and comments differ.
+
+        Notes
+        -----
+        The rows are formatted column by column (see :meth:`cryocat.starfileio.Starfile.format_rows`) and streamed to
+        the file in chunks, only one chunk of the formatted rows is kept in memory. The frames are not modified.
+
+        """
+
         if specifiers is None:
             specifiers = ["data"] * len(frames)
         if comments is None:
@@ -445,24 +1258,9 @@ class Starfile:
                 f"and (comments: {len(comments)})."
             )
 
-        for i, f in enumerate(frames):
-            frames[i] = f.round(float_precision)
-
         with open(path, "w") as file:
-
-            def write_with_number(name, number):
-                file.write(f"_{name} #{number}\n")
-
-            def write_without_number(name, _):
-                file.write(f"_{name}\n")
-
-            def format_value(value):
-                return "{:<10}".format(str(value))
-
             for frame, specifier, comment in zip(frames, specifiers, comments):
-                frame = frame.applymap(format_value)
                 stopgap = "stopgap" in specifier
-                write_function = write_without_number if not number_columns or stopgap else write_with_number
                 if comment is not None:
                     for c in comment:
                         file.write(f"\n# {c}")
@@ -470,12 +1268,14 @@ class Starfile:
                 file.write(f"\n{specifier}\n\n")
                 file.write("loop_\n")
                 for index, column in enumerate(frame.columns, 1):
-                    write_function(column, index)
+                    if not number_columns or stopgap:
+                        file.write(f"_{column}\n")
+                    else:
+                        file.write(f"_{column} #{index}\n")
                 if stopgap:
                     file.write("\n")
 
-                for row in frame.itertuples(index=False):
-                    file.write("\t".join(map(str, row)) + "\n")
-                # formatted_row = "\t".join("{:<10}".format(str(value)) for value in row)
-                # file.write(formatted_row + "\n")
+                for start in range(0, len(frame), chunk_rows):
+                    rows = Starfile.format_rows(frame.iloc[start : start + chunk_rows].round(float_precision))
+                    file.write("\n".join(rows) + "\n")
                 file.write("\n")
@@ -2,7 +2,6 @@ import numpy as np
 import pandas as pd
 import warnings
 import decimal
-import os
 from cryocat import cryomotl
 from cryocat import cryomap
 from cryocat import cryomask
@@ -108,6 +107,7 @@ class NPC:
             angles = rotations.as_euler("zxz", degrees=True)
             tm.fill({"angles": angles})
             traced_motl.df.loc[traced_motl.df["tomo_id"] == t, :] = tm.df.values
+            traced_motl.invalidate_cache()
 
         return cryomotl.Motl(traced_motl.df.sort_values(by="subtomo_id"))
 
@@ -120,17 +120,13 @@ class NPC:
         max_trace_distance,
         min_trace_distance=0,
     ):
-        working_dir, _ = os.path.split(input_motl_path)
-        entry_mask = working_dir + "entry_mask.em"
-        exit_mask = working_dir + "exit_mask.em"
-        _ = cryomask.spherical_mask(mask_size, 3, center=entry_mask_coord, output_name=entry_mask)
-        _ = cryomask.spherical_mask(mask_size, 3, center=exit_mask_coord, output_name=exit_mask)
+        entry_mask = cryomask.spherical_mask(mask_size, 3, center=entry_mask_coord)
+        exit_mask = cryomask.spherical_mask(mask_size, 3, center=exit_mask_coord)
 
         motl = cryomotl.Motl.load(input_motl_path)
         motl.renumber_particles()
 
-        motl_entry = cryomotl.Motl.recenter_to_subparticle(motl, entry_mask)
-        motl_exit = cryomotl.Motl.recenter_to_subparticle(motl, exit_mask)
+        motl_entry, motl_exit = cryomotl.Motl.recenter_to_subparticle(motl, [entry_mask, exit_mask])
 
         # tracing
         traced_motl = ribana.trace_chains(
@@ -145,9 +141,6 @@ class NPC:
 
         new_traced_motl = NPC.merge_subunits(motl, npc_radius=npc_radius)
 
-        os.remove(entry_mask)
-        os.remove(exit_mask)
-
         return new_traced_motl
 
     @staticmethod
@@ -279,6 +272,7 @@ class NPC:
                             # change object_id of the other object to the one of the first object
                             o_id2 = new_object_motl.df.loc[new_object_motl.df.index[j], "object_id"]
                             tm.df.loc[tm.df["object_id"] == o_id2, "object_id"] = o_id1
+                            tm.invalidate_cache("object_id")
 
             tm.df["geom1"] = tm.df.groupby(["object_id"])["object_id"].transform("count")
 
@@ -287,6 +281,7 @@ class NPC:
                 om = tm.get_motl_subset(feature_values=o, feature_id="object_id", reset_index=True)
                 s_idx = NPC.get_new_subunit_idx(om, npc_radius)
                 tm.df.loc[tm.df["object_id"] == o, "geom2"] = s_idx
+                tm.invalidate_cache("geom2")
 
             # squeeze the object_idx to be in sequence
             tm.df["object_id"] = tm.df["object_id"].rank(method="dense").astype(int)
@@ -295,6 +290,7 @@ class NPC:
             input_motl.df.loc[input_motl.df["tomo_id"] == t, ["object_id", "geom1", "geom2"]] = tm.df[
                 ["object_id", "geom1", "geom2"]
             ].values
+            input_motl.invalidate_cache(["object_id", "geom1", "geom2"])
 
         input_motl.df.reset_index(inplace=True, drop=True)
         input_motl.df["geom1"] = input_motl.df.groupby(["tomo_id", "object_id"])["object_id"].transform("count")
@@ -361,7 +357,7 @@ class PleomorphicSurface:
     @staticmethod
     def get_parametric_description(input_motl, feature_id="object_id", output_file=None):
 
-        in_motl = cryomotl.Motl.load(input_motl)
+        in_motl = cryomotl.Motl.load(input_motl, share_data=True)
         features = in_motl.get_unique_values(feature_id=feature_id)
         el_params_all = pd.DataFrame()
 
@@ -445,8 +441,8 @@ class PleomorphicSurface:
         motl_radius_id="geom5",
     ):
 
-        in_motl = cryomotl.Motl.load(input_motl)
-        object_motl = cryomotl.Motl.load(object_motl)
+        in_motl = cryomotl.Motl.load(input_motl, share_data=True)
+        object_motl = cryomotl.Motl.load(object_motl, share_data=True)
 
         tomo_dim = ioutils.dimensions_load(tomo_dim)
         tomos = in_motl.get_unique_values(feature_id="tomo_id")
@@ -521,6 +517,7 @@ class PleomorphicSurface:
 
         if unassigned_value:
             assigned_motl.df.loc[assigned_motl.df[feature_id] == unassigned_value, :] = assigned_motl_df.values
+            assigned_motl.invalidate_cache()
         else:
             assigned_motl = cryomotl.Motl(assigned_motl_df)
 
@@ -536,7 +533,7 @@ class PleomorphicSurface:
         input_motl, parametric_surface, feature_id="object_id", output_file=None, keep_unassigned=True
     ):
 
-        in_motl = cryomotl.Motl.load(input_motl)
+        in_motl = cryomotl.Motl.load(input_motl, share_data=True)
         el_params = PleomorphicSurface.load_parametric_surface(
             parametric_surface=parametric_surface, feature_id=feature_id
         )
@@ -597,7 +594,7 @@ class PleomorphicSurface:
     @staticmethod
     def compute_intersection(input_motl, parametric_surface, feature_id="object_id"):
 
-        in_motl = cryomotl.Motl.load(input_motl)
+        in_motl = cryomotl.Motl.load(input_motl, share_data=True)
         el_params = PleomorphicSurface.load_parametric_surface(
             parametric_surface=parametric_surface, feature_id=feature_id
         )
@@ -621,7 +618,7 @@ class PleomorphicSurface:
     @staticmethod
     def clean_by_normals(input_motl, feature_id="object_id", threshold=None, output_file=None):
 
-        in_motl = cryomotl.Motl.load(input_motl)
+        in_motl = cryomotl.Motl.load(input_motl, share_data=True)
         features = in_motl.get_unique_values(feature_id=feature_id)
         el_params = PleomorphicSurface.get_parametric_description(in_motl, feature_id=feature_id)
 
@@ -658,7 +655,7 @@ class PleomorphicSurface:
     @staticmethod
     def clean_by_radius(input_motl, feature_id="object_id", threshold=None, output_file=None):
 
-        in_motl = cryomotl.Motl.load(input_motl)
+        in_motl = cryomotl.Motl.load(input_motl, share_data=True)
         features = in_motl.get_unique_values(feature_id=feature_id)
         el_params = PleomorphicSurface.get_parametric_description(in_motl, feature_id=feature_id)
 
@@ -702,7 +699,7 @@ class PleomorphicSurface:
         sampling_angle=360,
         output_path=None,
     ):
-        motl = cryomotl.Motl.load(input_motl)
+        motl = cryomotl.Motl.load(input_motl, share_data=True)
         new_motl_df = pd.DataFrame()
         for tomo in motl.get_unique_values("tomo_id"):
             tm = motl.get_motl_subset(tomo)
@@ -750,6 +747,7 @@ class MAK:
             motl_object_id.df.loc[lambda df: df["object_id"] == i, ["x"]] = ctr_coordx
             motl_object_id.df.loc[lambda df: df["object_id"] == i, ["y"]] = ctr_coordy
             motl_object_id.df.loc[lambda df: df["object_id"] == i, ["z"]] = ctr_coordz
+            motl_object_id.invalidate_cache(["x", "y", "z"])
         motl_object_i.update_coordinates()
         if output_path is not None:
             cryomotl.Motl.write_out(motl_object_id, output_path)
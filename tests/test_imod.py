@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cryocat import imod
+
+
+@pytest.mark.parametrize("n_points, n_objects, n_contours", [(1, 1, 1), (200, 4, 6), (500, 1, 50)])
+def test_write_model_binary(tmp_path, n_points, n_objects, n_contours):
+    rng = np.random.default_rng(n_points)
+    df = pd.DataFrame(
+        {
+            "object_id": rng.integers(1, n_objects + 1, n_points) * 2,
+            "contour_id": rng.integers(1, n_contours + 1, n_points),
+            "x": rng.random(n_points) * 100,
+            "y": rng.random(n_points) * 100,
+            "z": rng.random(n_points) * 100,
+        }
+    )
+    imod.write_model_binary(df, str(tmp_path / "model.mod"))
+    mod_df = imod.read_mod_file(str(tmp_path / "model.mod"))
+
+    # Objects are written in order of appearance, contours sorted within each object
+    object_ids = pd.unique(df["object_id"])
+    expected_df = df.assign(order=pd.Categorical(df["object_id"], categories=object_ids).codes)
+    expected_df = expected_df.sort_values(["order", "contour_id"], kind="stable")
+
+    assert len(mod_df) == n_points
+    assert mod_df["object_id"].nunique() == len(object_ids)
+    assert np.array_equal(mod_df["object_id"].to_numpy(), expected_df["order"].to_numpy() + 1)
+    assert np.allclose(mod_df[["x", "y", "z"]].to_numpy(), expected_df[["x", "y", "z"]].to_numpy(), atol=1e-4)
+    for _, object_df in expected_df.groupby("order"):
+        contours = mod_df.loc[mod_df["object_id"] == object_df["order"].iloc[0] + 1, "contour_id"]
+        assert contours.nunique() == object_df["contour_id"].nunique()
+
+    with open(str(tmp_path / "model.mod"), "rb") as f:
+        data = f.read()
+    assert data[:8] == b"IMODV1.2" and data[-4:] == b"IEOF"
@@ -1,9 +1,16 @@
+import decimal
+import emfile
 import numpy as np
 import pandas as pd
 import pytest
 
-from cryocat.cryomotl import Motl
+from cryocat import cryomask
+from cryocat import cryomotl
+from cryocat import geom
+from cryocat import starfileio
+from cryocat.cryomotl import EmMotl, H5Motl, Motl, RelionMotl
 from cryocat.exceptions import UserInputError
+from scipy.spatial.transform import Rotation as rot
 
 
 @pytest.fixture
@@ -59,6 +66,38 @@ def test_read_from_emfile(m):
     check_emmotl(motl)
 
 
+@pytest.mark.parametrize("m", ["./tests/test_data/au_1.em", "./tests/test_data/au_2.em"])
+@pytest.mark.parametrize("keep_float32", [False, True])
+def test_emmotl_read_in(m, keep_float32):
+    header, parsed_emfile = emfile.read(m)
+    motl_df, motl_header = EmMotl.read_in(m, keep_float32=keep_float32)
+
+    assert motl_header == header
+    assert motl_df.dtypes.unique().tolist() == [np.float32 if keep_float32 else np.float64]
+    assert np.array_equal(motl_df.to_numpy(), parsed_emfile[0])
+
+    # changes are not written to the file
+    motl_df.loc[:, "x"] = -1
+    assert np.array_equal(EmMotl.read_in(m)[0].to_numpy(), parsed_emfile[0])
+
+
+@pytest.mark.parametrize("dtype_code", [2, 3, 8])
+def test_emmotl_read_in_dtypes(tmp_path, dtype_code):
+    motl_array = np.arange(60, dtype=np.int16).reshape((1, 3, 20))
+    emfile.write(str(tmp_path / "motl.em"), motl_array, overwrite=True)
+
+    # the type of the data is stored in the fourth byte of the header
+    with open(tmp_path / "motl.em", "r+b") as em_file:
+        em_file.seek(3)
+        em_file.write(bytes([dtype_code]))
+
+    if dtype_code == 2:
+        assert np.array_equal(EmMotl.read_in(str(tmp_path / "motl.em"))[0].to_numpy(), motl_array[0])
+    else:
+        with pytest.raises(UserInputError):
+            EmMotl.read_in(str(tmp_path / "motl.em"))
+
+
 @pytest.mark.parametrize("m", ["./tests/test_data/col_missing.em", "./tests/test_data/extra_col.em"])
 # TODO did not manage to write out corrupted em file '/test/na_values.em', '/test/bad_values.em'
 def test_read_from_emfile_wrong(m):
@@ -82,8 +121,31 @@ def test_merge_and_renumber(motl_list):
     assert len(merged_motl.df) == combined_len
 
 
+@pytest.mark.parametrize("n_workers", [1, 3])
+def test_merge_and_renumber_object_ids(tmp_path, n_workers):
+    object_ids = [[1, 1, 2], [5, 6], [3, 3], []]
+    motls = []
+    for i, ids in enumerate(object_ids):
+        motl_df = Motl.create_empty_motl_df()
+        motl_df["object_id"] = np.array(ids, dtype=float)
+        motl_df = motl_df.fillna(0.0)
+        motl_df["tomo_id"] = i + 1
+        motls.append(Motl(motl_df))
+        motls[-1].write_out(str(tmp_path / f"tomo_{i}.em"))
+
+    merged_motl = Motl.merge_and_renumber(motls, n_workers=n_workers)
+    assert np.array_equal(merged_motl.df["object_id"], [1, 1, 2, 5, 6, 7, 7])
+    assert np.array_equal(merged_motl.df["subtomo_id"], np.arange(1, 8))
+    assert np.array_equal(merged_motl.df["tomo_id"], [1, 1, 1, 2, 2, 3, 3])
+    assert np.array_equal(motls[2].df["object_id"], [3, 3])
+
+    merged_files = Motl.merge_and_renumber(str(tmp_path / "tomo_*.em"), n_workers=n_workers)
+    assert np.allclose(merged_files.df.to_numpy(), merged_motl.df.to_numpy())
+
+
 @pytest.mark.parametrize(
-    "motl_list", ["./tests/test_data/au_1.em", [], (), "not_a_list", 42, ["./tests/test_data/au_1.em", None]]
+    "motl_list",
+    ["./tests/test_data/au_1.em", [], (), "not_a_list", 42, ["./tests/test_data/au_1.em", None], "./tests/none_*.em"],
 )
 def test_merge_and_renumber_wrong(motl_list):
     with pytest.raises((ValueError, UserInputError)):
@@ -111,6 +173,26 @@ def test_recenter_particles(m, ref):
     assert motl.df.equals(ref_motl.df)
 
 
+@pytest.mark.parametrize(
+    "coord, shift",
+    [
+        ([0.5, 1.5, 2.5], [0.0, 0.0, 0.0]),
+        ([-0.5, -1.5, -2.5], [0.0, 0.0, 0.0]),
+        ([10.0, 20.0, 30.0], [0.49999999999999994, -0.49999999999999994, 0.5]),
+        ([100.2, -3.7, 0.0], [1.3, 2.5, -0.5]),
+    ],
+)
+def test_update_coordinates_round_half_up(coord, shift):
+    motl = Motl()
+    motl.fill({"coord": [coord], "shifts": [shift]})
+    motl.update_coordinates()
+
+    shifted = np.array(coord) + np.array(shift)
+    expected = [float(decimal.Decimal(c).to_integral_value(rounding=decimal.ROUND_HALF_UP)) for c in shifted]
+    assert np.array_equal(motl.df.loc[0, ["x", "y", "z"]].values, expected)
+    assert np.array_equal(motl.df.loc[0, ["shift_x", "shift_y", "shift_z"]].values, shifted - expected)
+
+
 @pytest.mark.parametrize(
     "m, shift, ref",
     [
@@ -148,3 +230,683 @@ def test_shift_positions(m, shift, ref):
     assert np.allclose(
         motl.df.iloc[0, :].values, ref_motl.df.iloc[0, :].values, rtol=1e-05, atol=1e-08, equal_nan=False
     )
+
+
+@pytest.mark.parametrize("rotation", [None, rot.from_euler("zxz", [10, 20, 30], degrees=True)])
+def test_recenter_to_subparticle(rotation):
+    motl = Motl.load("./tests/test_data/shift_positions/allmotl_sp_cl1_5.em")
+    mask_centers = np.array([[20, 32, 50], [32, 10, 14]])
+    masks = [cryomask.spherical_mask(64, 3, center=c) for c in mask_centers]
+
+    recentered_motls = Motl.recenter_to_subparticle(motl, masks, rotation=rotation)
+    assert len(recentered_motls) == 2
+
+    for mask, mask_center, recentered_motl in zip(masks, mask_centers, recentered_motls):
+        expected_motl = motl.shift_positions(mask_center - 32, inplace=False)
+        expected_motl.update_coordinates()
+        if rotation is not None:
+            expected_motl.apply_rotation(rotation)
+        assert recentered_motl.df.equals(expected_motl.df)
+
+        single_motl = Motl.recenter_to_subparticle(motl, mask, rotation=rotation)
+        assert single_motl.df.equals(expected_motl.df)
+
+    center_motls = Motl.recenter_to_subparticle(motl, mask_center=mask_centers, box_size=64, rotation=rotation)
+    for center_motl, recentered_motl in zip(center_motls, recentered_motls):
+        assert np.allclose(center_motl.df.values, recentered_motl.df.values)
+
+
+def test_recenter_to_subparticle_wrong():
+    motl = Motl.load("./tests/test_data/shift_positions/allmotl_sp_cl1_5.em")
+    with pytest.raises(UserInputError):
+        Motl.recenter_to_subparticle(motl)
+    with pytest.raises(UserInputError):
+        Motl.recenter_to_subparticle(motl, mask_center=[32, 32, 32])
+
+
+def create_clustered_motl(n_particles=500, n_tomos=3, seed=0):
+    rng = np.random.default_rng(seed)
+    motl = Motl()
+    motl.fill(
+        {
+            "coord": rng.random((n_particles, 3)) * 100,
+            "score": rng.random(n_particles),
+            "tomo_id": rng.integers(1, n_tomos + 1, n_particles),
+            "subtomo_id": np.arange(1, n_particles + 1),
+        }
+    )
+    motl.df = motl.df.astype(float)
+    return motl
+
+
+@pytest.mark.parametrize("distance, score_cut", [(5, 0), (10, 0.3), (0, 0)])
+def test_clean_by_distance_kdtree(distance, score_cut):
+    motl_bf = create_clustered_motl()
+    motl_kd = Motl(motl_bf.df.copy())
+
+    motl_bf.clean_by_distance(distance, "tomo_id", score_cut=score_cut, method="brute_force")
+    motl_kd.clean_by_distance(distance, "tomo_id", score_cut=score_cut, method="kdtree")
+
+    assert motl_bf.df.equals(motl_kd.df)
+
+
+def test_clean_by_distance_wrong_method():
+    motl = create_clustered_motl(n_particles=10)
+    with pytest.raises(UserInputError):
+        motl.clean_by_distance(5, "tomo_id", method="voxel")
+
+
+def test_clean_by_distance_to_points():
+    motl = create_clustered_motl()
+    points = motl.df.loc[::10, ["tomo_id", "x", "y", "z"]]
+    cleaned_motl = motl.clean_by_distance_to_points(points, 8, inplace=False)
+
+    coord = cleaned_motl.get_coordinates()
+    for t in cleaned_motl.get_unique_values("tomo_id"):
+        t_coord = coord[cleaned_motl.df["tomo_id"] == t]
+        p_coord = points.loc[points["tomo_id"] == t, ["x", "y", "z"]].values
+        dist = np.linalg.norm(t_coord[:, np.newaxis, :] - p_coord[np.newaxis, :, :], axis=2)
+        assert np.all(dist > 8)
+
+    assert cleaned_motl.df.shape[0] < motl.df.shape[0]
+
+
+@pytest.mark.parametrize("method", ["brute_force", "kdtree"])
+def test_clean_by_distance_n_workers(method):
+    motl_serial = create_clustered_motl(n_tomos=5)
+    motl_parallel = Motl(motl_serial.df.copy())
+
+    motl_serial.clean_by_distance(6, "tomo_id", method=method)
+    motl_parallel.clean_by_distance(6, "tomo_id", method=method, n_workers=4)
+
+    assert motl_serial.df.equals(motl_parallel.df)
+
+
+@pytest.mark.parametrize("boundary_type, box_size", [("center", None), ("whole", 20)])
+def test_remove_out_of_bounds_particles(boundary_type, box_size):
+    motl = create_clustered_motl(n_tomos=3)
+    dims = np.array([[1, 90, 100, 100], [2, 100, 80, 100], [3, 100, 100, 50]])
+    motl_df_dims = Motl(motl.df.copy())
+
+    motl.remove_out_of_bounds_particles(dims, boundary_type=boundary_type, box_size=box_size)
+    # the dimensions are joined by tomo_id, not by their order
+    dims_df = pd.DataFrame(dims[::-1], columns=["tomo_id", "x", "y", "z"])
+    motl_df_dims.remove_out_of_bounds_particles(dims_df, boundary_type=boundary_type, box_size=box_size)
+
+    assert motl.df.equals(motl_df_dims.df)
+
+    boundary = 0 if box_size is None else box_size / 2
+    coord = motl.get_coordinates()
+    tomo_dims = dims[motl.df["tomo_id"].values.astype(int) - 1, 1:]
+    assert np.all(coord - boundary >= 0) and np.all(coord + boundary < tomo_dims)
+
+
+def test_apply_tomo_rotation():
+    motl = create_clustered_motl(n_particles=50, n_tomos=3)
+    angles = np.array([[0, 0, 90], [10, 20, 30], [0, 45, 0]])
+    dims = np.array([[100, 100, 50], [100, 100, 60], [100, 100, 70]])
+
+    serial = [motl.apply_tomo_rotation(angles[i], t, dims[i]).df for i, t in enumerate([1, 2, 3])]
+    all_motl = motl.apply_tomo_rotation(angles, [1, 2, 3], dims)
+
+    assert pd.concat(serial, ignore_index=True).equals(all_motl.df)
+
+    # dimensions with tomo_id are joined to the particles, the tomograms are taken from them
+    dims_df = pd.DataFrame({"tomo_id": [1, 2, 3], "x": dims[:, 0], "y": dims[:, 1], "z": dims[:, 2]})
+    assert motl.apply_tomo_rotation(angles, tomo_dim=dims_df).df.equals(all_motl.df)
+
+    with pytest.raises(UserInputError):
+        motl.apply_tomo_rotation(angles, [1, 2, 3], dims_df.iloc[:2])
+
+
+def test_get_values_by_feature():
+    motl = create_clustered_motl(n_particles=20, n_tomos=3)
+    dims = pd.DataFrame({"tomo_id": [3, 1, 2, 1], "z": [30, 10, 20, 40]})
+
+    z_dims = motl.get_values_by_feature(dims, ["z"])
+    assert np.array_equal(z_dims[:, 0], motl.df["tomo_id"].to_numpy() * 10)
+
+    with pytest.raises(UserInputError):
+        motl.get_values_by_feature(dims.iloc[:2], ["z"])
+
+    z_dims = motl.get_values_by_feature(dims.iloc[:2], ["z"], fill_value=np.nan)
+    assert np.all(np.isnan(z_dims[motl.df["tomo_id"].to_numpy() == 2]))
+
+
+def test_clean_by_tomo_mask_n_workers():
+    motl = create_clustered_motl(n_tomos=3)
+    tomo_mask = np.zeros((100, 100, 100))
+    tomo_mask[:50, :, :] = 1
+
+    cleaned_serial = motl.clean_by_tomo_mask([1, 2, 3], tomo_mask, inplace=False)
+    cleaned_parallel = motl.clean_by_tomo_mask([1, 2, 3], [tomo_mask] * 3, inplace=False, n_workers=3)
+
+    assert cleaned_serial.df.equals(cleaned_parallel.df)
+    assert np.all(cleaned_serial.get_coordinates()[:, 0].astype(int) < 50)
+
+
+@pytest.mark.parametrize("feature_values", [1, [3, 1], [2, 5], 5])
+def test_get_motl_subset(feature_values):
+    motl = create_clustered_motl(n_particles=60, n_tomos=3)
+    motl.df = motl.df.sample(frac=1, random_state=0)
+
+    expected = pd.concat([motl.df.loc[motl.df["tomo_id"] == v] for v in np.atleast_1d(feature_values)])
+    subset = motl.get_motl_subset(feature_values, feature_id="tomo_id")
+
+    assert np.array_equal(subset.df.to_numpy(), expected.to_numpy())
+    assert np.array_equal(subset.df.index, np.arange(expected.shape[0]))
+
+
+def test_group_index_invalidation():
+    motl = create_clustered_motl(n_particles=60, n_tomos=3)
+    group_index = motl.get_group_index("tomo_id")
+    assert motl.get_group_index("tomo_id") is group_index
+    assert sorted(group_index.keys()) == [1, 2, 3]
+
+    # replaced column
+    motl.df["tomo_id"] = motl.df["tomo_id"] + 10
+    assert sorted(motl.get_group_index("tomo_id").keys()) == [11, 12, 13]
+
+    # in-place changes require explicit invalidation
+    motl.df.loc[motl.df["tomo_id"] == 12, "tomo_id"] = 11
+    motl.invalidate_cache("tomo_id")
+    assert sorted(motl.get_group_index("tomo_id").keys()) == [11, 13]
+    assert motl.get_motl_subset(11).df.shape[0] == (motl.df["tomo_id"] == 11).sum()
+    motl.df.loc[:, "tomo_id"] = 5
+    motl.invalidate_cache()
+    assert list(motl.get_group_index("tomo_id").keys()) == [5]
+    motl.df.loc[0, "tomo_id"] = np.nan
+    motl.invalidate_cache(["x", "tomo_id"])
+    assert motl.get_motl_subset(5).df.shape[0] == 59
+
+    # invalidation of other columns keeps the index
+    group_index = motl.get_group_index("tomo_id")
+    motl.invalidate_cache("x")
+    assert motl.get_group_index("tomo_id") is group_index
+
+    # renumbering changes the values in place
+    motl.df.loc[:, "subtomo_id"] = 1
+    motl.get_group_index("subtomo_id")
+    motl.renumber_particles()
+    assert len(motl.get_group_index("subtomo_id")) == 60
+
+    with pytest.raises(UserInputError):
+        motl.get_group_index("not_a_column")
+
+
+def test_iter_groups():
+    motl = create_clustered_motl(n_particles=60, n_tomos=3)
+    motl.df = motl.df.sort_values("tomo_id", kind="stable")
+
+    groups = list(motl.iter_groups("tomo_id"))
+    assert [g[0] for g in groups] == [1, 2, 3]
+
+    for value, group_motl in groups:
+        assert group_motl.df.equals(motl.df.loc[motl.df["tomo_id"] == value])
+
+    # sorted motl results in views
+    assert np.shares_memory(groups[0][1].df["x"].to_numpy(), motl.df["x"].to_numpy())
+
+    # unsorted motl
+    motl.df = motl.df.sample(frac=1, random_state=0)
+    for value, group_motl in motl.iter_groups("tomo_id"):
+        assert group_motl.df.equals(motl.df.loc[motl.df["tomo_id"] == value])
+
+
+@pytest.mark.parametrize("deep", [True, False])
+def test_copy(deep):
+    motl = create_clustered_motl(n_particles=30, n_tomos=2)
+    original_df = motl.df.copy()
+
+    motl_copy = motl.copy(deep=deep)
+    assert motl_copy.df.equals(motl.df)
+    assert np.shares_memory(motl_copy.df["x"].to_numpy(), motl.df["x"].to_numpy()) != deep
+
+    # methods of Motl do not change the shared data
+    motl_copy.apply_rotation(rot.from_euler("zxz", [10, 20, 30], degrees=True))
+    motl_copy.flip_handedness(np.array([[100, 100, 100]]))
+    motl_copy.adapt_to_trimming(np.array([2, 2, 2]), np.array([100, 100, 100]))
+    motl_copy.renumber_particles()
+    motl_copy.update_coordinates()
+
+    assert motl.df.equals(original_df)
+
+
+def test_load_share_data():
+    motl = create_clustered_motl(n_particles=30, n_tomos=2)
+
+    assert not np.shares_memory(Motl.load(motl).df["x"].to_numpy(), motl.df["x"].to_numpy())
+    shared_motl = Motl.load(motl, share_data=True)
+    assert np.shares_memory(shared_motl.df["x"].to_numpy(), motl.df["x"].to_numpy())
+    assert type(shared_motl) is type(motl)
+
+
+@pytest.mark.parametrize("feature_id", ["tomo_id", None])
+def test_spatial_index(feature_id):
+    motl = create_clustered_motl(n_particles=90, n_tomos=3)
+    group = None if feature_id is None else 2
+
+    spatial_index = motl.spatial_index(feature_id)
+    assert motl.spatial_index(feature_id) is spatial_index
+
+    positions = spatial_index.get_positions(group)
+    coord = motl.get_coordinates()[positions, :]
+    query_points = coord[:5, :] + 0.5
+
+    dist, idx = spatial_index.query(query_points, k=3, group=group)
+    brute_dist = np.linalg.norm(coord[np.newaxis, :, :] - query_points[:, np.newaxis, :], axis=2)
+    assert np.allclose(dist, np.sort(brute_dist, axis=1)[:, :3])
+    assert np.allclose(brute_dist[np.arange(5)[:, np.newaxis], idx], dist)
+
+    nn_idx = spatial_index.query_radius(query_points, 15, group=group)
+    for i in range(5):
+        assert np.array_equal(np.sort(nn_idx[i]), np.flatnonzero(brute_dist[i] <= 15))
+
+    counts = spatial_index.query_radius(query_points, 15, group=group, count_only=True)
+    assert np.array_equal(counts, [len(n) for n in nn_idx])
+
+    # changed shifts invalidate the index
+    motl.df["shift_x"] = motl.df["shift_x"] + 100
+    assert motl.spatial_index(feature_id) is not spatial_index
+    assert np.allclose(motl.spatial_index(feature_id).coord[:, 0], motl.get_coordinates()[:, 0])
+
+
+def test_spatial_index_wrong_group():
+    motl = create_clustered_motl(n_particles=30, n_tomos=2)
+
+    with pytest.raises(UserInputError):
+        motl.spatial_index("tomo_id").query(np.zeros((1, 3)))
+
+    with pytest.raises(UserInputError):
+        motl.spatial_index("tomo_id").query(np.zeros((1, 3)), group=10)
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_h5motl_round_trip(tmp_path, compression):
+    motl = create_clustered_motl(n_particles=100, n_tomos=3)
+    motl_df = motl.df.astype({"tomo_id": np.int32, "subtomo_id": np.int64})
+    motl_df["tomo_name"] = pd.Categorical(["TS_" + str(int(t)) for t in motl_df["tomo_id"]])
+    motl_df["label"] = "particle"
+
+    h5_motl = H5Motl(motl_df)
+    h5_motl.write_out(str(tmp_path / "motl.h5"), compression=compression, chunk_rows=16)
+    loaded_motl = Motl.load(str(tmp_path / "motl.h5"), motl_type="h5")
+
+    assert isinstance(loaded_motl, H5Motl)
+    assert loaded_motl.df.equals(h5_motl.df)
+    assert loaded_motl.df.dtypes.equals(h5_motl.df.dtypes)
+
+    subset_df = H5Motl.read_in(str(tmp_path / "motl.h5"), columns=["score", "tomo_name"], row_range=(10, 40))
+    assert subset_df.equals(h5_motl.df.loc[10:39, ["score", "tomo_name"]].reset_index(drop=True))
+
+    with pytest.raises(UserInputError):
+        H5Motl.read_in(str(tmp_path / "motl.h5"), columns=["not_a_column"])
+
+
+def test_h5motl_write_out_motl(tmp_path):
+    motl = create_clustered_motl(n_particles=20, n_tomos=2)
+    motl.write_out(str(tmp_path / "motl.h5"), motl_type="h5")
+
+    assert Motl.load(str(tmp_path / "motl.h5"), motl_type="h5").df.equals(motl.df)
+    assert H5Motl.read_in(str(tmp_path / "motl.h5"), row_range=(5, 5)).shape == (0, 20)
+
+
+def test_compact():
+    motl = create_clustered_motl(n_particles=60, n_tomos=3)
+    compact_motl = Motl(motl.df.copy())
+    compact_motl.compact()
+
+    assert compact_motl.is_compact() and not motl.is_compact()
+    assert compact_motl.df.memory_usage().sum() < motl.df.memory_usage().sum()
+    assert compact_motl.df["tomo_id"].dtype == np.int32 and compact_motl.df["x"].dtype == np.float32
+    assert np.allclose(compact_motl.df.to_numpy(dtype=float), motl.df.to_numpy(), rtol=1e-6)
+
+    # representation is kept
+    compact_motl.fill({"score": np.ones(60), "tomo_id": np.full(60, 2.0)})
+    assert compact_motl.is_compact()
+    assert all(m.is_compact() for m in compact_motl.split_by_feature("object_id"))
+    assert Motl.merge_and_renumber([compact_motl, compact_motl]).is_compact()
+
+    # non-integer ids are not converted
+    motl.df["object_id"] = 0.5
+    assert Motl.get_compact_df(motl.df)["object_id"].dtype == np.float64
+
+    # string columns with repeated values
+    motl_df = motl.df.assign(tomo_name=["TS_1"] * 30 + ["TS_2"] * 30)
+    assert isinstance(Motl.get_compact_df(motl_df)["tomo_name"].dtype, pd.CategoricalDtype)
+
+
+def test_compact_mode(monkeypatch):
+    monkeypatch.setattr(Motl, "compact_mode", True)
+
+    assert Motl().is_compact()
+    assert Motl.load("./tests/test_data/au_1.em").is_compact()
+
+    motl = create_clustered_motl(n_particles=30, n_tomos=2)
+    assert motl.is_compact()
+    assert motl.get_motl_subset(1).is_compact()
+
+    # converters produce the compact representation as well (object_id is not defined in this file and stays NaN)
+    relion_motl = Motl.load("./tests/test_data/relion_3.1_optics.star", motl_type="relion")
+    assert relion_motl.df["tomo_id"].dtype == np.int32
+    assert relion_motl.df["x"].dtype == np.float32
+
+
+def test_compact_mode_stopgap(tmp_path, monkeypatch):
+    star_file = str(tmp_path / "sg.star")
+    motl = create_clustered_motl(n_particles=30, n_tomos=2)
+    motl.write_out(star_file, motl_type="stopgap")
+    motl = Motl.load(star_file, motl_type="stopgap")
+    motl.compact()
+
+    # the stopgap columns are parsed directly into the compact dtypes
+    monkeypatch.setattr(Motl, "compact_mode", True)
+    compact_motl = Motl.load(star_file, motl_type="stopgap")
+    assert compact_motl.sg_df["tomo_num"].dtype == np.int32 and compact_motl.sg_df["orig_x"].dtype == np.float32
+    pd.testing.assert_frame_equal(compact_motl.df, motl.df)
+
+    chunks = list(Motl.iter_load(star_file, motl_type="stopgap", chunk_rows=7))
+    assert all(chunk.is_compact() for chunk in chunks)
+    pd.testing.assert_frame_equal(pd.concat([chunk.df for chunk in chunks], ignore_index=True), motl.df)
+
+
+def test_split_in_asymmetric_subunits():
+    motl = Motl()
+    motl.fill({"coord": np.array([[50.0, 50.0, 50.0]]), "subtomo_id": [7], "angles": np.zeros((1, 3))})
+    motl.df = motl.df.fillna(0.0)
+
+    with pytest.warns(UserWarning):
+        subunits = motl.split_in_asymmetric_subunits("C4", [10, 0, 0])
+
+    assert np.allclose(subunits.get_coordinates(), [[60, 50, 50], [50, 60, 50], [40, 50, 50], [50, 40, 50]])
+    assert np.array_equal(subunits.df["phi"], [0, 90, 180, -90])
+    assert np.array_equal(subunits.df["geom2"], [1, 2, 3, 4])
+    assert np.array_equal(subunits.df["geom5"], [7, 7, 7, 7])
+    assert np.array_equal(subunits.df["subtomo_id"], [1, 2, 3, 4])
+
+
+@pytest.mark.parametrize("symmetry", ["C3", "D4", 5])
+def test_split_in_asymmetric_subunits_by_blocks(tmp_path, symmetry):
+    motl = create_clustered_motl(n_particles=50)
+    motl.df = motl.df.sample(frac=1.0, random_state=0)
+    motl.fill({"angles": np.random.default_rng(0).random((50, 3)) * 180})
+
+    with pytest.warns(UserWarning):
+        subunits = motl.split_in_asymmetric_subunits(symmetry, [5, 3, 2])
+        block_subunits = motl.split_in_asymmetric_subunits(symmetry, [5, 3, 2], chunk_rows=7)
+        motl.split_in_asymmetric_subunits(symmetry, [5, 3, 2], output_path=str(tmp_path / "s.h5"), motl_type="h5")
+        motl.split_in_asymmetric_subunits(symmetry, [5, 3, 2], output_path=str(tmp_path / "s.em"), chunk_rows=7)
+
+    assert block_subunits.df.equals(subunits.df)
+    assert Motl.load(str(tmp_path / "s.h5"), motl_type="h5").df.equals(subunits.df)
+    assert np.allclose(Motl.load(str(tmp_path / "s.em")).df.to_numpy(), subunits.df.to_numpy(), atol=1e-3)
+    assert np.array_equal(subunits.df["geom5"], np.repeat(np.arange(1, 51), subunits.df.shape[0] // 50))
+
+    with pytest.raises(UserInputError):
+        motl.split_in_asymmetric_subunits(symmetry, [5, 3, 2], output_path=str(tmp_path / "s.star"), motl_type="relion")
+
+
+def test_em_write_out_blocks(tmp_path):
+    motl = create_clustered_motl(n_particles=20)
+    # extra columns are not written out and the columns are written in the order of the motl columns
+    block_df = motl.df.assign(extra=1.0)[["extra"] + Motl.motl_columns[::-1]]
+    blocks = [block_df.iloc[:7], block_df.iloc[7:]]
+
+    EmMotl.write_out_blocks(str(tmp_path / "blocks.em"), blocks, 20)
+    assert np.allclose(EmMotl(str(tmp_path / "blocks.em")).df.to_numpy(), motl.df.to_numpy(), atol=1e-3)
+
+    with pytest.raises(UserInputError):
+        EmMotl.write_out_blocks(str(tmp_path / "blocks.em"), [motl.df.drop(columns="class")], 20)
+
+
+def get_relative_angles_by_rows(angles, c_coord):
+    # reference with the frames built row by row
+    w1 = geom.euler_angles_to_normals(angles[0, :]).reshape((3,))
+    w2 = c_coord[0, :] / np.linalg.norm(c_coord[0, :])
+    w3 = np.cross(w1, w2)
+    w_base_mat = np.asarray([w1, w2, w3 / np.linalg.norm(w3)]).T
+
+    v1 = geom.euler_angles_to_normals(angles)
+    rot_angles = np.zeros(angles.shape)
+    for i in range(1, angles.shape[0]):
+        v2 = c_coord[i, :] / np.linalg.norm(c_coord[i, :])
+        v3 = np.cross(v1[i, :], v2)
+        v_base_mat = np.asarray([v1[i, :], v2, v3 / np.linalg.norm(v3)])
+        rot_angles[i, :] = rot.from_matrix(np.matmul(w_base_mat, v_base_mat)).as_euler("zxz", degrees=True)
+
+    return rot_angles
+
+
+@pytest.mark.parametrize("n_vertices", [1, 2, 3])
+def test_get_barycentric_motl(n_vertices):
+    motl = create_clustered_motl(n_particles=40)
+    motl.fill({"angles": np.random.default_rng(0).random((40, 3)) * 180})
+    idx = np.arange(10)
+    nn_idx = np.random.default_rng(1).integers(10, 40, (10, n_vertices))
+
+    with pytest.warns(UserWarning):
+        bary_motl = motl.get_barycentric_motl(idx, nn_idx)
+
+    coord = motl.get_coordinates()
+    expected_coord = (coord[idx, :] + coord[nn_idx, :].sum(axis=1)) / (n_vertices + 1)
+    expected_angles = get_relative_angles_by_rows(motl.get_angles()[idx, :], expected_coord - coord[idx, :])
+
+    assert np.allclose(bary_motl.get_coordinates(), expected_coord)
+    assert np.allclose(bary_motl.get_angles(), expected_angles)
+
+
+def test_get_relative_position():
+    motl = create_clustered_motl(n_particles=40)
+    motl.fill({"angles": np.random.default_rng(0).random((40, 3)) * 180})
+    idx = np.arange(20)
+    nn_idx = np.arange(20, 40)
+
+    with pytest.warns(UserWarning):
+        center_motl, _ = motl.get_relative_position(idx, nn_idx)
+
+    coord = motl.get_coordinates()
+    expected_angles = get_relative_angles_by_rows(motl.get_angles()[idx, :], coord[nn_idx, :] - coord[idx, :])
+
+    assert np.allclose(center_motl.get_coordinates(), (coord[idx, :] + coord[nn_idx, :]) / 2.0)
+    assert np.allclose(center_motl.get_angles(), expected_angles)
+
+
+def test_get_rotations_cache():
+    motl = create_clustered_motl(n_particles=60, n_tomos=3)
+    motl.fill({"angles": np.random.default_rng(0).random((60, 3)) * 180})
+
+    rotations = motl.get_rotations()
+    assert motl.get_rotations() is rotations
+    assert np.allclose(rotations.as_matrix(), rot.from_euler("zxz", motl.get_angles(), degrees=True).as_matrix())
+
+    for t in [1, 2, 3]:
+        expected = rot.from_euler("zxz", motl.get_angles(t), degrees=True)
+        assert np.allclose(motl.get_rotations(t).as_matrix(), expected.as_matrix())
+        assert motl.get_rotations(t) is motl.get_rotations(t)
+
+    assert len(motl.get_rotations(10)) == 0
+    assert len(motl.get_rotations(5, feature_id="subtomo_id")) == 1
+
+    # in-place changes of the angles require explicit invalidation
+    motl.df.loc[0, "phi"] = 90.0
+    motl.invalidate_cache(["phi"])
+    expected = rot.from_euler("zxz", motl.get_angles(), degrees=True)
+    assert np.allclose(motl.get_rotations().as_matrix(), expected.as_matrix())
+    assert np.allclose(motl.shift_positions([1, 0, 0], inplace=False).df["shift_x"], expected.apply([1, 0, 0])[:, 0])
+    tomo_id = motl.df.loc[0, "tomo_id"]
+    expected = rot.from_euler("zxz", motl.get_angles(tomo_id), degrees=True)
+    assert np.allclose(motl.get_rotations(tomo_id).as_matrix(), expected.as_matrix())
+
+    motl.df[["phi", "theta", "psi"]] = 0.0
+    assert motl.get_rotations() is not rotations
+    assert np.allclose(motl.get_rotations(1).as_matrix(), np.eye(3))
+
+
+@pytest.mark.parametrize("key", ["subtomo_id", ["tomo_id", "subtomo_id"]])
+def test_compare(key):
+    motl = create_clustered_motl(n_particles=40, n_tomos=2)
+    other_df = motl.df.iloc[10:].copy()
+    other_df.loc[other_df.index[:5], "class"] = 2
+    other_df.loc[other_df.index[5:8], "score"] += 0.5
+    extra_df = motl.df.iloc[:3].copy()
+    extra_df["subtomo_id"] += 100
+    other_motl = Motl(pd.concat([other_df.iloc[::-1], extra_df], ignore_index=True))
+
+    comparison = motl.compare(other_motl, key=key)
+
+    assert comparison.intersection.df.equals(motl.df.iloc[10:].reset_index(drop=True))
+    assert comparison.difference.df.equals(motl.df.iloc[:10].reset_index(drop=True))
+    assert np.array_equal(comparison.other_difference.df["subtomo_id"], [101, 102, 103])
+
+    report = comparison.get_change_report()
+    assert report.loc["class", "n_changed"] == 5
+    assert report.loc["score", "n_changed"] == 3
+    assert np.isclose(report.loc["score", "max_abs_diff"], 0.5)
+    assert report.loc["x", "n_changed"] == 0
+    assert comparison.get_change_report(["score"], atol=1.0).loc["score", "n_changed"] == 0
+    assert np.array_equal(comparison.get_changed_mask("class")["class"], np.arange(10, 40) < 15)
+
+    with pytest.raises(UserInputError):
+        motl.compare(other_motl, key="not_a_column")
+
+
+def test_get_motl_intersection():
+    motl = create_clustered_motl(n_particles=40)
+    other_motl = Motl(motl.df.iloc[[30, 5, 12]].copy())
+
+    expected_df = motl.df.merge(other_motl.df["subtomo_id"], how="inner")
+    assert Motl.get_motl_intersection(motl, other_motl).df.equals(expected_df)
+
+
+@pytest.mark.parametrize(
+    "names, pattern, entry, expected",
+    [
+        (["/tomos/tomo12_1.35.mrc", "/tomos/tomo7_1.35.mrc", "/tomos/tomo12_1.35.mrc"], "first", -1, [12, 7, 12]),
+        (["/sub/12_103_1.35.mrc", "/sub/7_4_1.35.mrc", "/sub/7_5_1.35.mrc"], "second", -1, [103, 4, 5]),
+        (["TS_012/103", "TS_007/4", "TS_007/5"], "first", 0, [12, 7, 7]),
+        (["TS_012/103", "TS_007/4", "TS_007/5"], None, -1, [103, 4, 5]),
+        (["TS_012", "TS_007", "TS_012"], "first", -1, [12, 7, 12]),
+        ([3, 5.0, 3], "first", -1, [3, 5, 3]),
+    ],
+)
+@pytest.mark.parametrize("cache", [True, False])
+def test_relion_parse_numbers(names, pattern, entry, expected, cache):
+    patterns = {"first": RelionMotl.first_number_pattern, "second": RelionMotl.second_number_pattern, None: None}
+    numbers = RelionMotl.parse_numbers(pd.Series(names, dtype=object), patterns[pattern], entry=entry, cache=cache)
+    assert np.array_equal(numbers, expected)
+
+
+def test_relion_parse_numbers_wrong():
+    with pytest.raises(UserInputError):
+        RelionMotl.parse_numbers(pd.Series(["TS_012/103", "TS_a/b"]), RelionMotl.first_number_pattern, entry=0)
+
+
+@pytest.mark.parametrize("motl_type, file_name", [("emmotl", "m.em"), ("h5", "m.h5"), ("stopgap", "m.star")])
+def test_iter_load(tmp_path, motl_type, file_name):
+    motl = create_clustered_motl(n_particles=50)
+    motl.write_out(str(tmp_path / file_name), motl_type=motl_type)
+    loaded_motl = Motl.load(str(tmp_path / file_name), motl_type=motl_type)
+
+    chunks = list(Motl.iter_load(str(tmp_path / file_name), motl_type=motl_type, chunk_rows=20))
+    assert [c.df.shape[0] for c in chunks] == [20, 20, 10]
+    assert all(type(c) is type(loaded_motl) for c in chunks)
+    chunks_df = pd.concat([c.df for c in chunks])
+    assert np.allclose(chunks_df.to_numpy(float), loaded_motl.df.to_numpy(float), equal_nan=True)
+
+    with pytest.raises(UserInputError):
+        Motl.iter_load(str(tmp_path / file_name), motl_type="dynamo")
+
+
+def test_iter_load_relion(tmp_path):
+    relion_motl = RelionMotl(create_clustered_motl(n_particles=50).df, version=3.1, pixel_size=2.0, binning=1.0)
+    relion_motl.write_out(str(tmp_path / "m.star"), tomo_format="TS_$xx", subtomo_format="sub_$xx_$yyy.mrc")
+    loaded_motl = Motl.load(str(tmp_path / "m.star"), motl_type="relion")
+
+    chunks = list(Motl.iter_load(str(tmp_path / "m.star"), motl_type="relion", chunk_rows=15))
+    assert [c.df.shape[0] for c in chunks] == [15, 15, 15, 5]
+    assert all(c.version == 3.1 and c.optics_data.equals(loaded_motl.optics_data) for c in chunks)
+    # the half-set numbering continues across the chunks
+    chunks_df = pd.concat([c.df for c in chunks], ignore_index=True)
+    assert np.array_equal(chunks_df["subtomo_id"], loaded_motl.df["subtomo_id"])
+    assert np.allclose(chunks_df.to_numpy(float), loaded_motl.df.to_numpy(float), equal_nan=True)
+
+
+@pytest.mark.parametrize("chunk_rows", [7, 30, 40, 100])
+@pytest.mark.parametrize("halfsets", [False, True])
+@pytest.mark.parametrize("numbering", ["per_tomogram", "decreasing"])
+def test_iter_load_relion_renumbering(tmp_path, chunk_rows, halfsets, numbering):
+    if numbering == "per_tomogram":
+        # particles numbered per tomogram (TS_01/1..30, TS_02/1..30), i.e. the numbers are not unique
+        particle_names = [f"TS_0{i // 30 + 1}/{i % 30 + 1}" for i in range(60)]
+    else:
+        # unique numbers that are not increasing
+        particle_names = [f"TS_0{i // 30 + 1}/{60 - i}" for i in range(60)]
+
+    relion_df = pd.DataFrame(
+        {
+            "rlnCoordinateX": np.arange(60.0),
+            "rlnCoordinateY": np.arange(60.0),
+            "rlnCoordinateZ": np.arange(60.0),
+            "rlnAngleRot": np.zeros(60),
+            "rlnAngleTilt": np.zeros(60),
+            "rlnAnglePsi": np.zeros(60),
+            "rlnTomoName": ["TS_01"] * 30 + ["TS_02"] * 30,
+            "rlnTomoParticleName": particle_names,
+        }
+    )
+    if halfsets:
+        # the first chunks can contain one half-set only
+        relion_df["rlnRandomSubset"] = [1] * 40 + [1, 2] * 10
+    starfileio.Starfile.write([relion_df], str(tmp_path / "m.star"), specifiers=["data_particles"])
+
+    loaded_motl = Motl.load(str(tmp_path / "m.star"), motl_type="relion")
+    assert loaded_motl.df["subtomo_id"].is_unique
+
+    for global_renumbering in [False, True]:
+        chunks = Motl.iter_load(
+            str(tmp_path / "m.star"), motl_type="relion", chunk_rows=chunk_rows, global_renumbering=global_renumbering
+        )
+        chunks_df = pd.concat([c.df for c in chunks], ignore_index=True)
+        assert np.array_equal(chunks_df["geom3"], loaded_motl.df["geom3"])
+
+        if global_renumbering or halfsets or numbering == "per_tomogram":
+            assert np.array_equal(chunks_df["subtomo_id"], loaded_motl.df["subtomo_id"])
+        else:
+            # without reading the whole file first, the numbers are renumbered once they stop increasing
+            assert np.all(np.diff(chunks_df["subtomo_id"]) > 0)
+
+
+@pytest.mark.parametrize("previous_id, expected", [(0, [1, 3, 4, 6, 8, 9]), (4, [5, 7, 8, 10, 12, 13])])
+def test_get_halfset_subtomo_ids(previous_id, expected):
+    halfset_num = np.array([1, 1, 0, 0, 0, 1])
+    assert np.array_equal(RelionMotl.get_halfset_subtomo_ids(halfset_num, previous_id), expected)
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_convert_motls(tmp_path, n_workers):
+    motl = create_clustered_motl(n_particles=60)
+    for i, tomo_motl in enumerate(motl.split_by_feature("tomo_id")):
+        tomo_motl.write_out(str(tmp_path / f"tomo_{i}.em"))
+    (tmp_path / "tomo_9.em").write_text("not a motl")
+
+    output_pattern = str(tmp_path / "sg" / "{stem}.star")
+    results = cryomotl.convert_motls(str(tmp_path / "tomo_*.em"), "stopgap", output_pattern, n_workers=n_workers)
+    assert results["status"].tolist() == ["converted"] * 3 + ["failed"]
+    assert results["n_particles"].sum() == 60
+    assert Motl.load(results["output_path"][0], motl_type="stopgap").df.shape[0] == results["n_particles"][0]
+
+    # up-to-date outputs are skipped
+    results = cryomotl.convert_motls(str(tmp_path / "tomo_*.em"), "stopgap", output_pattern, n_workers=n_workers)
+    assert results["status"].tolist() == ["skipped"] * 3 + ["failed"]
+    results = cryomotl.convert_motls(str(tmp_path / "tomo_0.em"), "stopgap", output_pattern, overwrite=True)
+    assert results["status"].tolist() == ["converted"]
+
+    with pytest.raises(UserInputError):
+        cryomotl.convert_motls(str(tmp_path / "tomo_*.em"), "stopgap", str(tmp_path / "motl.star"))
+    with pytest.raises(UserInputError):
+        cryomotl.convert_motls(str(tmp_path / "tomo_*.em"), "dynamo", output_pattern)
+    # parameters of other converters are rejected before any file is converted
+    with pytest.raises(UserInputError):
+        cryomotl.convert_motls(str(tmp_path / "tomo_*.em"), "stopgap", output_pattern, pixel_size=2.0)
+    with pytest.raises(UserInputError):
+        cryomotl.convert_motls(str(tmp_path / "tomo_*.em"), "relion", output_pattern, update_coordinates=True)
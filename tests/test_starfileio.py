@@ -23,3 +23,270 @@ def test_relion_optics(relion_optics):
         and relion_optics.frames[0].shape == (1, 7)
         and relion_optics.frames[1].shape == (3, 22)
     )
+
+
+STAR_WITH_COMMENTS = """# leading comment
+
+data_optics   # specifier comment
+
+loop_
+_rlnOpticsGroup #1
+_rlnOpticsGroupName #2
+_rlnVoltage #3
+   1   opticsGroup1   300.0
+2 opticsGroup2 200
+# between blocks
+
+data_particles
+
+loop_
+_rlnCoordinateX #1
+_rlnTomoName #2
+_rlnAngleRot #3
+1.5\tTS_01\t-3
+2.5\tTS_02\t4e-2
+
+# trailing comment
+"""
+
+
+@pytest.mark.parametrize(
+    "star_file",
+    [
+        "./tests/test_data/relion_3.1_optics.star",
+        "./tests/test_data/TS_017/017_gctf.star",
+        "with_comments",
+    ],
+)
+def test_read_engines(tmp_path, star_file):
+    if star_file == "with_comments":
+        star_file = str(tmp_path / "with_comments.star")
+        with open(star_file, "w") as f:
+            f.write(STAR_WITH_COMMENTS)
+
+    frames, specifiers, comments = sf.Starfile.read(star_file, engine="tokenizer")
+    fast_frames, fast_specifiers, fast_comments = sf.Starfile.read(star_file, engine="fast")
+
+    assert fast_specifiers == specifiers
+    assert fast_comments == comments
+    assert len(fast_frames) == len(frames)
+    for fast_frame, frame in zip(fast_frames, frames):
+        pd.testing.assert_frame_equal(fast_frame, frame)
+
+
+@pytest.mark.parametrize("rows", ["1 2\n3\n", "1 2\n3 4 5\n", "1 2 3\n4 5 6\n", "1 2 3\n4 5\n"])
+def test_read_wrong_rows(tmp_path, rows):
+    star_file = str(tmp_path / "wrong.star")
+    with open(star_file, "w") as f:
+        f.write("data_test\n\nloop_\n_a #1\n_b #2\n" + rows)
+
+    with pytest.raises(IOError):
+        sf.Starfile.read(star_file)
+    with pytest.raises(ValueError):
+        sf.Starfile.read(star_file, engine="unknown")
+
+
+@pytest.mark.parametrize(
+    "specifier, columns",
+    [("data_optics", None), ("data_particles", ["rlnAngleRot", "rlnTomoName"]), (0, ["rlnVoltage"]), (-1, None)],
+)
+def test_read_block(tmp_path, specifier, columns):
+    star_file = str(tmp_path / "with_comments.star")
+    with open(star_file, "w") as f:
+        f.write(STAR_WITH_COMMENTS)
+
+    frames, specifiers, comments = sf.Starfile.read(star_file)
+    spec_id = specifiers.index(specifier) if isinstance(specifier, str) else specifier
+    frame, block_comments = sf.Starfile.read_block(star_file, specifier, columns=columns)
+
+    expected_frame = frames[spec_id] if columns is None else frames[spec_id][columns]
+    pd.testing.assert_frame_equal(frame, expected_frame)
+    assert block_comments == comments[spec_id]
+
+    data_frame, data_specifier, data_comments = sf.Starfile.read(star_file, data_id=spec_id)
+    pd.testing.assert_frame_equal(data_frame, frames[spec_id])
+    assert data_specifier == specifiers[spec_id] and data_comments == comments[spec_id]
+
+
+@pytest.mark.parametrize("specifier, columns", [("data_missing", None), ("data_optics", ["rlnMissing"])])
+def test_read_block_wrong(specifier, columns):
+    with pytest.raises(ValueError):
+        sf.Starfile.read_block("./tests/test_data/relion_3.1_optics.star", specifier, columns=columns)
+
+
+@pytest.mark.parametrize("rows", ["1 2 3\n4 5\n", "1 2 3\n4 5 6 7\n", "1 2 3 4\n5 6 7 8\n", "1 2 3 # 4\n5 6 # 7\n"])
+@pytest.mark.parametrize("columns", [["x"], ["z", "y"]])
+def test_read_block_wrong_rows(tmp_path, rows, columns):
+    star_file = str(tmp_path / "wrong.star")
+    with open(star_file, "w") as f:
+        f.write("data_test\n\nloop_\n_x #1\n_y #2\n_z #3\n" + rows)
+
+    with pytest.raises(IOError):
+        sf.Starfile.read_block(star_file, "data_test", columns=columns)
+    with pytest.raises(IOError):
+        list(sf.Starfile.iter_read(star_file, "data_test", chunk_rows=1, columns=columns))
+
+
+def test_get_index_cache(tmp_path):
+    star_file = str(tmp_path / "with_comments.star")
+    with open(star_file, "w") as f:
+        f.write(STAR_WITH_COMMENTS)
+
+    index = sf.Starfile.get_index(star_file, cache=True)
+    assert [block["specifier"] for block in index] == ["data_optics", "data_particles"]
+    assert (tmp_path / "with_comments.star.idx").exists()
+    assert sf.Starfile.get_index(star_file, cache=True) == index
+
+    # the cached index is not used once the file changes
+    with open(star_file, "a") as f:
+        f.write("\ndata_extra\n\nloop_\n_rlnA #1\n1\n2\n")
+    new_index = sf.Starfile.get_index(star_file, cache=True)
+    assert [block["specifier"] for block in new_index] == ["data_optics", "data_particles", "data_extra"]
+    assert sf.Starfile.read_block(star_file, "data_extra", cache_index=True)[0]["rlnA"].tolist() == [1, 2]
+
+
+@pytest.mark.parametrize(
+    "specifier, number_columns, expected_header",
+    [
+        ("data_particles", True, "loop_\n_rlnTomoName #1\n_rlnAngleRot #2\n_rlnClassNumber #3\n"),
+        ("data_particles", False, "loop_\n_rlnTomoName\n_rlnAngleRot\n_rlnClassNumber\n"),
+        ("data_stopgap_motivelist", True, "loop_\n_rlnTomoName\n_rlnAngleRot\n_rlnClassNumber\n\n"),
+    ],
+)
+def test_write(tmp_path, specifier, number_columns, expected_header):
+    frame = pd.DataFrame(
+        {"rlnTomoName": ["TS_01", "TS_0000000002"], "rlnAngleRot": [-3.1234567, np.nan], "rlnClassNumber": [1, 20]}
+    )
+    star_file = str(tmp_path / "written.star")
+    sf.Starfile.write(
+        [frame], star_file, specifiers=[specifier], comments=[["version 30001"]], number_columns=number_columns
+    )
+
+    with open(star_file, "r") as f:
+        text = f.read()
+
+    expected_rows = "TS_01     \t-3.123457 \t1         \nTS_0000000002\tnan       \t20        \n"
+    assert text == f"\n# version 30001\n\n{specifier}\n\n" + expected_header + expected_rows + "\n"
+    assert frame["rlnAngleRot"].iloc[0] == -3.1234567
+
+
+def test_write_float32(tmp_path):
+    # float32 values are written the same as by the original writer, i.e. by their float64 representation
+    frame = pd.DataFrame({"rlnAngleRot": np.array([0.451047, 1.5, -2.25e-7], dtype=np.float32)})
+    star_file = str(tmp_path / "written.star")
+    sf.Starfile.write([frame], star_file)
+
+    with open(star_file, "r") as f:
+        text = f.read()
+
+    assert text.endswith("0.45104700326919556\n1.5       \n-0.0      \n\n")
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 7, 100000])
+def test_write_chunks(tmp_path, chunk_rows):
+    frames, specifiers, comments = sf.Starfile.read("./tests/test_data/relion_3.1_optics.star")
+    sf.Starfile.write(frames, str(tmp_path / "whole.star"), specifiers=specifiers, comments=comments)
+    sf.Starfile.write(
+        frames, str(tmp_path / "chunks.star"), specifiers=specifiers, comments=comments, chunk_rows=chunk_rows
+    )
+
+    with open(str(tmp_path / "whole.star"), "r") as whole, open(str(tmp_path / "chunks.star"), "r") as chunks:
+        assert whole.read() == chunks.read()
+
+    written_frames, written_specifiers, written_comments = sf.Starfile.read(str(tmp_path / "chunks.star"))
+    assert written_specifiers == specifiers and written_comments == comments
+    for written_frame, frame in zip(written_frames, frames):
+        pd.testing.assert_frame_equal(written_frame, frame.round(6))
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 1000])
+@pytest.mark.parametrize(
+    "specifier, columns", [("data_optics", None), ("data_particles", None), (1, ["rlnTomoName", "rlnCoordinateX"])]
+)
+def test_iter_read(tmp_path, chunk_rows, specifier, columns):
+    star_file = str(tmp_path / "with_comments.star")
+    with open(star_file, "w") as f:
+        # the last row does not end with a newline
+        f.write(STAR_WITH_COMMENTS.replace("\n\n# trailing comment\n", ""))
+
+    frame, _ = sf.Starfile.read_block(star_file, specifier, columns=columns)
+    chunks = list(sf.Starfile.iter_read(star_file, specifier, chunk_rows=chunk_rows, columns=columns))
+
+    assert len(chunks) == -(-frame.shape[0] // chunk_rows)
+    assert all(chunk.shape[0] <= chunk_rows for chunk in chunks)
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), frame)
+
+
+def test_iter_read_empty_block(tmp_path):
+    star_file = str(tmp_path / "empty.star")
+    with open(star_file, "w") as f:
+        f.write("data_empty\n\nloop_\n_rlnA #1\n_rlnB #2\n\ndata_rows\n\nloop_\n_rlnC #1\n1\n")
+
+    chunks = list(sf.Starfile.iter_read(star_file, "data_empty"))
+    assert len(chunks) == 1 and chunks[0].empty and chunks[0].columns.tolist() == ["rlnA", "rlnB"]
+    assert [chunk["rlnC"].tolist() for chunk in sf.Starfile.iter_read(star_file, "data_rows")] == [[1]]
+
+    with pytest.raises(ValueError):
+        sf.Starfile.iter_read(star_file, "data_missing")
+
+
+@pytest.mark.parametrize("engine", ["fast", "tokenizer"])
+@pytest.mark.parametrize("schema", ["relion4", {"rlnVoltage": "float32", "rlnTomoName": "category"}])
+def test_read_schema(tmp_path, engine, schema):
+    star_file = str(tmp_path / "with_comments.star")
+    with open(star_file, "w") as f:
+        f.write(STAR_WITH_COMMENTS)
+
+    frames, _, _ = sf.Starfile.read(star_file, engine=engine)
+    typed_frames, _, _ = sf.Starfile.read(star_file, engine=engine, schema=schema)
+
+    dtypes = sf.Starfile.get_schema(schema)
+    assert typed_frames[0]["rlnVoltage"].dtype == np.float32
+    assert isinstance(typed_frames[1]["rlnTomoName"].dtype, pd.CategoricalDtype)
+    for frame, typed_frame in zip(frames, typed_frames):
+        expected_frame = frame.astype({c: dtypes[c] for c in frame.columns if c in dtypes})
+        pd.testing.assert_frame_equal(typed_frame, expected_frame)
+
+
+def test_read_schema_relion(tmp_path):
+    frames, _, _ = sf.Starfile.read("./tests/test_data/relion_3.1_optics.star", schema="relion3.1")
+    assert frames[0]["rlnOpticsGroup"].dtype == np.int32 and frames[0]["rlnImageSize"].dtype == np.int32
+    assert frames[1]["rlnCoordinateX"].dtype == np.float32 and frames[1]["rlnClassNumber"].dtype == np.int32
+    assert isinstance(frames[1]["rlnMicrographName"].dtype, pd.CategoricalDtype)
+
+    # integers written as floats are converted after the parsing
+    star_file = str(tmp_path / "float_ids.star")
+    with open(star_file, "w") as f:
+        f.write("data_\n\nloop_\n_rlnClassNumber #1\n_rlnAngleRot #2\n1.000000 2\n3.000000 4\n")
+    frame, _ = sf.Starfile.read_block(star_file, 0, schema="relion3.1")
+    assert frame["rlnClassNumber"].tolist() == [1, 3] and frame["rlnClassNumber"].dtype == np.int32
+
+    # the dtypes are kept for a block without rows as well
+    empty_frame = sf.Starfile.rows_to_frame([], ["rlnClassNumber", "rlnFoo"], schema="relion3.1")
+    assert empty_frame["rlnClassNumber"].dtype == np.int32 and empty_frame.empty
+
+
+@pytest.mark.parametrize("value", ["none", "1.5", "3.7", "3000000000", "3000000000.0", "-2147483649", "inf"])
+@pytest.mark.parametrize("engine", ["fast", "tokenizer"])
+def test_read_schema_wrong(tmp_path, value, engine):
+    with pytest.raises(ValueError):
+        sf.Starfile.get_schema("relion2")
+
+    # the values have to be converted to int32 without any change
+    star_file = str(tmp_path / "wrong_ids.star")
+    with open(star_file, "w") as f:
+        f.write(f"data_\n\nloop_\n_rlnClassNumber #1\n_rlnAngleRot #2\n1 2\n{value} 4\n")
+    with pytest.raises(IOError):
+        sf.Starfile.read(star_file, engine=engine, schema="relion3.1")
+    with pytest.raises(IOError):
+        sf.Starfile.read_block(star_file, 0, columns=["rlnClassNumber"], schema="relion3.1")
+
+
+@pytest.mark.parametrize("value, expected", [("2147483647", 2147483647), ("-2147483648.0", -2147483648), ("7.0", 7)])
+def test_read_schema_integers(tmp_path, value, expected):
+    star_file = str(tmp_path / "ids.star")
+    with open(star_file, "w") as f:
+        f.write(f"data_\n\nloop_\n_rlnClassNumber #1\n_rlnAngleRot #2\n1 2\n{value} 4\n")
+
+    frame, _ = sf.Starfile.read_block(star_file, 0, schema="relion3.1")
+    assert frame["rlnClassNumber"].dtype == np.int32 and frame["rlnClassNumber"].tolist() == [1, expected]
@@ -0,0 +1,27 @@
+import numpy as np
+
+from cryocat import structure
+from cryocat.cryomotl import Motl
+
+
+def test_merge_subunits():
+    # one NPC split into two objects with alternating subunits and one separate NPC
+    angles = np.radians(np.arange(8) * 45.0)
+    ring = np.c_[100 + 50 * np.cos(angles), 100 + 50 * np.sin(angles), np.full(8, 50.0)]
+    motl = Motl()
+    motl.fill(
+        {
+            "coord": np.vstack([ring, ring + [500, 0, 0]]),
+            "angles": np.zeros((16, 3)),
+            "tomo_id": np.ones(16),
+            "object_id": [1, 2] * 4 + [3] * 8,
+            "subtomo_id": np.arange(1, 17),
+        }
+    )
+    motl.df = motl.df.fillna(0.0)
+
+    merged_motl = structure.NPC.merge_subunits(motl, npc_radius=55)
+
+    assert np.array_equal(merged_motl.df["object_id"], [1] * 8 + [2] * 8)
+    assert np.array_equal(merged_motl.df["geom1"], np.full(16, 8))
+    assert np.all(merged_motl.df["geom2"].values[:8] > 0) and np.all(merged_motl.df["geom2"].values[8:] == 0)